@@ -1,8 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from auth.routes import router as auth_router
 from prescription.routes import router as prescription_router
+from prescription.catalog import load_catalog
+from prescription.circuit import OPEN, breaker_states
+from prescription.ocr import check_ocr_backend, close_http_client
+from prescription.jobs import start_job_workers, stop_job_workers
+from prescription.metrics import render_metrics
+from prescription.uploads import upload_size_guard
 from scheduler.reminder_scheduler import start_scheduler, stop_scheduler, get_scheduler_status
 from notification.fcm import initialize_firebase
 import os
@@ -23,11 +30,16 @@ async def lifespan(app: FastAPI):
     else:
         print("[APP] Firebase not configured - push notifications disabled")
     
+    check_ocr_backend()
+    load_catalog()
     start_scheduler()
+    start_job_workers()
     yield
     # Shutdown
     print("[APP] Shutting down...")
     stop_scheduler()
+    await stop_job_workers()
+    await close_http_client()
 
 
 app = FastAPI(
@@ -36,6 +48,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized uploads from Content-Length before the body is parsed
+# (registered before CORS so the 413 response still carries CORS headers)
+app.middleware("http")(upload_size_guard)
+
 # CORS Configuration - Allow all origins for mobile app support
 # Note: When allow_credentials=False, we use Authorization header instead of cookies
 app.add_middleware(
@@ -59,7 +75,8 @@ async def root():
         "endpoints": {
             "auth": "/auth",
             "prescriptions": "/api",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         }
     }
 
@@ -73,14 +90,25 @@ async def health():
         db_status = f"error: {str(e)}"
     
     scheduler_status = get_scheduler_status()
+
+    # Circuit breaker state per external dependency (OCR.space, Groq, Tavily)
+    dependencies = breaker_states()
+    degraded = any(dependency["state"] == OPEN for dependency in dependencies.values())
     
     return {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "database": db_status,
-        "scheduler": scheduler_status
+        "scheduler": scheduler_status,
+        "dependencies": dependencies
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Upload pipeline stage latency histograms (Prometheus text format)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/trigger-reminders")
 async def trigger_reminders():
     """Manually trigger reminder check - useful for testing"""
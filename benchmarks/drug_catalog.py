@@ -0,0 +1,109 @@
+"""
+Drug Catalog Benchmark
+
+Measures how long the bundled drug catalog takes to load and index, how long
+a lookup takes, and how many OCR-style variants of catalog names ("PANTOP-40",
+"Pant0p", "Tab. Pantop 40") resolve to the right drug. Names from the fixture
+prescriptions are looked up too, showing how many enrichment web searches the
+catalog avoids on them.
+
+Usage:
+  python benchmarks/drug_catalog.py
+  python benchmarks/drug_catalog.py --catalog other.json --repeats 50000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.catalog import CATALOG_PATH, load_catalog
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "prescription_texts.json")
+
+_OCR_SWAPS = {"o": "0", "l": "1", "i": "1", "s": "5"}
+
+
+def variants(name: str, strengths: list, rng: random.Random) -> list:
+    """OCR/handwriting-style spellings of one catalog name"""
+    strength = f"{rng.choice(strengths):g}" if strengths else ""
+    swappable = [i for i, c in enumerate(name) if c.lower() in _OCR_SWAPS and 0 < i < len(name) - 1]
+    swapped = name
+    if swappable:
+        i = rng.choice(swappable)
+        swapped = name[:i] + _OCR_SWAPS[name[i].lower()] + name[i + 1:]
+    return [
+        f"{name} {strength}".strip(),
+        f"{name.upper()}-{strength}".rstrip("-"),
+        f"Tab. {name} {strength}".strip(),
+        swapped,
+    ]
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(catalog_path: str, fixtures_path: str, repeats: int, seed: int):
+    started = time.perf_counter()
+    catalog = load_catalog(catalog_path)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(seed)
+    cases = []
+    for drug in catalog.drugs:
+        for alias in [drug["name"], *drug.get("aliases", [])]:
+            for variant in variants(alias, drug.get("strengths", []), rng):
+                cases.append((variant, drug["name"]))
+
+    correct = wrong = missed = 0
+    for variant, expected in cases:
+        match = catalog.lookup(variant)
+        if match is None:
+            missed += 1
+        elif match["drug"]["name"] == expected:
+            correct += 1
+        else:
+            wrong += 1
+            print(f"  wrong: {variant!r} -> {match['drug']['name']} (expected {expected})")
+
+    names = [variant for variant, _ in cases]
+    latencies = []
+    for _ in range(repeats):
+        name = rng.choice(names)
+        started = time.perf_counter()
+        catalog.lookup(name)
+        latencies.append((time.perf_counter() - started) * 1e6)
+
+    print(f"catalog:            {len(catalog)} drugs, {catalog.name_count} names, {os.path.getsize(catalog_path) / 1024:.1f} KiB")
+    print(f"load + index:       {load_ms:.2f} ms")
+    print(f"lookup:             p50 {percentile(latencies, 0.5):.1f} us, p99 {percentile(latencies, 0.99):.1f} us")
+    total = len(cases)
+    print(f"variants resolved:  {correct}/{total} ({correct / total:.0%}), {wrong} wrong, {missed} unmatched")
+
+    if fixtures_path and os.path.exists(fixtures_path):
+        with open(fixtures_path) as f:
+            fixtures = json.load(f)
+        expected = [name for fixture in fixtures for name in fixture.get("expected", [])]
+        matched = [name for name in expected if catalog.lookup(name) is not None]
+        if expected:
+            print(f"fixture medicines:  {len(matched)}/{len(expected)} in the catalog ({len(matched) / len(expected):.0%} web searches avoided)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drug catalog load time, lookup latency and OCR-variant matching")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="Catalog JSON file")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="JSON file of prescription texts")
+    parser.add_argument("--repeats", type=int, default=20000, help="Timed lookups")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    run(args.catalog, args.fixtures, args.repeats, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Image Quality Analysis Microbenchmark
+
+Compares the original full-resolution quality check (RGB decode + full NumPy
+array) against validate_image_quality's decimated grayscale analysis, on the
+same images. Each variant runs in a fresh subprocess so peak RSS is isolated
+(read from /proc/self/status, so Linux only).
+
+Usage:
+  python benchmarks/image_quality.py --synthetic 3
+  python benchmarks/image_quality.py --fixtures path/to/photos
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_quality_check(image: io.BytesIO) -> float:
+    """The pre-decimation approach: full decode to RGB, full-size array, mean"""
+    import numpy as np
+    from PIL import Image
+    img = Image.open(image)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return float(np.mean(np.array(img)))
+
+
+def decimated_quality_check(image: io.BytesIO) -> float:
+    from prescription.imaging import validate_image_quality
+    _, _, metrics = validate_image_quality(image)
+    return metrics.get("brightness", 0.0)
+
+
+VARIANTS = {
+    "legacy": legacy_quality_check,
+    "decimated": decimated_quality_check,
+}
+
+
+def _peak_rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _reset_peak_rss():
+    # Linux >= 4.0: writing 5 to clear_refs resets the VmHWM high-water mark
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def _measure(variant: str, data: bytes, repeats: int, queue):
+    fn = VARIANTS[variant]
+    # Warm imports so they don't count toward the measured peak
+    import numpy  # noqa: F401
+    from PIL import Image  # noqa: F401
+    import prescription.imaging  # noqa: F401
+
+    _reset_peak_rss()
+    baseline_kb = _peak_rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn(io.BytesIO(data))
+    elapsed_ms = (time.perf_counter() - started) * 1000 / repeats
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_kb = _peak_rss_kb()
+    queue.put({
+        "ms": elapsed_ms,
+        "rss_mb": (peak_kb - baseline_kb) / 1024,
+        "traced_mb": traced_peak / (1024 * 1024),
+    })
+
+
+def measure(variant: str, data: bytes, repeats: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(variant, data, repeats, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def load_fixtures(args) -> list:
+    fixtures = []
+    if args.fixtures:
+        for name in sorted(os.listdir(args.fixtures)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+                with open(os.path.join(args.fixtures, name), "rb") as f:
+                    fixtures.append((name, f.read()))
+    if args.synthetic:
+        from ocr_normalization import synthetic_photo
+        for i in range(args.synthetic):
+            fixtures.append((f"synthetic_{i}.jpg", synthetic_photo(i)))
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory and latency of image quality analysis")
+    parser.add_argument("--fixtures", help="Directory of prescription photos")
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of generated 12MP test photos")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args)
+    if not fixtures:
+        print("No fixtures: pass --fixtures DIR and/or --synthetic N")
+        return
+
+    print(f"{'fixture':<24}{'variant':<11}{'time ms':>10}{'peak RSS MB':>13}{'numpy/py MB':>13}")
+    totals = {name: {"rss_mb": 0.0, "traced_mb": 0.0, "ms": 0.0} for name in VARIANTS}
+    for name, data in fixtures:
+        for variant in VARIANTS:
+            result = measure(variant, data, args.repeats)
+            for key in totals[variant]:
+                totals[variant][key] += result[key]
+            print(f"{name[:23]:<24}{variant:<11}{result['ms']:>10.1f}{result['rss_mb']:>13.1f}{result['traced_mb']:>13.1f}")
+
+    n = len(fixtures)
+    legacy, decimated = totals["legacy"], totals["decimated"]
+    print(f"\nMean peak RSS: {legacy['rss_mb'] / n:.1f}MB -> {decimated['rss_mb'] / n:.1f}MB")
+    print(f"Mean array/py allocations: {legacy['traced_mb'] / n:.1f}MB -> {decimated['traced_mb'] / n:.2f}MB")
+    print(f"Mean time: {legacy['ms'] / n:.0f}ms -> {decimated['ms'] / n:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
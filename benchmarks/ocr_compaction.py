@@ -0,0 +1,113 @@
+"""
+OCR Text Compaction Benchmark
+
+Compares the old head/tail character truncation with relevance-based
+compaction on long OCR output. Each fixture prescription is padded with
+letterhead, contact details, repeated boilerplate and lab-report noise (so
+its medicine lines end up in the middle of a long text), and for both
+strategies the benchmark reports prompt tokens and how many fixture medicine
+lines survive into the prompt.
+
+Usage:
+  python benchmarks/ocr_compaction.py
+  python benchmarks/ocr_compaction.py --fixtures texts.json --noise-lines 400 --max-tokens 1500
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.rules import OCR_PROMPT_MAX_TOKENS, compact_ocr_text, estimate_tokens, _classify_line
+from rule_parser import DEFAULT_FIXTURES
+
+HEADER = [
+    "CITY CARE MULTISPECIALITY HOSPITAL & DIAGNOSTIC CENTRE",
+    "No. 12, 3rd Cross, MG Road, Near Bus Stand, Indiranagar, Bengaluru 560038",
+    "Ph: +91 80 2345 6789 / 98450 12345   Email: info@citycare.in   www.citycare.in",
+    "Timings: Mon-Sat 9am-8pm, Sunday closed. Consultation hours 10am-1pm",
+    "Dr. A. Sharma MBBS MD (General Medicine)  Reg No 45821",
+]
+FOOTER = [
+    "This is a computer generated prescription. Not valid for medico-legal purposes.",
+    "Signature & Stamp",
+    "For appointment call 080-23456789 or visit us at www.citycare.in",
+]
+FILLER = [
+    "Hemoglobin 13.2 g/dl (13.0 - 17.0)",
+    "Total leukocyte count 7800 /cumm",
+    "Serum creatinine 0.9 mg/dl",
+    "History of present illness: fever since 3 days, body ache, sore throat.",
+    "No known drug allergies. Non smoker.",
+    "BP 130/84 mmHg  Pulse 88/min  SpO2 98%",
+]
+
+
+def legacy_truncate(raw_text: str, max_chars: int = 8000) -> str:
+    """The previous _truncate_ocr_text: first 60% and last 40% of max_chars"""
+    if len(raw_text) <= max_chars:
+        return raw_text
+    head_size = int(max_chars * 0.6)
+    tail_size = max_chars - head_size
+    return raw_text[:head_size] + "\n\n... [TEXT TRUNCATED] ...\n\n" + raw_text[-tail_size:]
+
+
+def long_ocr_text(text: str, noise_lines: int, seed: int) -> str:
+    rng = random.Random(seed)
+    # Numbered so exact-duplicate removal alone can't discard them
+    before = [f"{rng.choice(FILLER)} #{i}" for i in range(noise_lines // 2)]
+    after = [f"{rng.choice(FILLER + FOOTER)} #{i}" for i in range(noise_lines - len(before))]
+    return "\n".join(HEADER + before + text.splitlines() + after + FOOTER + HEADER[:2])
+
+
+def retained(prompt_text: str, original: str) -> tuple:
+    medicine_lines = [l.strip() for l in original.splitlines() if _classify_line(l.strip()) != "other"]
+    kept = sum(1 for l in medicine_lines if l in prompt_text)
+    return kept, len(medicine_lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt size and medicine-line retention of OCR text compaction")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="JSON file of prescription texts")
+    parser.add_argument("--noise-lines", type=int, default=300, help="Noise lines wrapped around each fixture")
+    parser.add_argument("--max-tokens", type=int, default=OCR_PROMPT_MAX_TOKENS)
+    args = parser.parse_args()
+    with open(args.fixtures) as f:
+        fixtures = json.load(f)
+
+    print(f"{'fixture':<24} {'raw tok':>8} {'legacy tok':>10} {'legacy kept':>11} {'compact tok':>11} {'compact kept':>12} {'ms':>6}")
+    totals = {"legacy_tokens": [], "compact_tokens": [], "legacy_kept": 0, "compact_kept": 0, "lines": 0}
+    for seed, fixture in enumerate(fixtures):
+        raw = long_ocr_text(fixture["text"], args.noise_lines, seed)
+        legacy = legacy_truncate(raw)
+        started = time.perf_counter()
+        compact = compact_ocr_text(raw, args.max_tokens)
+        compact_ms = (time.perf_counter() - started) * 1000
+
+        legacy_kept, lines = retained(legacy, fixture["text"])
+        compact_kept, _ = retained(compact, fixture["text"])
+        totals["legacy_tokens"].append(estimate_tokens(legacy))
+        totals["compact_tokens"].append(estimate_tokens(compact))
+        totals["legacy_kept"] += legacy_kept
+        totals["compact_kept"] += compact_kept
+        totals["lines"] += lines
+        print(
+            f"{fixture['name']:<24} {estimate_tokens(raw):>8} {estimate_tokens(legacy):>10} {f'{legacy_kept}/{lines}':>11} "
+            f"{estimate_tokens(compact):>11} {f'{compact_kept}/{lines}':>12} {compact_ms:>6.2f}"
+        )
+
+    lines = max(totals["lines"], 1)
+    print()
+    print(f"mean prompt tokens:     legacy {statistics.mean(totals['legacy_tokens']):.0f}, "
+          f"compacted {statistics.mean(totals['compact_tokens']):.0f}")
+    print(f"medicine lines kept:    legacy {totals['legacy_kept']}/{lines} ({totals['legacy_kept'] / lines:.0%}), "
+          f"compacted {totals['compact_kept']}/{lines} ({totals['compact_kept'] / lines:.0%})")
+
+
+if __name__ == "__main__":
+    main()
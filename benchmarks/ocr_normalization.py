@@ -0,0 +1,137 @@
+"""
+OCR Payload Normalization Benchmark
+
+Reports bytes sent to OCR and (optionally) OCR latency for each fixture
+image, before and after normalize_image_for_ocr (EXIF-rotate, grayscale,
+downscale, recompress).
+
+Usage:
+  python benchmarks/ocr_normalization.py --fixtures path/to/photos
+  python benchmarks/ocr_normalization.py --synthetic 5          # generated 12MP photos
+  python benchmarks/ocr_normalization.py --fixtures photos --ocr  # also run OCR
+
+--ocr uses the configured OCR_BACKEND (OCR.space needs OCR_SPACE_API_KEY and
+network access); without it only payload sizes and normalization time are
+reported.
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+import numpy as np
+
+from prescription.imaging import normalize_image_for_ocr
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+SAMPLE_LINES = [
+    "Dr. A. Sharma MBBS MD  Reg No 45821",
+    "Rx",
+    "1. TAB PAN 40mg        1-0-0   x 5 days",
+    "2. TAB PARACETAMOL 650mg  TDS  x 3 days",
+    "3. CAP AMOXICILLIN 500mg  BD   x 5 days",
+    "4. SYP BENADRYL 5ml  HS",
+    "Review after 1 week",
+]
+
+
+def synthetic_photo(seed: int, size=(4032, 3024)) -> bytes:
+    """A phone-camera-like JPEG: large, colour, noisy, text on a lit page"""
+    rng = np.random.default_rng(seed)
+    base = np.full((size[1], size[0], 3), 235, dtype=np.uint8)
+    noise = rng.normal(0, 12, base.shape)
+    gradient = np.linspace(-25, 10, size[0])[None, :, None]
+    page = np.clip(base + noise + gradient, 0, 255).astype(np.uint8)
+    img = Image.fromarray(page)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.load_default(size=96)
+    except TypeError:  # Pillow < 10.1 only has the small bitmap font
+        font = ImageFont.load_default()
+    for i, line in enumerate(SAMPLE_LINES):
+        draw.text((300, 400 + i * 300), line, fill=(30, 30, 60), font=font)
+    img = img.filter(ImageFilter.GaussianBlur(0.6))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+def load_fixtures(args) -> list:
+    fixtures = []
+    if args.fixtures:
+        for name in sorted(os.listdir(args.fixtures)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(args.fixtures, name), "rb") as f:
+                    fixtures.append((name, f.read()))
+    for i in range(args.synthetic):
+        fixtures.append((f"synthetic_{i}.jpg", synthetic_photo(i)))
+    return fixtures
+
+
+async def ocr_latency(data: bytes, filename: str, content_type: str) -> float:
+    from prescription.ocr import extract_text
+    started = time.perf_counter()
+    await extract_text(io.BytesIO(data), filename, content_type)
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(args):
+    fixtures = load_fixtures(args)
+    if not fixtures:
+        print("No fixtures: pass --fixtures DIR and/or --synthetic N")
+        return
+
+    rows = []
+    for name, original in fixtures:
+        started = time.perf_counter()
+        payload, content_type, stats = normalize_image_for_ocr(io.BytesIO(original))
+        normalize_ms = (time.perf_counter() - started) * 1000
+        row = {
+            "name": name,
+            "before": len(original),
+            "after": len(payload),
+            "normalize_ms": normalize_ms,
+        }
+        if args.ocr:
+            row["ocr_before_ms"] = await ocr_latency(original, name, "image/jpeg")
+            row["ocr_after_ms"] = await ocr_latency(payload, name, content_type or "image/jpeg")
+        rows.append(row)
+
+    print(f"\n{'fixture':<28}{'before KB':>12}{'after KB':>12}{'ratio':>8}{'norm ms':>10}", end="")
+    print(f"{'ocr before':>12}{'ocr after':>12}" if args.ocr else "")
+    for row in rows:
+        print(
+            f"{row['name'][:27]:<28}{row['before'] / 1024:>12.1f}{row['after'] / 1024:>12.1f}"
+            f"{row['after'] / row['before']:>8.2f}{row['normalize_ms']:>10.1f}",
+            end=""
+        )
+        print(f"{row['ocr_before_ms']:>12.0f}{row['ocr_after_ms']:>12.0f}" if args.ocr else "")
+
+    total_before = sum(r["before"] for r in rows)
+    total_after = sum(r["after"] for r in rows)
+    print(f"\nTotal bytes sent: {total_before / 1024:.0f}KB -> {total_after / 1024:.0f}KB "
+          f"({100 * (1 - total_after / total_before):.0f}% smaller)")
+    print(f"Normalization time: median {statistics.median(r['normalize_ms'] for r in rows):.0f}ms")
+    if args.ocr:
+        print(f"OCR latency: median {statistics.median(r['ocr_before_ms'] for r in rows):.0f}ms -> "
+              f"{statistics.median(r['ocr_after_ms'] for r in rows):.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR payload size/latency before and after normalization")
+    parser.add_argument("--fixtures", help="Directory of prescription photos")
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of generated 12MP test photos")
+    parser.add_argument("--ocr", action="store_true", help="Also measure latency of the configured OCR backend")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+"""
+Pipeline Record/Replay Benchmark
+
+Runs the upload pipeline (quality check -> OCR -> parse -> enrichment, no DB
+writes) over a corpus of prescriptions with Groq, Tavily and OCR.space served
+by a local stand-in HTTP server, and reports throughput, per-stage p50/p99
+and external call counts. Lets a change to parsing or enrichment be measured
+without spending API credits.
+
+Modes:
+  --synthetic        stand-ins generate plausible responses (fully offline,
+                     no fixtures or API keys needed)
+  --record FILE      stand-ins forward to the real APIs and save every
+                     exchange (needs GROQ_API_KEY, OCR_SPACE_API_KEY and
+                     optionally TAVILY_API_KEY)
+  --replay FILE      stand-ins answer from recorded exchanges (offline)
+
+Usage:
+  python benchmarks/pipeline_replay.py --synthetic --documents 20 --concurrency 4
+  python benchmarks/pipeline_replay.py --record benchmarks/fixtures/recorded.json --corpus ./samples
+  python benchmarks/pipeline_replay.py --replay benchmarks/fixtures/recorded.json --corpus ./samples \\
+      --latency groq=900,ocr=2500 --error-rate groq=0.05 --concurrency 8
+
+Replayed latency defaults to the recorded latency (scaled by --latency-scale);
+--latency overrides it per service. Requests that don't match a recording
+exactly (e.g. after a prompt change) get the most similar recorded answer and
+are counted as misses. Caches are disabled unless --with-caches is given, and
+the Groq rate limiter is off unless GROQ_RPM_LIMIT/GROQ_TPM_LIMIT are set.
+
+Recordings contain prescription text and LLM answers (never API keys); don't
+commit recordings made from real patients' prescriptions.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+SERVICES = ("groq", "tavily", "ocr")
+UPSTREAMS = {"groq": "https://api.groq.com", "tavily": "https://api.tavily.com"}
+SYNTHETIC_LATENCY_MS = {"groq": 800, "tavily": 500, "ocr": 1500}
+DEFAULT_TEXTS = os.path.join(BENCH_DIR, "fixtures", "prescription_texts.json")
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".pdf": "application/pdf"}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (values need not be sorted)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def parse_service_map(spec: str) -> dict:
+    """"groq=800,ocr=1500" -> {"groq": 800.0, "ocr": 1500.0}"""
+    values = {}
+    for part in filter(None, (spec or "").split(",")):
+        service, _, value = part.partition("=")
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service '{service}' (expected one of {', '.join(SERVICES)})")
+        values[service] = float(value)
+    return values
+
+
+def _digest(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _completion_content(body: str, stream: bool) -> str:
+    """Assistant text from a chat completion response (JSON or SSE stream)"""
+    if not stream:
+        return json.loads(body)["choices"][0]["message"]["content"]
+    content = []
+    for line in body.splitlines():
+        if line.startswith("data:") and line[5:].strip() != "[DONE]":
+            for choice in json.loads(line[5:]).get("choices", []):
+                content.append((choice.get("delta") or {}).get("content") or "")
+    return "".join(content)
+
+
+class StandIn:
+    """
+    One local server for all three APIs, mounted at /groq, /tavily and /ocr.
+    Records, replays or synthesizes responses, with latency and error injection.
+    """
+
+    def __init__(self, mode: str, exchanges: list, texts: list, latency: dict, latency_scale: float,
+                 jitter: float, error_rates: dict, on_miss: str, seed: int):
+        self.mode = mode
+        self.exchanges = exchanges
+        self.by_key = {e["key"]: e for e in exchanges}
+        self.texts = texts
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.error_rates = error_rates
+        self.on_miss = on_miss
+        self.rng = random.Random(seed)
+        self.upstreams = dict(UPSTREAMS)
+        self.calls = {s: 0 for s in SERVICES}
+        self.errors = {s: 0 for s in SERVICES}
+        self.misses = {s: 0 for s in SERVICES}
+        self._http = None
+        self.app = Starlette(routes=[
+            Route("/{service}/{path:path}", self.handle, methods=["GET", "POST"])
+        ])
+
+    async def _describe(self, service: str, path: str, request, body: bytes) -> dict:
+        """Replay key, similarity text and options of an incoming request"""
+        if service == "ocr":
+            form = await request.form()
+            data = await form["file"].read()
+            return {"key": _digest(service, path, data), "match_text": "", "stream": False}
+        payload = json.loads(body or b"{}")
+        payload.pop("api_key", None)
+        stream = bool(payload.pop("stream", False))
+        if service == "groq":
+            match_text = " ".join(m.get("content") or "" for m in payload.get("messages", []))
+            model = payload.get("model", "")
+        else:
+            match_text, model = payload.get("query", ""), ""
+        return {
+            "key": _digest(service, path, json.dumps(payload, sort_keys=True)),
+            "match_text": match_text,
+            "stream": stream,
+            "model": model,
+            "payload": payload,
+        }
+
+    async def handle(self, request):
+        service = request.path_params["service"]
+        path = "/" + request.path_params["path"]
+        if service not in SERVICES:
+            return JSONResponse({"error": f"unknown service {service}"}, status_code=404)
+        body = await request.body()
+        info = await self._describe(service, path, request, body)
+        self.calls[service] += 1
+
+        if self.mode == "record":
+            return await self._forward(service, path, request, body, info)
+
+        if self.rng.random() < self.error_rates.get(service, 0.0):
+            self.errors[service] += 1
+            await asyncio.sleep(self._delay(service, None) * 0.1)
+            return self._injected_error(service)
+
+        exchange = None
+        if self.mode == "replay":
+            exchange = self._lookup(service, path, info)
+        if exchange is None:
+            if self.mode == "replay" and self.on_miss == "error":
+                return JSONResponse({"error": "no recorded exchange"}, status_code=502)
+            exchange = {"body": self._synthesize(service, info), "elapsed_ms": None}
+
+        delay = self._delay(service, exchange.get("elapsed_ms"))
+        if service == "groq":
+            return await self._completion_response(exchange["body"], info["model"], info["stream"], delay)
+        await asyncio.sleep(delay)
+        return Response(exchange["body"], media_type="application/json")
+
+    def _lookup(self, service: str, path: str, info: dict):
+        exchange = self.by_key.get(info["key"])
+        if exchange is not None:
+            return exchange
+        self.misses[service] += 1
+        candidates = [e for e in self.exchanges if e["service"] == service and e["path"] == path]
+        if service == "groq":
+            candidates = [e for e in candidates if e.get("model") == info["model"]] or candidates
+        if not candidates or self.on_miss == "synthesize":
+            return None
+        if not info["match_text"]:
+            return candidates[int(info["key"][:8], 16) % len(candidates)]
+        words = _words(info["match_text"])
+
+        def similarity(exchange):
+            other = _words(exchange.get("match_text", ""))
+            return len(words & other) / max(1, len(words | other))
+        return max(candidates, key=similarity)
+
+    def _delay(self, service: str, recorded_ms) -> float:
+        if service in self.latency:
+            ms = self.latency[service]
+        elif recorded_ms is not None:
+            ms = recorded_ms * self.latency_scale
+        else:
+            ms = SYNTHETIC_LATENCY_MS[service] * self.latency_scale
+        if self.jitter:
+            ms *= self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.0, ms / 1000)
+
+    def _injected_error(self, service: str) -> Response:
+        if service == "groq":
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (injected)", "type": "rate_limit_error"}},
+                status_code=429, headers={"retry-after": "1"}
+            )
+        return JSONResponse({"error": "Service unavailable (injected)"}, status_code=503)
+
+    async def _completion_response(self, content: str, model: str, stream: bool, delay: float) -> Response:
+        created = int(time.time())
+        if not stream:
+            await asyncio.sleep(delay)
+            return JSONResponse({
+                "id": "chatcmpl-replay", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            })
+
+        pieces = [content[i:i + 24] for i in range(0, len(content), 24)] or [""]
+
+        async def events():
+            # First token after ~30% of the latency, the rest spread evenly
+            await asyncio.sleep(delay * 0.3)
+            for piece in pieces:
+                chunk = {
+                    "id": "chatcmpl-replay", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(delay * 0.7 / len(pieces))
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def _forward(self, service: str, path: str, request, body: bytes, info: dict) -> Response:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=120)
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length", "accept-encoding")}
+        started = time.perf_counter()
+        response = await self._http.request(request.method, self.upstreams[service] + path, content=body, headers=headers)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if response.status_code == 200:
+            stored = response.text
+            if service == "groq":
+                stored = _completion_content(stored, info["stream"])
+            exchange = {
+                "service": service, "path": path, "key": info["key"], "model": info.get("model", ""),
+                "match_text": info["match_text"], "body": stored, "elapsed_ms": round(elapsed_ms, 1),
+            }
+            self.exchanges.append(exchange)
+            self.by_key[info["key"]] = exchange
+        else:
+            print(f"[BENCH] {service} {path} returned {response.status_code} (not recorded)")
+        return Response(response.content, status_code=response.status_code,
+                        media_type=response.headers.get("content-type"))
+
+    def _synthesize(self, service: str, info: dict) -> str:
+        if service == "ocr":
+            text = self.texts[int(info["key"][:8], 16) % len(self.texts)]
+            return json.dumps({
+                "ParsedResults": [{"FileParseExitCode": 1, "ParsedText": text}],
+                "IsErroredOnProcessing": False,
+            })
+        if service == "tavily":
+            query = info["match_text"]
+            return json.dumps({
+                "query": query,
+                "answer": f"{query}: usually one tablet twice a day after meals for adults.",
+                "results": [{"title": "Synthetic drug reference", "url": "https://example.org/drug",
+                             "content": "Typical adult dose is 500mg twice a day (morning and evening)."}],
+            })
+        return self._synthesize_completion(info["payload"])
+
+    def _synthesize_completion(self, payload: dict) -> str:
+        from prescription.rules import parse_prescription_rules
+
+        prompt = (payload.get("messages") or [{}])[-1].get("content") or ""
+        answer = {"dosage": "500mg", "frequency": "twice a day", "timings": ["morning", "evening"],
+                  "confidence": "high", "reasoning": "synthetic stand-in answer"}
+        batch = re.findall(r"^### Medicine (\d+)", prompt, re.MULTILINE)
+        if batch:
+            return json.dumps({"medicines": [{"index": int(i), **answer} for i in batch]})
+        if "RAW PRESCRIPTION TEXT" in prompt:
+            match = re.search(r"```\n(.*?)\n```", prompt, re.DOTALL)
+            medicines, _ = parse_prescription_rules(match.group(1) if match else prompt)
+            return json.dumps({"medicines": medicines, "total_found": len(medicines)})
+        return json.dumps(answer)
+
+
+def start_server(app) -> tuple:
+    """Run the stand-in server in a background thread; returns (server, base_url)"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.02)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def configure_environment(args, base_url: str, ocr_path: str):
+    """Point the pipeline at the stand-in server (must run before importing prescription.*)"""
+    replaying = args.record is None
+    os.environ.update({
+        "GROQ_BASE_URL": f"{base_url}/groq",
+        "TAVILY_API_BASE_URL": f"{base_url}/tavily",
+        "OCR_SPACE_URL": f"{base_url}/ocr{ocr_path}",
+        "OCR_BACKEND": "ocrspace",
+        "OCR_HEDGE_ENABLED": "false",
+    })
+    if replaying:
+        for key in ("GROQ_API_KEY", "TAVILY_API_KEY", "OCR_SPACE_API_KEY"):
+            os.environ[key] = "replay"
+    if not args.with_caches:
+        for key in ("OCR_CACHE_ENABLED", "PARSE_CACHE_ENABLED", "MEDICINE_CACHE_ENABLED", "SEARCH_CACHE_ENABLED"):
+            os.environ[key] = "false"
+    os.environ.setdefault("GROQ_RPM_LIMIT", "0")
+    os.environ.setdefault("GROQ_TPM_LIMIT", "0")
+
+
+def load_corpus(args) -> list:
+    if args.corpus:
+        documents = []
+        for name in sorted(os.listdir(args.corpus)):
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+            if content_type:
+                with open(os.path.join(args.corpus, name), "rb") as f:
+                    documents.append({"name": name, "data": f.read(), "content_type": content_type})
+        if not documents:
+            raise SystemExit(f"No images or PDFs found in {args.corpus}")
+        return documents
+    if not args.synthetic:
+        raise SystemExit("--corpus is required with --record/--replay")
+
+    from ocr_normalization import synthetic_photo
+    return [
+        {"name": f"synthetic_{i}.jpg", "data": synthetic_photo(i, size=(1600, 1200)), "content_type": "image/jpeg"}
+        for i in range(args.documents)
+    ]
+
+
+async def run_corpus(documents: list, concurrency: int, repeats: int) -> tuple:
+    from prescription.metrics import start_timer
+    from prescription.pipeline import analyze_prescription
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(document: dict) -> dict:
+        async with semaphore:
+            timer = start_timer()
+            result = {"name": document["name"], "ok": True}
+            try:
+                analysis = await analyze_prescription(
+                    io.BytesIO(document["data"]), document["name"], document["content_type"]
+                )
+                result["medicines"] = len(analysis["medicines"])
+                result["parser"] = analysis["parse_info"]["parser"]
+            except Exception as e:
+                result.update(ok=False, error=str(getattr(e, "detail", e)))
+            result["timings"] = timer.finish()
+            return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[run_one(d) for d in documents * repeats])
+    return results, time.perf_counter() - started
+
+
+def report(results: list, wall_seconds: float, stand_in: StandIn, concurrency: int) -> dict:
+    from prescription.llm import LLM_RETRIES, LLM_TIER_REQUESTS
+    from prescription.llm_schema import LLM_JSON_RESULTS
+    from prescription.planner import PLAN_DECISIONS
+
+    stages, calls = {}, {}
+    for result in results:
+        for key, value in result["timings"].items():
+            if key.endswith("_ms"):
+                stages.setdefault(key[:-3], []).append(value)
+        for call in result["timings"].get("calls", []):
+            calls.setdefault(call["stage"], []).append(call["ms"])
+
+    ok = sum(1 for r in results if r["ok"])
+    print(f"\n=== Pipeline replay ({stand_in.mode}) ===")
+    print(f"documents:  {len(results)} ({ok} ok, {len(results) - ok} failed), concurrency {concurrency}")
+    print(f"wall time:  {wall_seconds:.2f}s -> {len(results) / wall_seconds:.2f} documents/s")
+
+    print(f"\n{'stage':<26} {'n':>5} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    summary = {"documents": len(results), "ok": ok, "wall_seconds": wall_seconds, "stages": {}, "calls": {}}
+    for name, values in sorted(stages.items(), key=lambda item: item[0] == "total"):
+        print(f"{name:<26} {len(values):>5} {percentile(values, 50):>10.1f} {percentile(values, 99):>10.1f} {statistics.mean(values):>10.1f}")
+        summary["stages"][name] = {"n": len(values), "p50": percentile(values, 50), "p99": percentile(values, 99)}
+    for name, values in sorted(calls.items()):
+        print(f"{name + ' (per call)':<26} {len(values):>5} {percentile(values, 50):>10.1f} {percentile(values, 99):>10.1f} {statistics.mean(values):>10.1f}")
+
+    print(f"\n{'service':<10} {'calls':>6} {'injected':>9} {'misses':>7}")
+    for service in SERVICES:
+        print(f"{service:<10} {stand_in.calls[service]:>6} {stand_in.errors[service]:>9} {stand_in.misses[service]:>7}")
+        summary["calls"][service] = {
+            "calls": stand_in.calls[service], "injected_errors": stand_in.errors[service], "misses": stand_in.misses[service]
+        }
+
+    tiers = []
+    for task in ("parse", "enrich", "enrich_batch"):
+        for tier in ("fast", "large"):
+            for outcome in ("accepted", "escalated", "error"):
+                count = LLM_TIER_REQUESTS.value(task=task, tier=tier, outcome=outcome)
+                if count:
+                    tiers.append(f"{task}/{tier}/{outcome}={count:g}")
+    retries = [f"{reason}={LLM_RETRIES.value(reason=reason):g}" for reason in ("429", "503", "500", "connection")
+               if LLM_RETRIES.value(reason=reason)]
+    print(f"\nLLM tiers:   {', '.join(tiers) or 'none'}")
+    print(f"LLM retries: {', '.join(retries) or 'none'}")
+    plans = []
+    for decision in ("advanced", "basic", "cached", "skip"):
+        for reason in ("fields", "budget", "search_cache", "catalog", "timings_only", "search_unavailable"):
+            count = PLAN_DECISIONS.value(decision=decision, reason=reason)
+            if count:
+                plans.append(f"{decision}/{reason}={count:g}")
+    print(f"search plan: {', '.join(plans) or 'none'}")
+    answers = []
+    for schema in ("parse", "parse_stream", "enrich", "enrich_batch"):
+        for outcome in ("valid", "repaired", "failed"):
+            count = LLM_JSON_RESULTS.value(schema=schema, outcome=outcome)
+            if count:
+                answers.append(f"{schema}/{outcome}={count:g}")
+    print(f"LLM JSON:    {', '.join(answers) or 'none'}")
+    parsers = {}
+    for result in results:
+        if result["ok"]:
+            parsers[result["parser"]] = parsers.get(result["parser"], 0) + 1
+    print(f"parsers:     {parsers}")
+    for result in results:
+        if not result["ok"]:
+            print(f"failed: {result['name']}: {result['error']}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the upload pipeline against recorded or synthetic APIs")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--synthetic", action="store_true", help="Generate responses locally (no fixtures needed)")
+    mode.add_argument("--record", metavar="FILE", help="Forward to the real APIs and save exchanges to FILE")
+    mode.add_argument("--replay", metavar="FILE", help="Answer from exchanges recorded in FILE")
+    parser.add_argument("--corpus", help="Directory of prescription images/PDFs")
+    parser.add_argument("--documents", type=int, default=12, help="Synthetic documents when no --corpus is given")
+    parser.add_argument("--texts", default=DEFAULT_TEXTS, help="Prescription texts the synthetic OCR returns")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=1, help="Run the corpus this many times")
+    parser.add_argument("--latency", default="", help="Per-service latency in ms, e.g. groq=800,ocr=1500")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for recorded/default latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency jitter as a fraction (0.2 = +/-20%%)")
+    parser.add_argument("--error-rate", default="", help="Per-service injected error rate, e.g. groq=0.05")
+    parser.add_argument("--on-miss", choices=("nearest", "synthesize", "error"), default="nearest",
+                        help="Replay answer for requests with no exact recording")
+    parser.add_argument("--with-caches", action="store_true", help="Keep OCR/parse/medicine caches enabled")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    exchanges = []
+    fixture_file = args.record or args.replay
+    if fixture_file and os.path.exists(fixture_file):
+        with open(fixture_file) as f:
+            exchanges = json.load(f)["exchanges"]
+    if args.replay and not exchanges:
+        raise SystemExit(f"No recorded exchanges in {args.replay}")
+    with open(args.texts) as f:
+        texts = [fixture["text"] for fixture in json.load(f)]
+
+    stand_in = StandIn(
+        "record" if args.record else "replay" if args.replay else "synthetic",
+        exchanges, texts, parse_service_map(args.latency), args.latency_scale, args.jitter,
+        parse_service_map(args.error_rate), args.on_miss, args.seed
+    )
+    ocr_url = urlsplit(os.getenv("OCR_SPACE_URL", "https://api.ocr.space/parse/image"))
+    if args.record:
+        stand_in.upstreams["ocr"] = f"{ocr_url.scheme}://{ocr_url.netloc}"
+        if not os.getenv("GROQ_API_KEY") or not os.getenv("OCR_SPACE_API_KEY"):
+            raise SystemExit("--record needs GROQ_API_KEY and OCR_SPACE_API_KEY")
+
+    server, base_url = start_server(stand_in.app)
+    configure_environment(args, base_url, ocr_url.path)
+    documents = load_corpus(args)
+    try:
+        results, wall_seconds = asyncio.run(run_corpus(documents, args.concurrency, args.repeats))
+    finally:
+        server.should_exit = True
+
+    summary = report(results, wall_seconds, stand_in, args.concurrency)
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump({"version": 1, "exchanges": stand_in.exchanges}, f, indent=1)
+        print(f"\nrecorded {len(stand_in.exchanges)} exchanges to {args.record}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Rule-Based Parser Benchmark
+
+Runs the local rule parser over fixture prescription texts and reports how
+many LLM parsing calls it avoids at RULE_PARSER_MIN_CONFIDENCE, the local
+parse cost, medicine-name recall on the texts it accepts, and the parsing
+latency saved.
+
+Usage:
+  python benchmarks/rule_parser.py                     # bundled fixtures
+  python benchmarks/rule_parser.py --fixtures texts.json --threshold 0.8
+  python benchmarks/rule_parser.py --live              # time real Groq parses
+
+Fixtures are a JSON list of {"name", "text", "expected": [medicine names]}.
+Without --live the LLM latency is taken from --llm-latency-ms; --live needs
+GROQ_API_KEY and network access.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.rules import RULE_PARSER_MIN_CONFIDENCE, parse_prescription_rules
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "prescription_texts.json")
+
+
+def _norm(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def recall(found: list, expected: list) -> float:
+    if not expected:
+        return 1.0 if not found else 0.0
+    names = {_norm(m.get("medicine_name", "")) for m in found}
+    return sum(1 for e in expected if _norm(e) in names) / len(expected)
+
+
+async def time_llm_parse(text: str) -> float:
+    from prescription.enrichment import parse_prescription_with_groq
+    started = time.perf_counter()
+    await parse_prescription_with_groq(text)
+    return (time.perf_counter() - started) * 1000
+
+
+def run(fixtures: list, threshold: float, llm_latency_ms: float, live: bool, repeats: int):
+    print(f"{'fixture':<24} {'conf':>5} {'meds':>5} {'route':>6} {'recall':>7} {'rules ms':>9} {'llm ms':>8}")
+    accepted_recalls = []
+    rule_ms = []
+    saved_ms = 0.0
+    avoided = 0
+    for fixture in fixtures:
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            medicines, confidence = parse_prescription_rules(fixture["text"])
+            timings.append((time.perf_counter() - started) * 1000)
+        local_ms = statistics.median(timings)
+        rule_ms.append(local_ms)
+
+        llm_ms = asyncio.run(time_llm_parse(fixture["text"])) if live else llm_latency_ms
+        accepted = bool(medicines) and confidence >= threshold
+        if accepted:
+            avoided += 1
+            saved_ms += llm_ms - local_ms
+            accepted_recalls.append(recall(medicines, fixture.get("expected", [])))
+        print(
+            f"{fixture['name']:<24} {confidence:>5.2f} {len(medicines):>5} {'rules' if accepted else 'llm':>6} "
+            f"{recall(medicines, fixture.get('expected', [])):>7.2f} {local_ms:>9.3f} {llm_ms:>8.0f}"
+        )
+
+    total = len(fixtures)
+    print()
+    print(f"threshold:          {threshold}")
+    print(f"LLM calls avoided:  {avoided}/{total} ({avoided / total:.0%})")
+    print(f"rule parse time:    median {statistics.median(rule_ms):.3f} ms, max {max(rule_ms):.3f} ms")
+    if accepted_recalls:
+        print(f"recall (accepted):  {statistics.mean(accepted_recalls):.2f}")
+    source = "measured" if live else f"assumed {llm_latency_ms:.0f} ms"
+    print(f"parse latency saved: {saved_ms:.0f} ms total, {saved_ms / total:.0f} ms per upload ({source} LLM latency)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM calls avoided by the rule-based prescription parser")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="JSON file of prescription texts")
+    parser.add_argument("--threshold", type=float, default=RULE_PARSER_MIN_CONFIDENCE)
+    parser.add_argument("--llm-latency-ms", type=float, default=1500.0, help="Assumed Groq parse latency")
+    parser.add_argument("--live", action="store_true", help="Measure real Groq parse latency per fixture")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    with open(args.fixtures) as f:
+        fixtures = json.load(f)
+    run(fixtures, args.threshold, args.llm_latency_ms, args.live, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Upload Concurrency Benchmark
+
+Measures how responsive the API stays while prescription uploads are in flight.
+N uploads are fired concurrently against /api/upload-prescription while a probe
+loop hits /auth/me, and the probe latencies are reported as p50/p95/p99.
+
+If the upload pipeline blocks the event loop, /auth/me latency balloons to the
+length of an OCR or LLM call; with a non-blocking pipeline it should stay flat.
+
+Usage:
+  python benchmarks/upload_concurrency.py --email you@example.com --password secret \\
+      --image sample_prescription.jpg --uploads 8
+
+Requires a running server (uvicorn app:app) and an existing user account.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (values need not be sorted)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> tuple:
+    response = await client.post("/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    data = response.json()
+    return data["session_id"], data["user_id"]
+
+
+async def probe_loop(client: httpx.AsyncClient, session_id: str, stop: asyncio.Event, interval: float) -> list:
+    """Hit /auth/me repeatedly until stopped, returning latencies in ms"""
+    latencies = []
+    headers = {"Authorization": f"Bearer {session_id}"}
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/auth/me", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            print(f"[BENCH] /auth/me returned {response.status_code}")
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def upload_once(client: httpx.AsyncClient, image_bytes: bytes, filename: str, user_id: str) -> tuple:
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/upload-prescription",
+        files={"file": (filename, image_bytes, "image/jpeg")},
+        data={"user_id": user_id},
+    )
+    return response.status_code, (time.perf_counter() - started) * 1000
+
+
+def report(label: str, latencies: list):
+    if not latencies:
+        print(f"{label}: no samples")
+        return
+    print(
+        f"{label}: n={len(latencies)} "
+        f"mean={statistics.mean(latencies):.1f}ms "
+        f"p50={percentile(latencies, 50):.1f}ms "
+        f"p95={percentile(latencies, 95):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms "
+        f"max={max(latencies):.1f}ms"
+    )
+
+
+async def run(args):
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    filename = os.path.basename(args.image)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        session_id, user_id = await login(client, args.email, args.password)
+
+        # Baseline: probe latency with no uploads in flight
+        stop = asyncio.Event()
+        baseline_task = asyncio.create_task(probe_loop(client, session_id, stop, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await baseline_task
+
+        # Loaded: same probe loop while N uploads run concurrently
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe_loop(client, session_id, stop, args.interval))
+        uploads = await asyncio.gather(*[
+            upload_once(client, image_bytes, filename, user_id) for _ in range(args.uploads)
+        ])
+        stop.set()
+        loaded = await probe_task
+
+    print(f"\n=== /auth/me latency ({args.uploads} concurrent uploads) ===")
+    report("baseline", baseline)
+    report("under load", loaded)
+    report("uploads", [elapsed for _, elapsed in uploads])
+    statuses = {}
+    for status, _ in uploads:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"upload statuses: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /auth/me latency while uploads are in flight")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--image", required=True, help="Prescription image to upload")
+    parser.add_argument("--uploads", type=int, default=8, help="Number of concurrent uploads (N)")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between /auth/me probes")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
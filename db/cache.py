@@ -0,0 +1,151 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from db.redis import get_redis
+
+# After a Redis error, serve from memory for this long before retrying Redis
+REDIS_RETRY_SECONDS = 30
+
+
+class RedisLRUCache:
+    """
+    Namespaced JSON cache in Redis with per-entry TTL and a bounded size.
+
+    Recency is tracked in a sorted set ({namespace}:lru, score = last access),
+    and the least recently used entries are evicted once max_entries is
+    exceeded. Each entry's expiry is kept in a second sorted set
+    ({namespace}:expiry, score = expires_at) so index members are pruned by
+    their own TTL, not the default one. Reads refresh recency but not the
+    TTL. Falls back to an in-process LRU when Redis is unavailable.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: int, max_entries: int):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # In-memory fallback: key -> (expires_at, value)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._redis_failed = False
+        self._redis_retry_at = 0.0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    @property
+    def _index_key(self) -> str:
+        return f"{self.namespace}:lru"
+
+    @property
+    def _expiry_key(self) -> str:
+        return f"{self.namespace}:expiry"
+
+    def _redis_error(self, action: str, error: Exception):
+        if not self._redis_failed:
+            print(f"[CACHE] Redis {action} failed for '{self.namespace}', using in-memory cache: {error}")
+        self._redis_failed = True
+        self._redis_retry_at = time.time() + REDIS_RETRY_SECONDS
+
+    def _use_memory(self) -> bool:
+        return self._redis_failed and time.time() < self._redis_retry_at
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = None
+        if self._use_memory():
+            value = self._memory_get(key)
+        else:
+            value = await self._redis_get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def _redis_get(self, key: str) -> Optional[dict]:
+        value = None
+        try:
+            redis = await get_redis()
+            raw = await redis.get(self._key(key))
+            if raw is not None:
+                value = json.loads(raw)
+                await redis.zadd(self._index_key, {key: time.time()})
+            self._redis_failed = False
+        except Exception as e:
+            self._redis_error("get", e)
+            value = self._memory_get(key)
+        return value
+
+    async def set(self, key: str, value: dict, ttl_seconds: Optional[int] = None):
+        ttl = ttl_seconds or self.ttl_seconds
+        if self._use_memory():
+            self._memory_set(key, value, ttl)
+            return
+        try:
+            redis = await get_redis()
+            now = time.time()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.set(self._key(key), json.dumps(value), ex=ttl)
+                pipe.zadd(self._index_key, {key: now})
+                pipe.zadd(self._expiry_key, {key: now + ttl})
+                # Entries whose own TTL has run out (Redis already dropped the values)
+                pipe.zrangebyscore(self._expiry_key, "-inf", now)
+                pipe.zcard(self._index_key)
+                results = await pipe.execute()
+            expired, size = results[-2], results[-1]
+            if expired:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.zrem(self._index_key, *expired)
+                    pipe.zrem(self._expiry_key, *expired)
+                    await pipe.execute()
+                size -= len(expired)
+            await self._evict(redis, size)
+            self._redis_failed = False
+        except Exception as e:
+            self._redis_error("set", e)
+            self._memory_set(key, value, ttl)
+
+    async def _evict(self, redis, size: int):
+        excess = size - self.max_entries
+        if excess <= 0:
+            return
+        oldest = await redis.zrange(self._index_key, 0, excess - 1)
+        if oldest:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self._key(k) for k in oldest])
+                pipe.zrem(self._index_key, *oldest)
+                pipe.zrem(self._expiry_key, *oldest)
+                await pipe.execute()
+            self.evictions += len(oldest)
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: dict, ttl: int):
+        self._memory[key] = (time.time() + ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "backend": "memory" if self._redis_failed else "redis"
+        }
@@ -20,6 +20,7 @@ sync_db = sync_client[MONGODB_DB_NAME]
 users_collection = async_db.users
 prescriptions_collection = async_db.prescriptions
 schedules_collection = async_db.schedules
+prescription_jobs_collection = async_db.prescription_jobs
 
 # Sync collections for compatibility
 sync_users = sync_db.users
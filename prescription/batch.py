@@ -0,0 +1,187 @@
+"""
+Batch Prescription Upload
+Processes several prescription pages concurrently (bounded), merges the
+medicines they share and writes all prescriptions and schedules in bulk.
+"""
+
+import os
+import re
+import asyncio
+import time
+from typing import BinaryIO, List, Tuple
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from db.mongo import prescriptions_collection, schedules_collection
+from prescription.metrics import start_timer, timed_stage
+from prescription.pipeline import (
+    analyze_prescription, build_prescription_doc, build_schedule_docs, verify_user
+)
+
+load_dotenv()
+
+# Number of files analyzed (OCR + parse + enrichment) at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+def medicine_key(medicine: dict) -> str:
+    """Dedup key: case/punctuation-insensitive name plus dosage"""
+    name = re.sub(r"[^a-z0-9]", "", str(medicine.get("medicine_name", "")).lower())
+    dosage = re.sub(r"\s+", "", str(medicine.get("dosage", "")).lower())
+    return f"{name}|{dosage}"
+
+
+async def _analyze_file(
+    semaphore: asyncio.Semaphore,
+    image: BinaryIO,
+    filename: str,
+    content_type: str
+) -> dict:
+    submitted = time.perf_counter()
+    async with semaphore:
+        started = time.perf_counter()
+        # Each file runs in its own task, so stages time into a per-file timer
+        timer = start_timer()
+        try:
+            analysis = await analyze_prescription(image, filename, content_type)
+            error = None
+        except HTTPException as e:
+            analysis, error = None, e.detail
+        except Exception as e:
+            print(f"[BATCH] Error processing {filename}: {e}")
+            analysis, error = None, str(e)
+    finished = time.perf_counter()
+    return {
+        "filename": filename,
+        "analysis": analysis,
+        "error": error,
+        "timings_ms": {
+            "queued": round((started - submitted) * 1000, 1),
+            "processing": round((finished - started) * 1000, 1),
+            **timer.breakdown()
+        }
+    }
+
+
+async def process_prescription_batch(
+    user_id: str,
+    uploads: List[Tuple[BinaryIO, str, str]],
+    rejected: List[dict] = None
+) -> Tuple[dict, int]:
+    """
+    Run the prescription pipeline over several uploads
+
+    Args:
+        user_id: MongoDB ObjectId of the uploading user
+        uploads: (buffer, filename, content_type) for each accepted file
+        rejected: Per-file results for uploads refused before processing
+
+    Returns:
+        Tuple of (response_payload, http_status_code)
+    """
+    batch_started = time.perf_counter()
+    await verify_user(user_id)
+
+    semaphore = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    results = await asyncio.gather(*[
+        _analyze_file(semaphore, image, filename, content_type)
+        for image, filename, content_type in uploads
+    ])
+
+    # One prescription per successfully read page, written in a single round trip
+    processed = [r for r in results if r["analysis"] is not None]
+    write_started = time.perf_counter()
+    prescription_ids = []
+    if processed:
+        prescription_docs = [
+            build_prescription_doc(user_id, r["analysis"]["text"], r["analysis"]["medicines"])
+            for r in processed
+        ]
+        with timed_stage("db_write"):
+            inserted = await prescriptions_collection.insert_many(prescription_docs)
+        prescription_ids = [str(pid) for pid in inserted.inserted_ids]
+
+    # Merge medicines across pages: the first page a medicine appears on owns its schedule
+    merged_medicines = []
+    seen = set()
+    duplicates_removed = 0
+    schedule_docs = []
+    for result, prescription_id in zip(processed, prescription_ids):
+        result["prescription_id"] = prescription_id
+        unique = []
+        for medicine in result["analysis"]["medicines"]:
+            if not isinstance(medicine, dict):
+                continue
+            key = medicine_key(medicine)
+            if key in seen:
+                duplicates_removed += 1
+                continue
+            seen.add(key)
+            unique.append(medicine)
+        merged_medicines.extend(unique)
+        schedule_docs.extend(build_schedule_docs(user_id, prescription_id, unique))
+
+    schedule_ids = []
+    if schedule_docs:
+        with timed_stage("db_write"):
+            inserted = await schedules_collection.insert_many(schedule_docs)
+        schedule_ids = [str(sid) for sid in inserted.inserted_ids]
+    write_ms = round((time.perf_counter() - write_started) * 1000, 1)
+
+    files = list(rejected or [])
+    enriched_count = 0
+    for result in results:
+        analysis = result["analysis"]
+        file_result = {
+            "filename": result["filename"],
+            "success": analysis is not None and len(analysis["medicines"]) > 0,
+            "timings_ms": result["timings_ms"]
+        }
+        if analysis is None:
+            file_result["error"] = result["error"]
+        else:
+            enriched_count += analysis["enrichment_stats"].get("enriched_count", 0)
+            file_result.update({
+                "prescription_id": result["prescription_id"],
+                "medicines_detected": len(analysis["medicines"]),
+                "medicines": analysis["medicines"],
+                "ocr_cached": analysis["ocr_cached"],
+                "ocr_failed_pages": analysis["ocr_failed_pages"],
+                "parse_info": analysis["parse_info"],
+                "enrichment_stats": analysis["enrichment_stats"]
+            })
+            if analysis["quality_warnings"]:
+                file_result["quality_warnings"] = analysis["quality_warnings"]
+                file_result["quality_metrics"] = analysis["quality_metrics"]
+        files.append(file_result)
+
+    success = len(schedule_ids) > 0
+    message = (
+        f"Processed {len(processed)} of {len(files)} file(s). "
+        f"{len(merged_medicines)} unique medicine(s) extracted and {len(schedule_ids)} schedule(s) created."
+    )
+    if duplicates_removed:
+        message += f" {duplicates_removed} duplicate medicine(s) merged."
+    if enriched_count:
+        message += f" {enriched_count} medicine(s) enhanced with AI-powered information."
+    if not success:
+        message = "No medicines detected in any of the uploaded files. Please try clearer images."
+
+    response_data = {
+        "success": success,
+        "prescription_ids": prescription_ids,
+        "schedule_ids": schedule_ids,
+        "medicines": merged_medicines,
+        "message": message,
+        "files": files,
+        "files_processed": len(processed),
+        "files_failed": len(files) - len(processed),
+        "medicines_detected": len(merged_medicines),
+        "duplicates_removed": duplicates_removed,
+        "schedules_created": len(schedule_ids),
+        "timings_ms": {
+            "total": round((time.perf_counter() - batch_started) * 1000, 1),
+            "db_write": write_ms
+        }
+    }
+    return response_data, 200 if success else 400
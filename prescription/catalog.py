@@ -0,0 +1,281 @@
+"""
+Drug Catalog
+Bundled list of common drugs with their brand names and usual adult dosing.
+Parsed medicine names ("PANTOP-40", "Pant0p", "Tab. Pantop 40") are matched
+against it through a character-trigram index, so the variants of one drug get
+one canonical name (and therefore one cache entry and one schedule name), and
+known drugs get their missing dosage/frequency without a web search.
+"""
+
+import os
+import re
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from prescription.metrics import Counter
+from prescription.rules import DOSAGE_FORMS, frequency_timings
+
+load_dotenv()
+
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "true").lower() == "true"
+CATALOG_PATH = os.getenv(
+    "CATALOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "drug_catalog.json")
+)
+# Minimum trigram (Dice) similarity for a fuzzy match
+CATALOG_MIN_SIMILARITY = float(os.getenv("CATALOG_MIN_SIMILARITY", "0.75"))
+# Names shorter than this only match exactly ("Pan" must not match "Pam")
+CATALOG_FUZZY_MIN_LENGTH = int(os.getenv("CATALOG_FUZZY_MIN_LENGTH", "5"))
+
+CATALOG_LOOKUPS = Counter(
+    "medimind_catalog_lookups_total",
+    "Medicine names looked up in the drug catalog",
+    ("outcome",)
+)
+
+_FORM_PREFIX = re.compile(rf"^(?:(?:{DOSAGE_FORMS})s?|[tc])\s+")
+# Dots are kept only inside numbers ("0.4")
+_STRAY_DOT = re.compile(r"(?<!\d)\.|\.(?!\d)")
+_SEPARATORS = re.compile(r"[^a-z0-9.]+")
+# OCR confusions inside a word: "pant0p", "g1imy", "a5pirin"
+_DIGIT_IN_WORD = re.compile(r"(?<=[a-z])[0158]+(?=[a-z])")
+_OCR_DIGITS = str.maketrans("0158", "olsb")
+_STRENGTH = re.compile(r"^(\d+(?:\.\d+)?)(?:mg|mcg|g|gm|ml|iu)?$")
+# Strength glued to the name: "pantop40"
+_GLUED_STRENGTH = re.compile(r"^([a-z]{3,})(\d+(?:\.\d+)?)$")
+# Placeholder dosages that count as missing (as in detect_missing_information)
+_NO_DOSAGE = {"", "unknown", "n/a", "as prescribed"}
+
+
+def normalize_drug_name(name: str) -> Tuple[str, Optional[float]]:
+    """
+    Matching form of a medicine name: lowercase, no dosage-form prefix,
+    punctuation or strength, OCR digit/letter confusions undone
+
+    Returns:
+        Tuple of (normalized_name, strength written in the name or None)
+    """
+    text = _SEPARATORS.sub(" ", _STRAY_DOT.sub(" ", str(name or "").lower())).strip()
+    text = _FORM_PREFIX.sub("", text)
+    text = _DIGIT_IN_WORD.sub(lambda m: m.group(0).translate(_OCR_DIGITS), text)
+
+    words = []
+    strength = None
+    for word in text.split():
+        glued = _GLUED_STRENGTH.match(word)
+        if glued:
+            word, number = glued.groups()
+        else:
+            number = None
+            numeric = _STRENGTH.match(word)
+            if numeric:
+                number, word = numeric.group(1), ""
+        if number is not None and strength is None:
+            strength = float(number)
+        if word:
+            words.append(word)
+    return " ".join(words), strength
+
+
+def _match_key(key: str) -> str:
+    """Index form of a normalized name: "i" and "l" are folded (OCR reads both as 1)"""
+    return key.replace("i", "l")
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DrugCatalog:
+    """Exact and trigram index over every catalog drug's generic and brand names"""
+
+    def __init__(self, drugs: List[Dict]):
+        self.drugs = drugs
+        # match key -> (drug index, name as written in the catalog)
+        self._names: Dict[str, Tuple[int, str]] = {}
+        self._keys: List[str] = []
+        self._grams: List[set] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+
+        for index, drug in enumerate(drugs):
+            for alias in [drug["name"], *drug.get("aliases", [])]:
+                key = _match_key(normalize_drug_name(alias)[0])
+                if not key or key in self._names:
+                    continue
+                self._names[key] = (index, alias)
+                if len(key) < CATALOG_FUZZY_MIN_LENGTH:
+                    continue
+                grams = _trigrams(key)
+                position = len(self._keys)
+                self._keys.append(key)
+                self._grams.append(grams)
+                for gram in grams:
+                    self._postings[gram].append(position)
+
+    def __len__(self) -> int:
+        return len(self.drugs)
+
+    @property
+    def name_count(self) -> int:
+        return len(self._names)
+
+    def _fuzzy(self, key: str) -> Optional[Tuple[str, float]]:
+        grams = _trigrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] += 1
+
+        words = key.count(" ")
+        best, best_score, runner_up = None, 0.0, 0.0
+        for position, count in shared.items():
+            candidate = self._keys[position]
+            # "Telma H" is a different product from "Telma": never bridge extra words
+            if candidate.count(" ") != words:
+                continue
+            score = 2 * count / (len(grams) + len(self._grams[position]))
+            if score > best_score:
+                if best is not None and self._names[candidate][0] != self._names[best][0]:
+                    runner_up = best_score
+                best, best_score = candidate, score
+            elif score > runner_up and self._names[candidate][0] != self._names[best][0]:
+                runner_up = score
+
+        # Equally close to two different drugs: ambiguous, don't guess
+        if best is None or best_score < CATALOG_MIN_SIMILARITY or runner_up >= best_score:
+            return None
+        return best, best_score
+
+    def lookup(self, name: str) -> Optional[Dict]:
+        """
+        Catalog entry for a parsed medicine name
+
+        Returns:
+            {"drug", "alias", "similarity", "dosage", "strength"} or None when
+            the name isn't recognised. "strength" is the number written in the
+            name (or None); "dosage" is that strength with its unit when it is
+            one the drug comes in, else None.
+        """
+        key, strength = normalize_drug_name(name)
+        key = _match_key(key)
+        if not key:
+            CATALOG_LOOKUPS.inc(outcome="miss")
+            return None
+
+        similarity = 1.0
+        if key not in self._names:
+            match = self._fuzzy(key) if len(key) >= CATALOG_FUZZY_MIN_LENGTH else None
+            if match is None:
+                CATALOG_LOOKUPS.inc(outcome="miss")
+                return None
+            key, similarity = match
+        CATALOG_LOOKUPS.inc(outcome="exact" if similarity == 1.0 else "fuzzy")
+
+        index, alias = self._names[key]
+        drug = self.drugs[index]
+        dosage = None
+        if strength is not None and strength in drug.get("strengths", ()):
+            dosage = f"{strength:g}{drug['unit']}"
+        return {"drug": drug, "alias": alias, "similarity": round(similarity, 3), "dosage": dosage, "strength": strength}
+
+
+_catalog: Optional[DrugCatalog] = None
+
+
+def load_catalog(path: str = CATALOG_PATH) -> DrugCatalog:
+    """Load the bundled catalog and build its index (called at startup)"""
+    global _catalog
+    started = time.perf_counter()
+    try:
+        with open(path) as f:
+            drugs = json.load(f)["drugs"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[CATALOG] Could not load {path}: {str(e)}")
+        drugs = []
+    _catalog = DrugCatalog(drugs)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"[CATALOG] Loaded {len(_catalog)} drugs ({_catalog.name_count} names) in {elapsed_ms:.1f} ms")
+    return _catalog
+
+
+def get_catalog() -> DrugCatalog:
+    return _catalog if _catalog is not None else load_catalog()
+
+
+def lookup_medicine(name: str) -> Optional[Dict]:
+    """Catalog match for a medicine name, or None (also when the catalog is disabled)"""
+    if not CATALOG_ENABLED:
+        return None
+    return get_catalog().lookup(name)
+
+
+def apply_catalog_name(medicine: Dict, match: Dict) -> Dict:
+    """Give a matched medicine the canonical name, keeping the name as written"""
+    canonical = match["drug"]["name"]
+    written = medicine.get("medicine_name")
+    medicine = {**medicine, "medicine_name": canonical, "catalog_match": {
+        "name": canonical,
+        "alias": match["alias"],
+        "similarity": match["similarity"]
+    }}
+    if written != canonical:
+        medicine["name_as_written"] = written
+    return medicine
+
+
+def apply_catalog_defaults(medicine: Dict, match: Dict, missing_fields: List[str]) -> Tuple[Dict, List[str]]:
+    """
+    Fill a matched medicine's missing fields with the drug's usual dosing
+
+    The dosage is only filled when the medicine has none, from the strength
+    in the written name when there is one. A written strength the drug isn't
+    listed in is never replaced by the default. Frequency and timings are
+    only filled together: a prescribed frequency that has no timings (e.g.
+    "as needed") is left alone.
+
+    Returns:
+        Tuple of (medicine, fields filled); the input dict is not modified
+    """
+    drug = match["drug"]
+    filled = {}
+    dosage_missing = "dosage" in missing_fields and str(medicine.get("dosage") or "").strip().lower() in _NO_DOSAGE
+    if dosage_missing and match["dosage"]:
+        filled["dosage"] = match["dosage"]
+    elif dosage_missing and match.get("strength") is None and drug.get("dosage"):
+        filled["dosage"] = drug["dosage"]
+    if "frequency" in missing_fields and "timings" in missing_fields and drug.get("frequency"):
+        filled["frequency"] = drug["frequency"]
+        filled["timings"] = drug.get("timings") or frequency_timings(drug["frequency"])[1]
+    if not filled:
+        return medicine, []
+
+    notes = [
+        f"{field}: {', '.join(value) if isinstance(value, list) else value}"
+        for field, value in filled.items()
+    ]
+    return {
+        **medicine,
+        **filled,
+        "enriched": True,
+        "enrichment_confidence": "medium",
+        "enrichment_reasoning": f"Usual adult dosing for {drug['name']}",
+        "enrichment_notes": "Catalog default: " + ", ".join(notes),
+        "enrichment_source": "catalog"
+    }, list(filled)
+
+
+def catalog_context(match: Dict) -> str:
+    """Reference text for the enrichment prompt, used instead of a web search for catalog drugs"""
+    drug = match["drug"]
+    lines = [f"{drug['name']} (brands: {', '.join(drug.get('aliases', [])) or 'none listed'})"]
+    if drug.get("strengths"):
+        lines.append("Available strengths: " + ", ".join(f"{s:g}{drug['unit']}" for s in drug["strengths"]))
+    if drug.get("dosage"):
+        lines.append(f"Usual adult dose: {drug['dosage']}")
+    if drug.get("frequency"):
+        lines.append(f"Usual frequency: {drug['frequency']}")
+    return "\n".join(lines)
@@ -0,0 +1,207 @@
+"""
+Circuit Breakers
+One breaker per external dependency (OCR.space, Groq, Tavily). Each tracks
+the error rate and latency of recent calls; when too many fail or are slow the
+circuit opens and calls fail fast (CircuitOpenError) so callers can fall back
+instead of waiting out timeouts. After a cool-down a single half-open probe is
+let through; its success closes the circuit again. Calls that were already
+running when the circuit opened don't decide the half-open state.
+"""
+
+import os
+import time
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+from prescription.metrics import Counter
+
+load_dotenv()
+
+CIRCUIT_BREAKERS_ENABLED = os.getenv("CIRCUIT_BREAKERS_ENABLED", "true").lower() == "true"
+# Rolling window the error rate is computed over
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+# Calls needed in the window before the breaker may open
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+# Fraction of failed (or slow) calls that opens the circuit
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+# How long an open circuit fails fast before letting a probe through
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+CIRCUIT_REJECTIONS = Counter(
+    "medimind_circuit_rejections_total",
+    "Calls failed fast because a dependency's circuit was open",
+    ("breaker",)
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "medimind_circuit_transitions_total",
+    "Circuit breaker state changes",
+    ("breaker", "state")
+)
+
+_breakers: List["CircuitBreaker"] = []
+
+
+class CircuitOpenError(Exception):
+    """The dependency's circuit is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker for one dependency. Calls slower than
+    slow_call_seconds count as failures even when they succeed.
+    """
+
+    def __init__(self, name: str, slow_call_seconds: float):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.rejected = 0
+        # Ticket of the half-open probe call, if one is running
+        self._probe: Optional[int] = None
+        self._tickets = itertools.count(1)
+        # (finished_at, failed, elapsed_seconds)
+        self._calls: deque = deque()
+        _breakers.append(self)
+
+    def _prune(self, now: float):
+        while self._calls and self._calls[0][0] < now - CIRCUIT_WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            print(f"[CIRCUIT] {self.name}: {self.state} -> {state}")
+            self.state = state
+            CIRCUIT_TRANSITIONS.inc(breaker=self.name, state=state)
+
+    def is_open(self) -> bool:
+        """Open and still cooling down (calls would be rejected)"""
+        return (CIRCUIT_BREAKERS_ENABLED and self.state == OPEN
+                and time.time() - self.opened_at < CIRCUIT_OPEN_SECONDS)
+
+    def _reject(self) -> CircuitOpenError:
+        self.rejected += 1
+        CIRCUIT_REJECTIONS.inc(breaker=self.name)
+        return CircuitOpenError(f"{self.name} circuit is open")
+
+    def check(self):
+        """Fail fast before doing any preparatory work for a call that would be rejected"""
+        if self.is_open():
+            raise self._reject()
+
+    def allow(self) -> Optional[int]:
+        """
+        Whether a call may go ahead now (claims the probe slot when half-open)
+
+        Returns:
+            A ticket to pass to record()/release(), or None when the call is rejected
+        """
+        ticket = next(self._tickets)
+        if not CIRCUIT_BREAKERS_ENABLED or self.state == CLOSED:
+            return ticket
+        if self.state == OPEN and time.time() - self.opened_at >= CIRCUIT_OPEN_SECONDS:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN and self._probe is None:
+            self._probe = ticket
+            return ticket
+        return None
+
+    def record(self, failed: bool, elapsed: float, ticket: Optional[int] = None):
+        """Report a finished call's outcome and duration (ticket from allow())"""
+        failed = failed or elapsed >= self.slow_call_seconds
+        now = time.time()
+
+        if self.state == HALF_OPEN:
+            # Only the probe decides; stragglers started before the circuit opened are ignored
+            if ticket is None or ticket != self._probe:
+                return
+            self._probe = None
+            if failed:
+                self.opened_at = now
+                self._transition(OPEN)
+            else:
+                self._calls.clear()
+                self._transition(CLOSED)
+            return
+
+        self._calls.append((now, failed, elapsed))
+        self._prune(now)
+        if self.state == CLOSED and len(self._calls) >= CIRCUIT_MIN_CALLS:
+            failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+            if failures / len(self._calls) >= CIRCUIT_FAILURE_RATE:
+                self.opened_at = now
+                self._transition(OPEN)
+
+    def release(self, ticket: Optional[int] = None):
+        """Give back a claimed probe slot without an outcome (e.g. the call was cancelled)"""
+        if self.state == HALF_OPEN and ticket is not None and ticket == self._probe:
+            self._probe = None
+
+    @contextmanager
+    def guard(self, is_failure=None):
+        """
+        Run the enclosed call through the breaker
+
+        Args:
+            is_failure: Optional predicate on a raised exception; exceptions it
+                rejects (e.g. a 400 for a bad request) don't count against the
+                dependency. By default every exception counts.
+
+        Raises:
+            CircuitOpenError without running the call when the circuit is open
+        """
+        ticket = self.allow()
+        if ticket is None:
+            raise self._reject()
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(is_failure is None or is_failure(e), time.perf_counter() - started, ticket)
+            raise
+        except BaseException:
+            # Cancelled (caller timeout/disconnect): only counts if it was already slow
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.slow_call_seconds:
+                self.record(True, elapsed, ticket)
+            else:
+                self.release(ticket)
+            raise
+        else:
+            self.record(False, time.perf_counter() - started, ticket)
+
+    def status(self) -> dict:
+        now = time.time()
+        self._prune(now)
+        calls = len(self._calls)
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        latencies = sorted(elapsed for _, _, elapsed in self._calls)
+        status = {
+            "state": self.state,
+            "calls": calls,
+            "failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+            "rejected": self.rejected,
+        }
+        if self.state == OPEN:
+            status["retry_in_seconds"] = round(max(0.0, self.opened_at + CIRCUIT_OPEN_SECONDS - now), 1)
+        return status
+
+
+def breaker_states() -> Dict[str, dict]:
+    """State of every dependency's breaker, for /health"""
+    return {breaker.name: breaker.status() for breaker in _breakers}
+
+
+# Calls slower than these count as failures
+ocr_breaker = CircuitBreaker("ocr.space", float(os.getenv("OCR_SLOW_CALL_SECONDS", "15")))
+groq_breaker = CircuitBreaker("groq", float(os.getenv("GROQ_SLOW_CALL_SECONDS", "20")))
+tavily_breaker = CircuitBreaker("tavily", float(os.getenv("TAVILY_SLOW_CALL_SECONDS", "6")))
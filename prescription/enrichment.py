@@ -4,80 +4,101 @@ Uses LLM with web search for prescription parsing and enrichment
 """
 
 import os
-import json
-from typing import List, Dict, Optional, Tuple
+import re
+import time
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
+from db.cache import RedisLRUCache
+from prescription.catalog import apply_catalog_defaults, apply_catalog_name, catalog_context, lookup_medicine
+from prescription.circuit import groq_breaker, tavily_breaker
+from prescription.json_stream import JSONArrayStreamDecoder
+from prescription.llm_schema import validate_medicine
+from prescription.llm import (
+    LLM_FAST_MODEL, LLM_LARGE_MODEL, LLM_TIERING_ENABLED, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+    chat_completion, llm_available, tiered_json_completion
+)
+from prescription.metrics import register_cache, request_elapsed, timed_stage
+from prescription.planner import (
+    ADVANCED, BASIC, SEARCH_MAX_RESULTS, plan_searches, record_outcomes, record_search, search_timeout
+)
+from prescription.rules import compact_ocr_text, complete_from_rules, estimate_tokens, medicine_schema_errors
+
 load_dotenv()
 
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "")
+# Override the Tavily API host (e.g. a local stand-in server for benchmarks)
+TAVILY_API_BASE_URL = os.getenv("TAVILY_API_BASE_URL", "")
 
-groq_client = None
-tavily_client = None
+# Medicines enriched at the same time (each is a search + an LLM call)
+ENRICHMENT_CONCURRENCY = int(os.getenv("ENRICHMENT_CONCURRENCY", "4"))
+# Web search budget per medicine; on timeout the LLM runs without search context
+ENRICHMENT_SEARCH_TIMEOUT_SECONDS = float(os.getenv("ENRICHMENT_SEARCH_TIMEOUT_SECONDS", "8"))
+# LLM budget per medicine; on timeout the medicine is kept as parsed
+ENRICHMENT_TIMEOUT_SECONDS = float(os.getenv("ENRICHMENT_TIMEOUT_SECONDS", "20"))
+# Enrich all incomplete medicines of a prescription in one LLM request
+ENRICHMENT_BATCH_ENABLED = os.getenv("ENRICHMENT_BATCH_ENABLED", "true").lower() == "true"
+# Budget for the batch request plus the individual retries after it
+ENRICHMENT_BATCH_TIMEOUT_SECONDS = float(os.getenv("ENRICHMENT_BATCH_TIMEOUT_SECONDS", "30"))
+ENRICHMENT_BATCH_MAX_TOKENS = int(os.getenv("ENRICHMENT_BATCH_MAX_TOKENS", "4000"))
 
-try:
-    from groq import Groq
-    if GROQ_API_KEY:
-        groq_client = Groq(api_key=GROQ_API_KEY)
-except ImportError:
-    print("[ENRICHMENT] Warning: groq package not installed")
+# Shared medicine-knowledge cache: normalized name + missing fields -> LLM enrichment data
+MEDICINE_CACHE_ENABLED = os.getenv("MEDICINE_CACHE_ENABLED", "true").lower() == "true"
+MEDICINE_CACHE_TTL_SECONDS = int(os.getenv("MEDICINE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Answers that leave a field undetermined are retried sooner
+MEDICINE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("MEDICINE_CACHE_NEGATIVE_TTL_SECONDS", str(24 * 3600)))
+MEDICINE_CACHE_MAX_ENTRIES = int(os.getenv("MEDICINE_CACHE_MAX_ENTRIES", "2000"))
+medicine_cache = register_cache(
+    RedisLRUCache("medicine", MEDICINE_CACHE_TTL_SECONDS, MEDICINE_CACHE_MAX_ENTRIES)
+)
+
+# Web search results by normalized name + missing fields (reused when the LLM step didn't cache an answer)
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+search_cache = register_cache(RedisLRUCache("search", SEARCH_CACHE_TTL_SECONDS, SEARCH_CACHE_MAX_ENTRIES))
+
+# Parsing model(s) and prompt revision; bump PARSE_PROMPT_VERSION whenever the parsing
+# prompt changes so cached results from the old prompt are no longer used
+PARSE_MODEL = f"{LLM_FAST_MODEL}>{LLM_LARGE_MODEL}" if LLM_TIERING_ENABLED else LLM_LARGE_MODEL
+PARSE_PROMPT_VERSION = "2"
+# Fraction of the fast model's medicines that must pass schema/vocabulary checks
+PARSE_FAST_MIN_VALID_RATIO = float(os.getenv("PARSE_FAST_MIN_VALID_RATIO", "1.0"))
+# Lowest self-reported confidence accepted from the fast model's enrichment answers
+ENRICHMENT_FAST_MIN_CONFIDENCE = os.getenv("ENRICHMENT_FAST_MIN_CONFIDENCE", "medium").lower()
+_CONFIDENCE_LEVELS = {"low": 0, "medium": 1, "high": 2}
+# Parse-result cache keyed by normalized OCR text
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+PARSE_CACHE_TTL_SECONDS = int(os.getenv("PARSE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "5000"))
+parse_cache = register_cache(RedisLRUCache("parse", PARSE_CACHE_TTL_SECONDS, PARSE_CACHE_MAX_ENTRIES))
+
+tavily_client = None
 
+# Async client so enrichment never blocks the event loop (Groq calls go through prescription.llm)
 try:
-    from tavily import TavilyClient
+    from tavily import AsyncTavilyClient
     if TAVILY_API_KEY:
-        tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+        tavily_client = AsyncTavilyClient(api_key=TAVILY_API_KEY, api_base_url=TAVILY_API_BASE_URL or None)
 except ImportError:
     print("[ENRICHMENT] Warning: tavily-python package not installed")
 
 
-def _truncate_ocr_text(raw_text: str, max_chars: int = 8000) -> str:
-    """
-    Intelligently truncate OCR text to fit within LLM token limits.
-    
-    Strategy:
-    - If text is within limit, return as-is
-    - Otherwise, take the first 5000 chars (patient info + main medicines)
-      and the last 3000 chars (may contain trailing prescriptions)
-    - This keeps the most medicine-relevant portions while dropping
-      OCR noise, headers, disclaimers, and repeated content
-    """
-    if len(raw_text) <= max_chars:
-        return raw_text
-    
-    head_size = int(max_chars * 0.6)  # 60% from start
-    tail_size = max_chars - head_size  # 40% from end
-    
-    truncated = (
-        raw_text[:head_size]
-        + "\n\n... [TEXT TRUNCATED — MIDDLE SECTION OMITTED FOR BREVITY] ...\n\n"
-        + raw_text[-tail_size:]
-    )
-    
-    print(f"[PARSE] Truncated OCR text from {len(raw_text)} to ~{max_chars} chars")
-    return truncated
+def parse_cache_key(text: str, model: str = PARSE_MODEL) -> str:
+    """Hash of whitespace/case-normalized prompt text plus prompt version and model"""
+    normalized = re.sub(r"\s+", " ", text).strip().lower()
+    return hashlib.sha256(f"{PARSE_PROMPT_VERSION}|{model}|{normalized}".encode("utf-8")).hexdigest()
 
 
-def parse_prescription_with_groq(raw_text: str) -> List[Dict]:
-    """
-    Use Groq LLM to intelligently parse prescription text and extract all medicines
-    This replaces manual regex parsing with AI-powered extraction
-    
-    Args:
-        raw_text: Raw OCR text from Sarvam AI
-        
-    Returns:
-        List of medicine dictionaries with structured data
-    """
-    if not groq_client:
-        return []
-    
-    try:
-        # Truncate text if too long to avoid Groq 413 errors (token limit)
-        processed_text = _truncate_ocr_text(raw_text)
-        
-        prompt = f"""You are an expert medical prescription parser. Analyze the following prescription text extracted via OCR and identify ALL medicines.
+PARSE_SYSTEM_PROMPT = "You are an expert medical prescription parser. Extract structured medicine data from OCR text accurately. Always return valid JSON."
+
+
+def build_parse_prompt(processed_text: str) -> str:
+    """User prompt asking the LLM to extract every medicine from OCR text"""
+    return f"""You are an expert medical prescription parser. Analyze the following prescription text extracted via OCR and identify ALL medicines.
 
 RAW PRESCRIPTION TEXT:
 ```
@@ -120,32 +141,95 @@ RESPOND ONLY WITH VALID JSON (no markdown, no explanations):
   "total_found": number
 }}"""
 
+
+async def _prepare_parse(raw_text: str) -> Tuple[str, str, Optional[List[Dict]]]:
+    """
+    Compact the OCR text and look it up in the parse cache
+
+    Returns:
+        Tuple of (processed_text, cache_key, cached_medicines or None)
+    """
+    # Drop letterhead/contact noise and fit a token budget (also avoids Groq 413 errors)
+    processed_text = compact_ocr_text(raw_text)
+    print(f"[PARSE] Compacted OCR text from ~{estimate_tokens(raw_text)} to ~{estimate_tokens(processed_text)} tokens")
+
+    cache_key = parse_cache_key(processed_text)
+    if PARSE_CACHE_ENABLED:
+        cached = await parse_cache.get(cache_key)
+        if cached is not None:
+            print(f"[PARSE] Cache hit for text {cache_key[:12]} ({len(cached['medicines'])} medicines)")
+            return processed_text, cache_key, cached["medicines"]
+    return processed_text, cache_key, None
+
+
+def _parse_answer_problem(data: Dict) -> Optional[str]:
+    """Why a parse answer should go to the larger model, or None if it is acceptable"""
+    medicines = data.get("medicines") if isinstance(data, dict) else None
+    if not isinstance(medicines, list):
+        return "no medicines list"
+    if not medicines:
+        return "no medicines found"
+    invalid = sum(1 for medicine in medicines if medicine_schema_errors(medicine))
+    if (len(medicines) - invalid) / len(medicines) < PARSE_FAST_MIN_VALID_RATIO:
+        return f"{invalid}/{len(medicines)} medicines fail schema checks"
+    return None
+
+
+async def _store_parse(cache_key: str, medicines: List[Dict], model: str = PARSE_MODEL):
+    # Only successful parses are cached; empty results may be transient
+    if PARSE_CACHE_ENABLED and medicines:
+        await parse_cache.set(cache_key, {
+            "medicines": medicines,
+            "model": model,
+            "prompt_version": PARSE_PROMPT_VERSION,
+            "created_at": datetime.utcnow().isoformat()
+        })
+
+
+async def parse_prescription_with_groq(raw_text: str) -> List[Dict]:
+    """
+    Use Groq LLM to intelligently parse prescription text and extract all medicines
+    This replaces manual regex parsing with AI-powered extraction
+    
+    Args:
+        raw_text: Raw OCR text from Sarvam AI
+        
+    Returns:
+        List of medicine dictionaries with structured data
+    """
+    if not llm_available():
+        return []
+    
+    try:
+        processed_text, cache_key, cached = await _prepare_parse(raw_text)
+        if cached is not None:
+            return cached
+
         print(f"[PARSE] Sending raw text to Groq for structured extraction...")
         
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        # Small model first; the large model only if its answer fails validation
+        parsed_data, model = await tiered_json_completion(
+            "parse",
+            _parse_answer_problem,
+            priority=PRIORITY_INTERACTIVE,
             messages=[
                 {
                     "role": "system",
-                    "content": "You are an expert medical prescription parser. Extract structured medicine data from OCR text accurately. Always return valid JSON."
+                    "content": PARSE_SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
-                    "content": prompt
+                    "content": build_parse_prompt(processed_text)
                 }
             ],
             temperature=0.1,  # Very low for consistent parsing
-            max_tokens=2000,
-            response_format={"type": "json_object"}
+            max_tokens=2000
         )
         
-        # Parse Groq response
-        groq_response = response.choices[0].message.content
-        parsed_data = json.loads(groq_response)
-        
         medicines = parsed_data.get("medicines", [])
-        print(f"[PARSE] Extracted {len(medicines)} medicines")
-        
+        print(f"[PARSE] Extracted {len(medicines)} medicines ({model})")
+
+        await _store_parse(cache_key, medicines, model)
         return medicines
         
     except Exception as e:
@@ -153,6 +237,62 @@ RESPOND ONLY WITH VALID JSON (no markdown, no explanations):
         return []
 
 
+async def stream_parse_prescription_with_groq(raw_text: str) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of parse_prescription_with_groq: yields each medicine as
+    soon as the streamed completion closes its JSON object
+
+    Groq can't combine JSON mode with streaming, so this relies on the prompt
+    for JSON output. A stream that fails midway ends early and isn't cached.
+    """
+    if not llm_available():
+        return
+
+    try:
+        processed_text, cache_key, cached = await _prepare_parse(raw_text)
+    except Exception as e:
+        print(f"[PARSE] Error: {str(e)}")
+        return
+    if cached is not None:
+        for medicine in cached:
+            yield medicine
+        return
+
+    print(f"[PARSE] Streaming structured extraction from Groq...")
+    decoder = JSONArrayStreamDecoder("medicines")
+    medicines = []
+    try:
+        # Medicines are shown as they stream, so there is no validate-then-escalate
+        # step here: stream from the large model directly
+        stream = await chat_completion(
+            priority=PRIORITY_INTERACTIVE,
+            model=LLM_LARGE_MODEL,
+            messages=[
+                {"role": "system", "content": PARSE_SYSTEM_PROMPT},
+                {"role": "user", "content": build_parse_prompt(processed_text)}
+            ],
+            temperature=0.1,
+            max_tokens=2000,
+            stream=True
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            for entry in decoder.feed(delta):
+                medicine = validate_medicine(entry)
+                if medicine is None:
+                    continue
+                medicines.append(medicine)
+                yield medicine
+    except Exception as e:
+        print(f"[PARSE] Stream error after {len(medicines)} medicine(s): {str(e)}")
+        return
+
+    print(f"[PARSE] Streamed {len(medicines)} medicines")
+    await _store_parse(cache_key, medicines, LLM_LARGE_MODEL)
+
+
 def detect_missing_information(medicine: Dict) -> List[str]:
     """
     Detect what critical information is missing from a medicine entry
@@ -180,13 +320,18 @@ def detect_missing_information(medicine: Dict) -> List[str]:
     return missing_fields
 
 
-def search_medicine_information(medicine_name: str, missing_fields: List[str]) -> Optional[str]:
+async def search_medicine_information(
+    medicine_name: str,
+    missing_fields: List[str],
+    depth: str = ADVANCED
+) -> Optional[str]:
     """
     Search the web for medicine information to fill missing fields
     
     Args:
         medicine_name: Name of the medicine
         missing_fields: List of fields that need information
+        depth: Tavily search depth, "basic" or "advanced" (chosen by the planner)
         
     Returns:
         Search results as formatted string, or None if search fails
@@ -200,12 +345,14 @@ def search_medicine_information(medicine_name: str, missing_fields: List[str]) -
         query = f"{medicine_name} medicine standard {fields_str} typical prescription information"
         
         # Perform search
-        search_response = tavily_client.search(
-            query=query,
-            search_depth="advanced",
-            max_results=3,
-            include_answer=True
-        )
+        # An open circuit raises here and the LLM runs without search context
+        with timed_stage("enrich_search", medicine=medicine_name, depth=depth), tavily_breaker.guard():
+            search_response = await tavily_client.search(
+                query=query,
+                search_depth=depth,
+                max_results=SEARCH_MAX_RESULTS[depth],
+                include_answer=True
+            )
         
         # Format results
         results = []
@@ -215,7 +362,7 @@ def search_medicine_information(medicine_name: str, missing_fields: List[str]) -
             results.append(f"Summary: {search_response['answer']}")
         
         # Add top results
-        for result in search_response.get("results", [])[:3]:
+        for result in search_response.get("results", [])[:SEARCH_MAX_RESULTS[depth]]:
             results.append(f"Source: {result.get('title', 'Unknown')}\n{result.get('content', '')}")
         
         search_context = "\n\n".join(results)
@@ -226,47 +373,9 @@ def search_medicine_information(medicine_name: str, missing_fields: List[str]) -
         return None
 
 
-def enrich_medicine_with_llm(
-    medicine: Dict, 
-    missing_fields: List[str], 
-    search_context: Optional[str] = None
-) -> Tuple[Dict, bool]:
-    """
-    Use LLM to fill in missing medicine information based on web search and knowledge
-    
-    Args:
-        medicine: Original medicine dictionary
-        missing_fields: List of fields that need enrichment
-        search_context: Optional web search results
-        
-    Returns:
-        Tuple of (enriched_medicine_dict, success_flag)
-    """
-    if not groq_client:
-        return medicine, False
-    
-    try:
-        medicine_name = medicine.get("medicine_name", "Unknown")
-        
-        # Build the prompt
-        prompt = f"""You are a medical information assistant. A prescription has been scanned but some information is missing.
-
-Medicine Name: {medicine_name}
-Current Information:
-- Dosage: {medicine.get("dosage", "Unknown")}
-- Frequency: {medicine.get("frequency", "Unknown")}
-- Timings: {medicine.get("timings", [])}
-
-Missing Fields: {", ".join(missing_fields)}
-"""
-        
-        if search_context:
-            prompt += f"\n\nREAL-TIME WEB SEARCH RESULTS (Medical Sources):\n{search_context}\n"
-        
-        prompt += """
-Based on the web search results and standard medical practices, fill in the missing fields.
+ENRICHMENT_SYSTEM_PROMPT = "You are a medical expert that fills in missing prescription data using web search results and medical knowledge. Prioritize information from web sources when available. Always be conservative for patient safety."
 
-CRITICAL RULES:
+ENRICHMENT_RULES = """CRITICAL RULES:
 1. Prioritize information from web search results (if available)
 2. Only fill in standard, commonly prescribed values for this specific medicine
 3. For dosage: Provide typical adult dosage (e.g., "500mg", "10mg", "5ml", "2 tablets")
@@ -274,24 +383,66 @@ CRITICAL RULES:
 5. For timings: Use combinations from: "morning", "afternoon", "evening", "night"
 6. If unclear or unsafe to guess, return "Unable to determine"
 7. Patient safety is CRITICAL - be conservative
+"""
 
-Respond ONLY with a JSON object:
-{
-  "dosage": "value or Unable to determine",
+ENRICHMENT_FIELDS_SCHEMA = """  "dosage": "value or Unable to determine",
   "frequency": "value or Unable to determine",
   "timings": ["morning", "evening"] or [],
   "confidence": "high/medium/low",
   "reasoning": "Brief explanation referencing web sources if used"
-}
 """
-        
-        # Call Groq API
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",  # Fast and accurate Groq model
+
+
+def _describe_medicine(medicine: Dict, missing_fields: List[str], search_context: Optional[str]) -> str:
+    """Prompt section describing one medicine, its known fields and search results"""
+    description = f"""Medicine Name: {medicine.get("medicine_name", "Unknown")}
+Current Information:
+- Dosage: {medicine.get("dosage", "Unknown")}
+- Frequency: {medicine.get("frequency", "Unknown")}
+- Timings: {medicine.get("timings", [])}
+
+Missing Fields: {", ".join(missing_fields)}
+"""
+    if search_context:
+        description += f"\n\nREAL-TIME WEB SEARCH RESULTS (Medical Sources):\n{search_context}\n"
+    return description
+
+
+async def request_enrichment_data(
+    medicine: Dict,
+    missing_fields: List[str],
+    search_context: Optional[str] = None
+) -> Dict:
+    """
+    Ask the LLM for the missing fields of one medicine
+
+    Returns:
+        Raw enrichment data (dosage, frequency, timings, confidence, reasoning)
+
+    Raises:
+        Exception if the LLM call fails or returns invalid JSON
+    """
+    medicine_name = medicine.get("medicine_name", "Unknown")
+    
+    # Build the prompt
+    prompt = (
+        "You are a medical information assistant. A prescription has been scanned but some information is missing.\n\n"
+        + _describe_medicine(medicine, missing_fields, search_context)
+        + "\nBased on the web search results and standard medical practices, fill in the missing fields.\n\n"
+        + ENRICHMENT_RULES
+        + "\nRespond ONLY with a JSON object:\n{\n" + ENRICHMENT_FIELDS_SCHEMA + "}\n"
+    )
+    
+    # Call Groq API (small model first, large model if the answer isn't usable)
+    with timed_stage("enrich_llm", medicine=medicine_name):
+        data, _ = await tiered_json_completion(
+            "enrich",
+            lambda entry: _enrichment_answer_problem(entry, missing_fields),
+            priority=PRIORITY_BACKGROUND,
             messages=[
                 {
                     "role": "system",
-                    "content": "You are a medical expert that fills in missing prescription data using web search results and medical knowledge. Prioritize information from web sources when available. Always be conservative for patient safety."
+                    "content": ENRICHMENT_SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -299,106 +450,480 @@ Respond ONLY with a JSON object:
                 }
             ],
             temperature=0.3,  # Lower temperature for more consistent medical info
-            max_tokens=500,
-            response_format={"type": "json_object"}
+            max_tokens=500
         )
-        
-        # Parse response
-        llm_response = response.choices[0].message.content
-        enrichment_data = json.loads(llm_response)
-        
-        # Create enriched medicine dictionary
-        enriched_medicine = medicine.copy()
-        was_enriched = False
-        enrichment_notes = []
-        
-        # Apply enrichments only if LLM provided valid data
-        if "dosage" in missing_fields and enrichment_data.get("dosage") != "Unable to determine":
-            enriched_medicine["dosage"] = enrichment_data["dosage"]
-            enrichment_notes.append(f"dosage: {enrichment_data['dosage']}")
+    return data
+
+
+async def request_batch_enrichment_data(
+    items: List[Tuple[Dict, List[str], Optional[str]]]
+) -> Dict[int, Dict]:
+    """
+    Ask the LLM for the missing fields of several medicines in one request
+
+    Args:
+        items: (medicine, missing_fields, search_context) per medicine
+
+    Returns:
+        Enrichment data by position in items, only for entries that passed
+        validation (missing positions should be retried individually)
+
+    Raises:
+        Exception if the LLM call fails or returns invalid JSON
+    """
+    sections = [
+        f"### Medicine {index}\n" + _describe_medicine(medicine, missing_fields, search_context)
+        for index, (medicine, missing_fields, search_context) in enumerate(items)
+    ]
+    prompt = (
+        f"You are a medical information assistant. A prescription has been scanned but some information is missing for the {len(items)} medicines below.\n\n"
+        + "\n".join(sections)
+        + "\nBased on the web search results and standard medical practices, fill in the missing fields of each medicine.\n\n"
+        + ENRICHMENT_RULES
+        + "\nRespond ONLY with a JSON object containing exactly one entry per medicine number above:\n"
+        + '{\n"medicines": [\n {\n  "index": 0,\n' + ENRICHMENT_FIELDS_SCHEMA + " }\n]\n}\n"
+    )
+
+    def batch_problem(data: Dict) -> Optional[str]:
+        valid = _valid_batch_entries(data, items)
+        unusable = [i for i, (_, missing_fields, _) in enumerate(items)
+                    if i not in valid or _enrichment_answer_problem(valid[i], missing_fields)]
+        return f"{len(unusable)}/{len(items)} answers unusable" if unusable else None
+
+    with timed_stage("enrich_llm_batch", medicines=len(items)):
+        data, _ = await tiered_json_completion(
+            "enrich_batch",
+            batch_problem,
+            priority=PRIORITY_BACKGROUND,
+            messages=[
+                {"role": "system", "content": ENRICHMENT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=min(ENRICHMENT_BATCH_MAX_TOKENS, 300 * len(items) + 200)
+        )
+    return _valid_batch_entries(data, items)
+
+
+def _valid_batch_entries(data: Dict, items: List[Tuple[Dict, List[str], Optional[str]]]) -> Dict[int, Dict]:
+    """Batch answer entries by index, keeping only those that cover their medicine's missing fields"""
+    entries = data.get("medicines") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError("batch response has no 'medicines' list")
+
+    valid = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("index"), int):
+            continue
+        index = entry["index"]
+        if 0 <= index < len(items) and index not in valid and _valid_enrichment_entry(entry, items[index][1]):
+            valid[index] = entry
+    return valid
+
+
+def _enrichment_answer_problem(entry: Dict, missing_fields: List[str]) -> Optional[str]:
+    """Why an enrichment answer should go to the larger model, or None if it is acceptable"""
+    if not isinstance(entry, dict) or not _valid_enrichment_entry(entry, missing_fields):
+        return "missing fields"
+    confidence = str(entry.get("confidence", "")).strip().lower()
+    if _CONFIDENCE_LEVELS.get(confidence, 0) < _CONFIDENCE_LEVELS.get(ENRICHMENT_FAST_MIN_CONFIDENCE, 1):
+        return f"confidence {confidence or 'missing'}"
+    # A field the small model couldn't determine may still be known to the large one
+    undetermined = [f for f in missing_fields if f != "timings" and entry[f] == "Unable to determine"]
+    if undetermined:
+        return f"undetermined {', '.join(undetermined)}"
+    # Check the filled fields against the frequency/timing vocabulary
+    candidate = {
+        "medicine_name": "medicine",
+        "dosage": "",
+        "frequency": entry["frequency"] if "frequency" in missing_fields else "Unknown",
+        "timings": entry["timings"] if "timings" in missing_fields else [],
+    }
+    errors = medicine_schema_errors(candidate)
+    if errors:
+        return f"invalid {', '.join(errors)}"
+    return None
+
+
+def _valid_enrichment_entry(entry: Dict, missing_fields: List[str]) -> bool:
+    """An answer must cover every missing field with the expected type"""
+    for field in missing_fields:
+        if field == "timings":
+            if not isinstance(entry.get("timings"), list):
+                return False
+        elif not isinstance(entry.get(field), str):
+            return False
+    return True
+
+
+def apply_enrichment(medicine: Dict, missing_fields: List[str], enrichment_data: Dict) -> Tuple[Dict, bool]:
+    """
+    Fill a medicine's missing fields from LLM enrichment data
+
+    Returns:
+        Tuple of (enriched_medicine_dict, success_flag)
+    """
+    # Create enriched medicine dictionary
+    enriched_medicine = medicine.copy()
+    was_enriched = False
+    enrichment_notes = []
+    
+    # Apply enrichments only if LLM provided valid data (an answer may omit a field)
+    for field in ("dosage", "frequency"):
+        value = enrichment_data.get(field)
+        if field in missing_fields and isinstance(value, str) and value and value != "Unable to determine":
+            enriched_medicine[field] = value
+            enrichment_notes.append(f"{field}: {value}")
             was_enriched = True
-        
-        if "frequency" in missing_fields and enrichment_data.get("frequency") != "Unable to determine":
-            enriched_medicine["frequency"] = enrichment_data["frequency"]
-            enrichment_notes.append(f"frequency: {enrichment_data['frequency']}")
+    
+    if "timings" in missing_fields and isinstance(enrichment_data.get("timings"), list):
+        valid_timings = ["morning", "afternoon", "evening", "night"]
+        llm_timings = [t for t in enrichment_data["timings"] if t in valid_timings]
+        if llm_timings:
+            enriched_medicine["timings"] = llm_timings
+            enrichment_notes.append(f"timings: {', '.join(llm_timings)}")
             was_enriched = True
+    
+    # Add metadata about enrichment
+    if was_enriched:
+        enriched_medicine["enriched"] = True
+        enriched_medicine["enrichment_confidence"] = enrichment_data.get("confidence", "medium")
+        enriched_medicine["enrichment_reasoning"] = enrichment_data.get("reasoning", "")
+        enriched_medicine["enrichment_notes"] = "AI-enriched: " + ", ".join(enrichment_notes)
+    
+    return enriched_medicine, was_enriched
+
+
+async def enrich_medicine_with_llm(
+    medicine: Dict, 
+    missing_fields: List[str], 
+    search_context: Optional[str] = None
+) -> Tuple[Dict, bool]:
+    """
+    Use LLM to fill in missing medicine information based on web search and knowledge
+    
+    Args:
+        medicine: Original medicine dictionary
+        missing_fields: List of fields that need enrichment
+        search_context: Optional web search results
         
-        if "timings" in missing_fields and enrichment_data.get("timings"):
-            valid_timings = ["morning", "afternoon", "evening", "night"]
-            llm_timings = [t for t in enrichment_data["timings"] if t in valid_timings]
-            if llm_timings:
-                enriched_medicine["timings"] = llm_timings
-                enrichment_notes.append(f"timings: {', '.join(llm_timings)}")
-                was_enriched = True
-        
-        # Add metadata about enrichment
-        if was_enriched:
-            enriched_medicine["enriched"] = True
-            enriched_medicine["enrichment_confidence"] = enrichment_data.get("confidence", "medium")
-            enriched_medicine["enrichment_reasoning"] = enrichment_data.get("reasoning", "")
-            enriched_medicine["enrichment_notes"] = "AI-enriched: " + ", ".join(enrichment_notes)
-        
-        return enriched_medicine, was_enriched
-        
+    Returns:
+        Tuple of (enriched_medicine_dict, success_flag)
+    """
+    if not llm_available():
+        return medicine, False
+    
+    try:
+        enrichment_data = await request_enrichment_data(medicine, missing_fields, search_context)
     except Exception as e:
         print(f"[ENRICHMENT] LLM error: {str(e)}")
         return medicine, False
+    return apply_enrichment(medicine, missing_fields, enrichment_data)
+
+
+def normalize_medicine_name(name: str) -> str:
+    """Cache key form of a medicine name: lowercase, dosage-form prefix and punctuation removed"""
+    name = re.sub(r"[^a-z0-9]+", " ", str(name).lower()).strip()
+    name = re.sub(r"^(tab|tablet|cap|capsule|syp|syrup|inj|injection)s?\b\s*", "", name)
+    return name
+
+
+def _medicine_cache_key(medicine_name: str, missing_fields: List[str]) -> str:
+    return f"{normalize_medicine_name(medicine_name)}|{','.join(sorted(missing_fields))}"
+
+
+async def _search_with_timeout(
+    medicine_name: str,
+    missing_fields: List[str],
+    depth: str,
+    timeout: float
+) -> Tuple[Optional[str], float]:
+    """Search within the timeout; returns (context or None, seconds taken)"""
+    started = time.perf_counter()
+    context = None
+    try:
+        context = await asyncio.wait_for(
+            search_medicine_information(medicine_name, missing_fields, depth),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        print(f"[ENRICHMENT] Search timed out for {medicine_name}, continuing without it")
+    elapsed = time.perf_counter() - started
+    record_search(depth, elapsed, bool(context))
+    return context, elapsed
 
 
-def enrich_medicines(medicines: List[Dict]) -> Tuple[List[Dict], Dict]:
+async def _request_with_timeout(
+    medicine: Dict,
+    missing_fields: List[str],
+    search_context: Optional[str],
+    timeout: float = ENRICHMENT_TIMEOUT_SECONDS
+) -> Optional[Dict]:
+    medicine_name = medicine.get("medicine_name", "Unknown")
+    try:
+        return await asyncio.wait_for(
+            request_enrichment_data(medicine, missing_fields, search_context),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        print(f"[ENRICHMENT] Timed out enriching {medicine_name} after {timeout:.1f}s")
+    except Exception as e:
+        print(f"[ENRICHMENT] LLM error: {str(e)}")
+    return None
+
+
+async def _request_batch_with_timeout(
+    items: List[Tuple[Dict, List[str], Optional[str]]]
+) -> Dict[int, Dict]:
+    try:
+        return await asyncio.wait_for(
+            request_batch_enrichment_data(items),
+            timeout=ENRICHMENT_BATCH_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        print(f"[ENRICHMENT] Batch request timed out after {ENRICHMENT_BATCH_TIMEOUT_SECONDS:g}s")
+    except Exception as e:
+        print(f"[ENRICHMENT] Batch request failed validation: {str(e)}")
+    return {}
+
+
+# Enrichment progress callback: (medicine_index, enriched_medicine, was_enriched) -> awaitable
+EnrichmentUpdate = Callable[[int, Dict, bool], Awaitable[None]]
+
+
+async def enrich_medicines(
+    medicines: List[Dict],
+    on_update: Optional[EnrichmentUpdate] = None
+) -> Tuple[List[Dict], Dict]:
     """
     Enrich medicines with missing information using Tavily web search + Groq LLM
+
+    Names are canonicalized against the drug catalog and catalog drugs get
+    their usual dosing locally, as do timings/frequency that follow from each
+    other. Cached answers are reused; for the rest, web searches (or the
+    catalog entry, for catalog drugs) are gathered concurrently
+    (ENRICHMENT_CONCURRENCY at a time) and all medicines are then enriched in
+    one batched LLM request. Medicines whose batch answer is missing or
+    invalid fall back to individual calls, bounded by what is left of
+    ENRICHMENT_BATCH_TIMEOUT_SECONDS. The returned list keeps the original
+    order.
     
     Args:
         medicines: List of medicine dictionaries from Groq parsing
+        on_update: Optional async callback invoked for each medicine changed
+            locally (rules or catalog) and as each incomplete medicine is
+            resolved (from cache, batch or individual call)
         
     Returns:
         Tuple of (enriched_medicines_list, enrichment_stats)
     """
-    if not groq_client:
-        return medicines, {"enabled": False, "enriched_count": 0}
+    # Without any network call: canonical names and usual dosing for catalog
+    # drugs, and fields that follow from the others (timings <-> frequency)
+    locally_resolved = []
+    catalog_matches = {}
+    local_changes = {}
+    completed = []
+    for i, medicine in enumerate(medicines):
+        original = medicine
+        catalog_fields = []
+        match = lookup_medicine(medicine.get("medicine_name", ""))
+        if match is not None:
+            medicine = apply_catalog_name(medicine, match)
+        medicine, resolved_fields = complete_from_rules(medicine)
+        if resolved_fields:
+            locally_resolved.append({"name": medicine.get("medicine_name", "Unknown"), "fields": resolved_fields})
+        if match is not None:
+            medicine, catalog_fields = apply_catalog_defaults(medicine, match, detect_missing_information(medicine))
+            catalog_matches[i] = (match, {
+                "name_as_written": medicine.get("name_as_written", medicine["medicine_name"]),
+                "name": medicine["medicine_name"],
+                "similarity": match["similarity"],
+                "fields_added": catalog_fields
+            })
+        if medicine != original:
+            local_changes[i] = bool(resolved_fields or catalog_fields)
+        completed.append(medicine)
+    medicines = completed
+    if locally_resolved:
+        print(f"[ENRICHMENT] Resolved {len(locally_resolved)} medicine(s) locally from frequency/timings")
+    if catalog_matches:
+        print(f"[ENRICHMENT] Matched {len(catalog_matches)} medicine(s) in the drug catalog")
+    catalog_stats = {
+        "catalog_matched_count": len(catalog_matches),
+        "catalog_matches": [catalog_matches[i][1] for i in sorted(catalog_matches)]
+    }
+    if on_update is not None:
+        # Report local changes now; medicines still incomplete get another update once enriched
+        for i in sorted(local_changes):
+            await on_update(i, medicines[i], local_changes[i])
+
+    if not llm_available():
+        return medicines, {
+            "enabled": False,
+            "enriched_count": 0,
+            "locally_resolved_count": len(locally_resolved),
+            "locally_resolved": locally_resolved,
+            **catalog_stats
+        }
     
-    enriched_medicines = []
     enrichment_stats = {
         "enabled": True,
         "enriched_count": 0,
         "skipped_count": 0,
         "failed_count": 0,
+        "cache_hits": 0,
+        "llm_calls": 0,
+        "locally_resolved_count": len(locally_resolved),
+        "locally_resolved": locally_resolved,
+        **catalog_stats,
         "enriched_medicines": []
     }
     
-    for medicine in medicines:
-        medicine_name = medicine.get("medicine_name", "Unknown")
-        
-        # Detect missing information
-        missing_fields = detect_missing_information(medicine)
-        
-        if not missing_fields:
-            # Medicine has all required information
-            enriched_medicines.append(medicine)
-            enrichment_stats["skipped_count"] += 1
-            continue
-        
-        # Search web for medicine information
-        search_context = search_medicine_information(medicine_name, missing_fields)
-        
-        # Enrich with LLM
-        enriched_medicine, was_enriched = enrich_medicine_with_llm(
-            medicine, 
-            missing_fields, 
-            search_context
-        )
-        
-        enriched_medicines.append(enriched_medicine)
-        
+    # Detect missing information
+    missing = [detect_missing_information(medicine) for medicine in medicines]
+    incomplete = [i for i, fields in enumerate(missing) if fields]
+    enrichment_stats["skipped_count"] = len(medicines) - len(incomplete)
+
+    enriched_medicines = list(medicines)
+    enriched_entries = {}
+
+    async def finish(i: int, data: Optional[Dict], cache_result: bool):
+        """Apply one medicine's answer (None = no answer) and report it"""
+        medicine = medicines[i]
+        was_enriched = False
+        if data is not None:
+            enriched_medicine, was_enriched = apply_enrichment(medicine, missing[i], data)
+            enriched_medicines[i] = enriched_medicine
+            if MEDICINE_CACHE_ENABLED and cache_result:
+                # Partly filled answers expire like "Unable to determine" ones
+                complete = was_enriched and not detect_missing_information(enriched_medicine)
+                await medicine_cache.set(cache_keys[i], {
+                    "dosage": data.get("dosage"),
+                    "frequency": data.get("frequency"),
+                    "timings": data.get("timings") or [],
+                    "confidence": data.get("confidence"),
+                    "reasoning": data.get("reasoning", ""),
+                    "created_at": datetime.utcnow().isoformat()
+                }, ttl_seconds=None if complete else MEDICINE_CACHE_NEGATIVE_TTL_SECONDS)
+
         if was_enriched:
             enrichment_stats["enriched_count"] += 1
-            enrichment_stats["enriched_medicines"].append({
-                "name": medicine_name,
-                "fields_added": missing_fields,
-                "confidence": enriched_medicine.get("enrichment_confidence", "unknown")
-            })
+            enriched_entries[i] = {
+                "name": medicine.get("medicine_name", "Unknown"),
+                "fields_added": missing[i],
+                "confidence": enriched_medicines[i].get("enrichment_confidence", "unknown")
+            }
         else:
             enrichment_stats["failed_count"] += 1
-    
+        if on_update is not None:
+            await on_update(i, enriched_medicines[i], was_enriched)
+
+    cache_keys = {
+        i: _medicine_cache_key(medicines[i].get("medicine_name", "Unknown"), missing[i])
+        for i in incomplete
+    }
+    to_request = list(incomplete)
+    if MEDICINE_CACHE_ENABLED:
+        cached = await asyncio.gather(*[medicine_cache.get(cache_keys[i]) for i in incomplete])
+        for i, data in zip(incomplete, cached):
+            if data is not None:
+                enrichment_stats["cache_hits"] += 1
+                await finish(i, data, cache_result=False)
+        to_request = [i for i, data in zip(incomplete, cached) if data is None]
+
+    if to_request and groq_breaker.is_open():
+        # No LLM to use the answers: don't spend searches, keep the medicines as parsed
+        print(f"[ENRICHMENT] Groq circuit open, skipping {len(to_request)} medicine(s)")
+        enrichment_stats["circuit_open"] = True
+        for i in to_request:
+            await finish(i, None, cache_result=False)
+        to_request = []
+
+    semaphore = asyncio.Semaphore(max(1, ENRICHMENT_CONCURRENCY))
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    # Plan a web search per medicine that still needs an answer: none when the
+    # catalog or search cache has context (or the budget is short), else basic
+    # or advanced depth depending on what's missing
+    search_keys = {i: _medicine_cache_key(medicines[i].get("medicine_name", "Unknown"), missing[i]) for i in to_request}
+    cached_contexts = {}
+    if SEARCH_CACHE_ENABLED and to_request:
+        found = await asyncio.gather(*[search_cache.get(search_keys[i]) for i in to_request])
+        cached_contexts = {i: entry["context"] for i, entry in zip(to_request, found) if entry is not None}
+    elapsed = request_elapsed()
+    plans = dict(zip(to_request, plan_searches(
+        [{"missing_fields": missing[i], "catalog": i in catalog_matches, "cached": i in cached_contexts} for i in to_request],
+        elapsed,
+        ENRICHMENT_CONCURRENCY,
+        search_available=tavily_client is not None and not tavily_breaker.is_open()
+    )))
+    timeout = search_timeout(elapsed, ENRICHMENT_SEARCH_TIMEOUT_SECONDS)
+    if plans:
+        decisions = [plan["decision"] for plan in plans.values()]
+        summary = ", ".join(f"{decisions.count(d)} {d}" for d in sorted(set(decisions)))
+        print(f"[ENRICHMENT] Search plan: {summary} ({elapsed:.1f}s into the upload)")
+
+    searched = [i for i in to_request if plans[i]["decision"] in (BASIC, ADVANCED)]
+    results = await asyncio.gather(*[
+        bounded(_search_with_timeout(medicines[i].get("medicine_name", "Unknown"), missing[i], plans[i]["decision"], timeout))
+        for i in searched
+    ])
+    search_contexts = {i: None for i in to_request}
+    for i, (context, seconds) in zip(searched, results):
+        search_contexts[i] = context
+        plans[i]["search_ms"] = round(seconds * 1000)
+        if SEARCH_CACHE_ENABLED and context:
+            await search_cache.set(search_keys[i], {"context": context, "depth": plans[i]["decision"]})
+    for i in to_request:
+        if i in catalog_matches:
+            search_contexts[i] = catalog_context(catalog_matches[i][0])
+        elif i in cached_contexts:
+            search_contexts[i] = cached_contexts[i]
+
+    retry = to_request
+    retry_timeout = ENRICHMENT_TIMEOUT_SECONDS
+    if ENRICHMENT_BATCH_ENABLED and len(to_request) > 1:
+        batch_started = time.perf_counter()
+        enrichment_stats["llm_calls"] += 1
+        batch = await _request_batch_with_timeout(
+            [(medicines[i], missing[i], search_contexts[i]) for i in to_request]
+        )
+        for position, data in sorted(batch.items()):
+            await finish(to_request[position], data, cache_result=True)
+        retry = [i for position, i in enumerate(to_request) if position not in batch]
+        # Retries share the batch budget instead of getting a fresh per-medicine timeout
+        retry_timeout = min(
+            ENRICHMENT_TIMEOUT_SECONDS,
+            ENRICHMENT_BATCH_TIMEOUT_SECONDS - (time.perf_counter() - batch_started)
+        )
+        if retry and retry_timeout < 0.5:
+            print(f"[ENRICHMENT] Batch answered {len(batch)}/{len(to_request)}, no budget left to retry the rest")
+            for i in retry:
+                await finish(i, None, cache_result=False)
+            retry = []
+        elif retry:
+            print(f"[ENRICHMENT] Batch answered {len(batch)}/{len(to_request)}, retrying the rest individually ({retry_timeout:.1f}s left)")
+
+    # Individual calls: batching disabled, a single medicine, or invalid batch answers
+    enrichment_stats["llm_calls"] += len(retry)
+
+    async def request_one(i: int):
+        data = await bounded(_request_with_timeout(medicines[i], missing[i], search_contexts[i], retry_timeout))
+        await finish(i, data, cache_result=True)
+
+    await asyncio.gather(*[request_one(i) for i in retry])
+
+    plan_records = [{
+        "medicine": medicines[i].get("medicine_name", "Unknown"),
+        "missing_fields": missing[i],
+        **plans[i],
+        "enriched": i in enriched_entries,
+        "confidence": enriched_entries[i]["confidence"] if i in enriched_entries else None
+    } for i in sorted(plans)]
+    await record_outcomes(plan_records)
+    enrichment_stats["search_plan"] = plan_records
+    enrichment_stats["enriched_medicines"] = [enriched_entries[i] for i in sorted(enriched_entries)]
     return enriched_medicines, enrichment_stats
@@ -0,0 +1,200 @@
+"""
+Prescription Image Processing
+Quality validation and OCR-oriented normalization built on Pillow.
+"""
+
+import io
+import os
+from typing import BinaryIO, Optional, Tuple
+from dotenv import load_dotenv
+
+try:
+    from PIL import Image, ImageOps
+    import numpy as np
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("[INIT] PIL/Pillow not available - image quality validation disabled")
+
+load_dotenv()
+
+# OCR upload normalization: EXIF-rotate, grayscale, downscale, recompress
+OCR_NORMALIZE_ENABLED = os.getenv("OCR_NORMALIZE_ENABLED", "true").lower() == "true"
+# Longest side (px) sent to OCR; ~2000px keeps small print legible
+OCR_TARGET_LONG_EDGE = int(os.getenv("OCR_TARGET_LONG_EDGE", "2000"))
+# Byte budget for the OCR payload (OCR.space free tier rejects files over 1MB)
+OCR_TARGET_BYTES = int(os.getenv("OCR_TARGET_KB", "900")) * 1024
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+OCR_MIN_JPEG_QUALITY = 45
+
+# Quality analysis runs on a downsampled copy no larger than this (px)
+QUALITY_ANALYSIS_EDGE = int(os.getenv("QUALITY_ANALYSIS_EDGE", "512"))
+# Warning thresholds, calibrated for QUALITY_ANALYSIS_EDGE-sized images
+MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "20"))
+MIN_CONTRAST_RMS = float(os.getenv("QUALITY_MIN_CONTRAST", "0.05"))
+MIN_INK_RATIO = 0.005
+
+
+def _buffer_size(image: BinaryIO) -> int:
+    image.seek(0, os.SEEK_END)
+    size = image.tell()
+    image.seek(0)
+    return size
+
+def _analysis_array(img) -> "np.ndarray":
+    """Decode a reduced-resolution grayscale copy for quality metrics"""
+    # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale directly
+    img.draft("L", (QUALITY_ANALYSIS_EDGE, QUALITY_ANALYSIS_EDGE))
+    img = img.convert("L")
+    img.thumbnail((QUALITY_ANALYSIS_EDGE, QUALITY_ANALYSIS_EDGE), Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32)
+
+def _laplacian_variance(gray: "np.ndarray") -> float:
+    """Variance of the 4-neighbour Laplacian; low values mean a blurry image"""
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    lap = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    return float(lap.var())
+
+def _ink_ratio(gray: "np.ndarray") -> float:
+    """Fraction of pixels clearly darker than the paper (text/ink coverage)"""
+    paper_level = float(np.percentile(gray, 90))
+    return float(np.count_nonzero(gray < paper_level * 0.6) / gray.size)
+
+def validate_image_quality(image: BinaryIO) -> Tuple[bool, str, dict]:
+    """
+    Validate image quality before OCR processing
+
+    Metrics are computed on a reduced-resolution grayscale decode (at most
+    QUALITY_ANALYSIS_EDGE px on the long side), so a 12MP photo costs well
+    under 1MB of pixel memory instead of a full-resolution RGB array.
+    """
+    if not PIL_AVAILABLE:
+        return True, "Quality check skipped (PIL not available)", {}
+    
+    try:
+        image.seek(0)
+        img = Image.open(image)
+        
+        width, height = img.size
+        file_size = _buffer_size(image)
+        
+        quality_metrics = {
+            "width": width,
+            "height": height,
+            "file_size_kb": round(file_size / 1024, 2),
+            "aspect_ratio": round(width / height, 2) if height > 0 else 0
+        }
+        
+        warnings = []
+        
+        # Check 1: Minimum resolution
+        min_dimension = min(width, height)
+        if min_dimension < 600:
+            warnings.append(f"Low resolution ({width}x{height}). Recommended minimum: 600px. OCR accuracy may be affected.")
+        
+        # Check 2: Very small file size (might indicate high compression)
+        if file_size < 50 * 1024:  # Less than 50KB
+            warnings.append(f"Small file size ({quality_metrics['file_size_kb']}KB). Image may be heavily compressed.")
+        
+        # Check 3: Extreme aspect ratios
+        aspect_ratio = width / height if height > 0 else 0
+        if aspect_ratio > 3 or aspect_ratio < 0.3:
+            warnings.append(f"Unusual aspect ratio ({quality_metrics['aspect_ratio']}). Image may be cropped or distorted.")
+        
+        # Checks 4-7: pixel metrics on the downsampled grayscale array
+        try:
+            gray = _analysis_array(img)
+            mean_brightness = float(gray.mean())
+            quality_metrics["brightness"] = round(mean_brightness, 2)
+            quality_metrics["contrast_rms"] = round(float(gray.std()) / 255.0, 3)
+            quality_metrics["sharpness"] = round(_laplacian_variance(gray), 2)
+            quality_metrics["ink_ratio"] = round(_ink_ratio(gray), 3)
+            
+            if mean_brightness < 50:
+                warnings.append(f"Image appears very dark (brightness: {quality_metrics['brightness']}). Better lighting recommended.")
+            elif mean_brightness > 220:
+                warnings.append(f"Image appears overexposed (brightness: {quality_metrics['brightness']}). Reduce brightness.")
+            
+            if quality_metrics["sharpness"] < MIN_SHARPNESS:
+                warnings.append(f"Image appears blurry (sharpness: {quality_metrics['sharpness']}). Hold the camera steady and refocus.")
+            
+            if quality_metrics["contrast_rms"] < MIN_CONTRAST_RMS:
+                warnings.append(f"Low contrast (contrast: {quality_metrics['contrast_rms']}). Text may be hard to read.")
+            
+            if quality_metrics["ink_ratio"] < MIN_INK_RATIO:
+                warnings.append("Very little text detected. Make sure the prescription fills the frame.")
+        except Exception as e:
+            print(f"[QUALITY CHECK] Pixel metrics skipped: {e}")
+        
+        if warnings:
+            warning_message = " ".join(warnings)
+            return False, warning_message, quality_metrics
+        
+        return True, "Image quality acceptable", quality_metrics
+        
+    except Exception as e:
+        print(f"[QUALITY CHECK] Error validating image: {e}")
+        return True, f"Quality check failed: {str(e)}", {}
+
+
+def normalize_image_for_ocr(image: BinaryIO) -> Tuple[bytes, Optional[str], dict]:
+    """
+    Shrink an uploaded photo to a compact, OCR-friendly JPEG
+
+    Applies EXIF orientation, converts to grayscale, downscales so the long
+    edge is at most OCR_TARGET_LONG_EDGE, then lowers JPEG quality (and if
+    needed the resolution) until the payload fits in OCR_TARGET_BYTES.
+    Falls back to the original bytes if Pillow is unavailable or fails.
+
+    Returns:
+        Tuple of (payload_bytes, content_type or None if unchanged, stats)
+    """
+    image.seek(0)
+    original = image.read()
+    image.seek(0)
+    stats = {"original_bytes": len(original), "sent_bytes": len(original), "normalized": False}
+
+    if not PIL_AVAILABLE or not OCR_NORMALIZE_ENABLED:
+        return original, None, stats
+
+    try:
+        img = Image.open(io.BytesIO(original))
+        img.draft("L", (OCR_TARGET_LONG_EDGE, OCR_TARGET_LONG_EDGE))  # Fast JPEG DCT downscale
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("L")
+        img.thumbnail((OCR_TARGET_LONG_EDGE, OCR_TARGET_LONG_EDGE), Image.LANCZOS)
+
+        quality = OCR_JPEG_QUALITY
+        while True:
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            payload = out.getvalue()
+            if len(payload) <= OCR_TARGET_BYTES:
+                break
+            if quality > OCR_MIN_JPEG_QUALITY:
+                quality -= 10
+            elif max(img.size) > 1000:
+                img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+            else:
+                break
+
+        # Never send something bigger than what the user uploaded
+        if len(payload) >= len(original):
+            return original, None, stats
+
+        stats.update({
+            "sent_bytes": len(payload),
+            "normalized": True,
+            "width": img.width,
+            "height": img.height,
+            "jpeg_quality": quality
+        })
+        return payload, "image/jpeg", stats
+
+    except Exception as e:
+        print(f"[NORMALIZE] Error normalizing image, sending original: {e}")
+        return original, None, stats
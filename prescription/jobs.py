@@ -0,0 +1,255 @@
+"""
+Background Prescription Jobs
+Uploads submitted in job mode are persisted to MongoDB and processed by a
+bounded pool of asyncio workers, so clients get a job id immediately and poll
+for the result instead of holding the connection open through OCR and the LLM.
+"""
+
+import io
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId, Binary
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+from db.mongo import prescription_jobs_collection
+from prescription.metrics import start_timer
+from prescription.pipeline import process_prescription
+
+load_dotenv()
+
+# Number of jobs processed concurrently per API process
+JOB_WORKERS = int(os.getenv("PRESCRIPTION_JOB_WORKERS", "2"))
+# A processing job whose lease expires is assumed orphaned (worker died) and re-queued
+JOB_LEASE_SECONDS = int(os.getenv("PRESCRIPTION_JOB_LEASE_SECONDS", "300"))
+# How often to sweep MongoDB for queued or orphaned jobs
+JOB_RECOVERY_INTERVAL = int(os.getenv("PRESCRIPTION_JOB_RECOVERY_INTERVAL", "60"))
+# Give up on a job after this many processing attempts
+JOB_MAX_ATTEMPTS = int(os.getenv("PRESCRIPTION_JOB_MAX_ATTEMPTS", "3"))
+
+_queue: Optional[asyncio.Queue] = None
+_enqueued = set()  # Job ids currently waiting in _queue (avoids duplicate sweeps)
+_tasks = []
+
+
+def serialize_job(job: dict) -> dict:
+    """Public view of a job document (never includes the uploaded file)"""
+    data = {
+        "job_id": str(job["_id"]),
+        "status": job.get("status"),
+        "stage": job.get("stage"),
+        "progress": job.get("progress", 0),
+        "filename": job.get("filename"),
+        "attempts": job.get("attempts", 0),
+        "created_at": job["created_at"].isoformat() if job.get("created_at") else None,
+        "updated_at": job["updated_at"].isoformat() if job.get("updated_at") else None,
+    }
+    if job.get("status") == "completed":
+        data["status_code"] = job.get("status_code")
+        data["result"] = job.get("result")
+        if job.get("timings"):
+            data["timings"] = job["timings"]
+    elif job.get("status") == "failed":
+        data["status_code"] = job.get("status_code")
+        data["error"] = job.get("error")
+    return data
+
+
+async def submit_job(user_id: str, filename: str, content_type: str, data: bytes) -> str:
+    """Persist an uploaded prescription as a queued job and hand it to the workers"""
+    now = datetime.utcnow()
+    job_doc = {
+        "user_id": user_id,
+        "filename": filename,
+        "content_type": content_type,
+        "file_data": Binary(data),
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0,
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+        "lease_expires_at": None
+    }
+    job_id = (await prescription_jobs_collection.insert_one(job_doc)).inserted_id
+    print(f"[JOBS] Queued job {job_id} for user {user_id}")
+    await _enqueue(job_id)
+    return str(job_id)
+
+
+async def _enqueue(job_id: ObjectId):
+    if _queue is None or job_id in _enqueued:
+        return
+    _enqueued.add(job_id)
+    await _queue.put(job_id)
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    return await prescription_jobs_collection.find_one(
+        {"_id": ObjectId(job_id)},
+        {"file_data": 0}
+    )
+
+
+async def _claim_job(job_id: ObjectId) -> Optional[dict]:
+    """Atomically move a queued job to processing so only one worker runs it"""
+    now = datetime.utcnow()
+    return await prescription_jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {
+            "$set": {
+                "status": "processing",
+                "stage": "starting",
+                "updated_at": now,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)
+            },
+            "$inc": {"attempts": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _finish_job(job_id: ObjectId, fields: dict):
+    fields["updated_at"] = datetime.utcnow()
+    fields["lease_expires_at"] = None
+    await prescription_jobs_collection.update_one(
+        {"_id": job_id},
+        {"$set": fields, "$unset": {"file_data": ""}}
+    )
+
+
+async def _run_job(job_id: ObjectId):
+    job = await _claim_job(job_id)
+    if not job:
+        return  # Already claimed by another worker/process, or finished
+
+    print(f"[JOBS] Processing job {job_id} (attempt {job['attempts']})")
+
+    async def on_progress(stage: str, progress: int):
+        now = datetime.utcnow()
+        await prescription_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "stage": stage,
+                "progress": progress,
+                "updated_at": now,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)
+            }}
+        )
+
+    image = io.BytesIO(bytes(job["file_data"]))
+    timer = start_timer()
+    try:
+        result, status_code = await process_prescription(
+            job["user_id"],
+            image,
+            job.get("filename") or "prescription.jpg",
+            job.get("content_type") or "image/jpeg",
+            on_progress
+        )
+        await _finish_job(job_id, {
+            "status": "completed",
+            "stage": "completed",
+            "progress": 100,
+            "status_code": status_code,
+            "result": result,
+            "timings": timer.finish()
+        })
+        print(f"[JOBS] Job {job_id} completed ({status_code})")
+    except HTTPException as e:
+        await _finish_job(job_id, {
+            "status": "failed",
+            "stage": "failed",
+            "status_code": e.status_code,
+            "error": e.detail
+        })
+        print(f"[JOBS] Job {job_id} failed: {e.detail}")
+    except Exception as e:
+        print(f"[JOBS] Job {job_id} error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        await _finish_job(job_id, {
+            "status": "failed",
+            "stage": "failed",
+            "status_code": 500,
+            "error": str(e)
+        })
+    finally:
+        image.close()
+
+
+async def _worker(worker_id: int):
+    while True:
+        job_id = await _queue.get()
+        _enqueued.discard(job_id)
+        try:
+            await _run_job(job_id)
+        except Exception as e:
+            print(f"[JOBS] Worker {worker_id} error on job {job_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def _recover_jobs():
+    """Re-queue jobs left behind by a restart or a crashed worker"""
+    now = datetime.utcnow()
+
+    # Orphaned: still marked processing but nobody renewed the lease
+    orphaned = prescription_jobs_collection.find(
+        {"status": "processing", "lease_expires_at": {"$lt": now}},
+        {"_id": 1, "attempts": 1}
+    )
+    async for job in orphaned:
+        if job.get("attempts", 0) >= JOB_MAX_ATTEMPTS:
+            await _finish_job(job["_id"], {
+                "status": "failed",
+                "stage": "failed",
+                "status_code": 500,
+                "error": "Job abandoned after repeated worker failures"
+            })
+            continue
+        await prescription_jobs_collection.update_one(
+            {"_id": job["_id"], "status": "processing"},
+            {"$set": {"status": "queued", "stage": "queued", "updated_at": now}}
+        )
+        print(f"[JOBS] Re-queued orphaned job {job['_id']}")
+
+    queued = prescription_jobs_collection.find(
+        {"status": "queued"},
+        {"_id": 1}
+    ).sort("created_at", 1)
+    async for job in queued:
+        await _enqueue(job["_id"])
+
+
+async def _recovery_loop():
+    while True:
+        try:
+            await _recover_jobs()
+        except Exception as e:
+            print(f"[JOBS] Recovery sweep failed: {e}")
+        await asyncio.sleep(JOB_RECOVERY_INTERVAL)
+
+
+def start_job_workers():
+    """Start the worker pool and the recovery sweep (call from app startup)"""
+    global _queue
+    if _tasks:
+        return
+    _queue = asyncio.Queue()
+    for worker_id in range(JOB_WORKERS):
+        _tasks.append(asyncio.create_task(_worker(worker_id)))
+    _tasks.append(asyncio.create_task(_recovery_loop()))
+    print(f"[JOBS] Started {JOB_WORKERS} prescription job worker(s)")
+
+
+async def stop_job_workers():
+    """Cancel workers; in-flight jobs are recovered on next start via their lease"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    print("[JOBS] Prescription job workers stopped")
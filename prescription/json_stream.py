@@ -0,0 +1,84 @@
+"""
+Incremental JSON Array Decoding
+Pulls complete objects out of a JSON array while the surrounding document
+is still being streamed, e.g. each medicine of {"medicines": [...]} as soon
+as the LLM closes it.
+"""
+
+import json
+import re
+from typing import List
+
+
+class JSONArrayStreamDecoder:
+    """
+    Feed text chunks; get back each element object of the array under `key`
+    once its closing brace has arrived. Tolerates text (or code fences)
+    before the document, and ignores anything after the array closes.
+    """
+
+    def __init__(self, key: str):
+        self._array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+
+    @property
+    def done(self) -> bool:
+        """True once the array's closing bracket has been seen"""
+        return self._done
+
+    def feed(self, chunk: str) -> List[dict]:
+        """Add streamed text; returns the objects completed by it (possibly none)"""
+        if self._done:
+            return []
+        self._buffer += chunk
+
+        if not self._in_array:
+            match = self._array_start.search(self._buffer)
+            if not match:
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        completed = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # The array itself closed
+                    self._done = True
+                    self._pos = i + 1
+                    return completed
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        item = json.loads(buffer[self._object_start:i + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        completed.append(item)
+                    self._object_start = None
+        self._pos = len(buffer)
+        return completed
@@ -0,0 +1,472 @@
+"""
+Shared LLM Client
+Every Groq call (parsing and enrichment) goes through chat_completion, which:
+- admits requests through a token bucket (requests/min and tokens/min) kept in
+  Redis so all workers share one budget, with an in-process fallback
+- admits waiting requests by priority, so interactive parses go ahead of
+  background enrichment when a model's budget is tight (one queue per model)
+- retries 429s, timeouts and 5xx errors with jittered exponential backoff,
+  honoring the server's retry-after
+JSON tasks can also be tiered: a small fast model answers first and the large
+model is only used when that answer fails validation. JSON answers are repaired
+and validated locally (prescription.llm_schema) before either check.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import random
+import itertools
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from db.redis import get_redis
+from prescription.circuit import CircuitOpenError, groq_breaker
+from prescription.llm_schema import load_llm_json
+from prescription.metrics import Counter, Histogram, timed_stage
+from prescription.rules import estimate_tokens
+
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+# Override the API host (e.g. a local stand-in server for benchmarks)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "")
+
+# Model tiers: the fast model is tried first, the large one on validation failure
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "llama-3.3-70b-versatile")
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "llama-3.1-8b-instant")
+LLM_TIERING_ENABLED = os.getenv("LLM_TIERING_ENABLED", "true").lower() == "true"
+
+# Per-model Groq limits shared by all workers (0 disables that limit)
+GROQ_RPM_LIMIT = int(os.getenv("GROQ_RPM_LIMIT", "30"))
+GROQ_TPM_LIMIT = int(os.getenv("GROQ_TPM_LIMIT", "12000"))
+# Retries after the first attempt for rate-limited/transient failures
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+# Give up instead of queueing behind the rate limit for longer than this
+LLM_MAX_WAIT_SECONDS = float(os.getenv("LLM_MAX_WAIT_SECONDS", "60"))
+
+# Lower value = admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# After a Redis error, use the in-process bucket for this long before retrying Redis
+REDIS_RETRY_SECONDS = 30
+
+groq_client = None
+try:
+    from groq import AsyncGroq, APIConnectionError, APIStatusError
+    if GROQ_API_KEY:
+        # Retries are handled here (shared budget, retry-after aware), not by the SDK
+        groq_client = AsyncGroq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL or None, max_retries=0)
+except ImportError:
+    APIConnectionError = APIStatusError = None
+    print("[LLM] Warning: groq package not installed")
+
+LLM_REQUESTS = Counter(
+    "medimind_llm_requests_total",
+    "LLM requests by final outcome",
+    ("outcome",)
+)
+LLM_RETRIES = Counter(
+    "medimind_llm_retries_total",
+    "LLM request retries by reason",
+    ("reason",)
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "medimind_llm_queue_seconds",
+    "Time LLM requests waited for rate-limit admission",
+    ("priority",)
+)
+LLM_TIER_REQUESTS = Counter(
+    "medimind_llm_tier_requests_total",
+    "Tiered LLM requests by task, tier and outcome (accepted/escalated/error)",
+    ("task", "tier", "outcome")
+)
+LLM_TIER_SECONDS = Histogram(
+    "medimind_llm_tier_seconds",
+    "Latency of tiered LLM requests by task and tier",
+    ("task", "tier")
+)
+
+
+class LLMBusyError(Exception):
+    """The rate limit budget could not admit the request within LLM_MAX_WAIT_SECONDS"""
+
+
+# Atomically refill and debit the RPM and TPM buckets. Returns "0" when admitted,
+# otherwise the seconds until enough budget is available (nothing is debited).
+_TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cooldown = redis.call('PTTL', KEYS[3])
+if cooldown > 0 then return tostring(cooldown / 1000) end
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+  local capacity = tonumber(ARGV[i * 2])
+  local cost = math.min(tonumber(ARGV[i * 2 + 1]), capacity)
+  if capacity > 0 then
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60)
+    levels[i] = tokens - cost
+    if tokens < cost then wait = math.max(wait, (cost - tokens) * 60 / capacity) end
+  end
+end
+if wait > 0 then return tostring(wait) end
+for i = 1, 2 do
+  if levels[i] then
+    redis.call('HSET', KEYS[i], 'tokens', levels[i], 'ts', now)
+    redis.call('EXPIRE', KEYS[i], 120)
+  end
+end
+return '0'
+"""
+
+
+class TokenBucket:
+    """
+    Requests-per-minute and tokens-per-minute budget shared through Redis.
+    Falls back to an in-process bucket (same algorithm) when Redis is unavailable.
+    """
+
+    def __init__(self, namespace: str, rpm: int, tpm: int):
+        self.namespace = namespace
+        self.rpm = rpm
+        self.tpm = tpm
+        self._keys = [f"{namespace}:rpm", f"{namespace}:tpm", f"{namespace}:cooldown"]
+        self._script = None
+        # In-memory fallback: bucket -> [tokens, last_refill]
+        self._memory = {}
+        self._cooldown_until = 0.0
+        self._redis_failed = False
+        self._redis_retry_at = 0.0
+
+    def _redis_error(self, error: Exception):
+        if not self._redis_failed:
+            print(f"[LLM] Redis rate limiter unavailable, limiting per process: {error}")
+        self._redis_failed = True
+        self._redis_retry_at = time.time() + REDIS_RETRY_SECONDS
+
+    def _use_memory(self) -> bool:
+        return self._redis_failed and time.time() < self._redis_retry_at
+
+    async def try_acquire(self, tokens: int) -> float:
+        """Debit one request and `tokens` if available; else return seconds to wait"""
+        now = time.time()
+        if not self._use_memory():
+            try:
+                redis = await get_redis()
+                if self._script is None:
+                    self._script = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+                wait = await self._script(keys=self._keys, args=[now, self.rpm, 1, self.tpm, tokens])
+                self._redis_failed = False
+                return float(wait)
+            except Exception as e:
+                self._redis_error(e)
+        return self._memory_acquire(now, tokens)
+
+    def _memory_acquire(self, now: float, tokens: int) -> float:
+        if self._cooldown_until > now:
+            return self._cooldown_until - now
+        wait = 0.0
+        levels = {}
+        for name, capacity, cost in (("rpm", self.rpm, 1), ("tpm", self.tpm, tokens)):
+            if capacity <= 0:
+                continue
+            cost = min(cost, capacity)
+            level, ts = self._memory.get(name, (capacity, now))
+            level = min(capacity, level + max(0.0, now - ts) * capacity / 60)
+            levels[name] = level - cost
+            if level < cost:
+                wait = max(wait, (cost - level) * 60 / capacity)
+        if wait > 0:
+            return wait
+        for name, level in levels.items():
+            self._memory[name] = (level, now)
+        return 0.0
+
+    async def adjust(self, tokens: int):
+        """Correct the TPM bucket once the real token usage is known (positive = used more)"""
+        if self.tpm <= 0 or not tokens:
+            return
+        if not self._use_memory():
+            try:
+                redis = await get_redis()
+                await redis.hincrbyfloat(self._keys[1], "tokens", -tokens)
+                return
+            except Exception as e:
+                self._redis_error(e)
+        level, ts = self._memory.get("tpm", (self.tpm, time.time()))
+        self._memory["tpm"] = (level - tokens, ts)
+
+    async def cooldown(self, seconds: float):
+        """Pause admissions for every worker, e.g. after a 429 with retry-after"""
+        self._cooldown_until = max(self._cooldown_until, time.time() + seconds)
+        if not self._use_memory():
+            try:
+                redis = await get_redis()
+                await redis.set(self._keys[2], "1", px=max(1, int(seconds * 1000)))
+            except Exception as e:
+                self._redis_error(e)
+
+
+class PriorityGate:
+    """Lets one waiter through at a time, lowest priority value first (FIFO within a priority)"""
+
+    def __init__(self):
+        self._held = False
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    @asynccontextmanager
+    async def hold(self, priority: int):
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int):
+        if not self._held and not self._waiters:
+            self._held = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed the gate just as we were cancelled: pass it on
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Ownership moves to the next waiter; the gate stays held
+                future.set_result(None)
+                return
+        self._held = False
+
+
+# Groq limits are per model, so each model gets its own bucket, and its own
+# gate: a request sleeping on one model's budget must not hold up another model
+_rate_limiters: Dict[str, TokenBucket] = {}
+_admission_gates: Dict[str, PriorityGate] = {}
+
+
+def rate_limiter(model: str) -> TokenBucket:
+    limiter = _rate_limiters.get(model)
+    if limiter is None:
+        limiter = _rate_limiters[model] = TokenBucket(f"llm:groq:{model}", GROQ_RPM_LIMIT, GROQ_TPM_LIMIT)
+    return limiter
+
+
+def admission_gate(model: str) -> PriorityGate:
+    gate = _admission_gates.get(model)
+    if gate is None:
+        gate = _admission_gates[model] = PriorityGate()
+    return gate
+
+
+def _estimate_request_tokens(kwargs: dict) -> int:
+    prompt = sum(estimate_tokens(m.get("content") or "") for m in kwargs.get("messages", []))
+    return prompt + int(kwargs.get("max_tokens") or 1024)
+
+
+async def _admit(model: str, priority: int, tokens: int):
+    limiter = rate_limiter(model)
+    started = time.perf_counter()
+    with timed_stage("llm_queue"):
+        async with admission_gate(model).hold(priority):
+            while True:
+                wait = await limiter.try_acquire(tokens)
+                if wait <= 0:
+                    break
+                waited = time.perf_counter() - started
+                if waited + wait > LLM_MAX_WAIT_SECONDS:
+                    raise LLMBusyError(f"LLM rate limit: would wait {waited + wait:.1f}s")
+                # Re-check periodically; other workers may have freed budget
+                await asyncio.sleep(min(wait, 2.0))
+    LLM_QUEUE_SECONDS.observe(time.perf_counter() - started, priority=priority)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay from a rate-limit/overload response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+def _retry_reason(error: Exception) -> Optional[str]:
+    """Label for a retryable error, or None if the error is permanent"""
+    if APIStatusError is not None and isinstance(error, APIStatusError):
+        if error.status_code in RETRYABLE_STATUSES:
+            return str(error.status_code)
+        return None
+    if APIConnectionError is not None and isinstance(error, APIConnectionError):
+        return "connection"
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's retry-after"""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, LLM_BACKOFF_BASE_SECONDS)
+    return delay
+
+
+def llm_available() -> bool:
+    return groq_client is not None
+
+
+async def chat_completion(priority: int = PRIORITY_BACKGROUND, **kwargs):
+    """
+    groq_client.chat.completions.create with rate limiting and retries
+
+    Args:
+        priority: PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+        **kwargs: Passed through to the Groq SDK (model, messages, stream, ...)
+
+    Returns:
+        The SDK response (or stream when stream=True)
+
+    Raises:
+        LLMBusyError if the rate limit keeps the request waiting too long;
+        CircuitOpenError while Groq's circuit breaker is open;
+        the last SDK error once retries are exhausted or for permanent errors
+    """
+    if groq_client is None:
+        raise RuntimeError("Groq client is not configured")
+    # Don't queue for rate-limit budget when Groq is known to be failing
+    groq_breaker.check()
+
+    model = kwargs.get("model", LLM_LARGE_MODEL)
+    limiter = rate_limiter(model)
+    estimated = _estimate_request_tokens(kwargs)
+    attempt = 0
+    while True:
+        await _admit(model, priority, estimated)
+        try:
+            # Only transient errors (429/5xx/connection) count against Groq's health
+            with groq_breaker.guard(lambda e: _retry_reason(e) is not None):
+                response = await groq_client.chat.completions.create(**kwargs)
+        except CircuitOpenError:
+            LLM_REQUESTS.inc(outcome="circuit_open")
+            raise
+        except Exception as e:
+            reason = _retry_reason(e)
+            if reason is None or attempt >= LLM_MAX_RETRIES:
+                LLM_REQUESTS.inc(outcome="error")
+                raise
+            retry_after = _retry_after(e)
+            delay = backoff_delay(attempt, retry_after)
+            if reason == "429":
+                # The shared budget was off; hold every worker back, not just this request
+                await limiter.cooldown(retry_after or delay)
+            LLM_RETRIES.inc(reason=reason)
+            attempt += 1
+            print(f"[LLM] {reason} error, retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        LLM_REQUESTS.inc(outcome="ok" if attempt == 0 else "ok_after_retry")
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            await limiter.adjust(usage.total_tokens - estimated)
+        return response
+
+
+def _failed_generation(error: Exception) -> Optional[str]:
+    """The rejected output carried by a JSON-mode 400 (json_validate_failed), if any"""
+    if APIStatusError is None or not isinstance(error, APIStatusError) or error.status_code != 400:
+        return None
+    body = error.body.get("error", error.body) if isinstance(error.body, dict) else None
+    generation = body.get("failed_generation") if isinstance(body, dict) else None
+    return generation if isinstance(generation, str) and generation.strip() else None
+
+
+async def _json_completion(task: str, tier: str, priority: int, **kwargs) -> dict:
+    started = time.perf_counter()
+    try:
+        try:
+            response = await chat_completion(priority=priority, response_format={"type": "json_object"}, **kwargs)
+            content = response.choices[0].message.content
+        except Exception as e:
+            # JSON mode rejects malformed output outright; try to salvage what it generated
+            content = _failed_generation(e)
+            if content is None:
+                raise
+            print(f"[LLM] {task}: JSON mode rejected the answer, repairing it locally")
+        return load_llm_json(content, task)
+    finally:
+        LLM_TIER_SECONDS.observe(time.perf_counter() - started, task=task, tier=tier)
+
+
+async def tiered_json_completion(
+    task: str,
+    validate: Callable[[dict], Optional[str]],
+    priority: int = PRIORITY_BACKGROUND,
+    **kwargs
+) -> Tuple[dict, str]:
+    """
+    JSON-mode completion on the fast model, escalating to the large model when the
+    fast answer fails (JSON that can't be repaired, API error, the fast model's
+    rate limit being exhausted, or `validate` returning a reason)
+
+    Args:
+        task: Label for metrics/logs, e.g. "parse" or "enrich"
+        validate: Returns None when an answer is acceptable, else a short reason
+        priority: Admission priority (see chat_completion)
+        **kwargs: Passed to chat_completion (messages, temperature, max_tokens, ...)
+
+    Returns:
+        Tuple of (parsed_json, model_used). Answers are repaired and coerced to
+        the task's schema; the large model's answer is returned without the
+        `validate` check, so callers still validate it.
+
+    Raises:
+        The large model's error (or LLMBusyError) when it can't answer
+    """
+    if LLM_TIERING_ENABLED and LLM_FAST_MODEL and LLM_FAST_MODEL != LLM_LARGE_MODEL:
+        try:
+            data = await _json_completion(task, "fast", priority, model=LLM_FAST_MODEL, **kwargs)
+            reason = validate(data)
+        except CircuitOpenError:
+            # Groq as a whole is failing; the large model won't do better
+            raise
+        except LLMBusyError as e:
+            # The large model has its own rate-limit budget that may still have room
+            reason = f"busy: {e}"
+        except Exception as e:
+            reason = f"error: {e}"
+        if reason is None:
+            LLM_TIER_REQUESTS.inc(task=task, tier="fast", outcome="accepted")
+            return data, LLM_FAST_MODEL
+        LLM_TIER_REQUESTS.inc(task=task, tier="fast", outcome="escalated")
+        print(f"[LLM] {task}: {LLM_FAST_MODEL} answer rejected ({reason}), escalating to {LLM_LARGE_MODEL}")
+
+    try:
+        data = await _json_completion(task, "large", priority, model=LLM_LARGE_MODEL, **kwargs)
+    except Exception:
+        LLM_TIER_REQUESTS.inc(task=task, tier="large", outcome="error")
+        raise
+    LLM_TIER_REQUESTS.inc(task=task, tier="large", outcome="accepted")
+    return data, LLM_LARGE_MODEL
@@ -0,0 +1,324 @@
+"""
+LLM Output Schemas
+Compiled validators for the JSON the LLM returns (parsed medicines and
+enrichment answers), with a local repair pass so a truncated or slightly
+malformed answer is salvaged instead of dropping the prescription or paying
+for another model call: code fences and chatter around the JSON are
+stripped, trailing commas removed, a truncated array is closed after its last
+complete entry, timing strings become lists and daily frequencies are
+respelled in the frequency vocabulary ("BD" -> "twice a day"). Entries that
+can't be salvaged are dropped individually.
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from pydantic import field_validator, model_validator
+
+from prescription.metrics import Counter
+from prescription.rules import frequency_timings, has_interval_qualifier
+
+LLM_JSON_RESULTS = Counter(
+    "medimind_llm_json_total",
+    "LLM JSON answers by schema and outcome (valid, repaired, failed)",
+    ("schema", "outcome")
+)
+
+_TIMINGS = ("morning", "afternoon", "evening", "night")
+_TIMING_WORDS = {
+    "breakfast": "morning", "am": "morning",
+    "noon": "afternoon", "midday": "afternoon", "lunch": "afternoon",
+    "bedtime": "night", "hs": "night",
+}
+_TIMING_SPLIT = re.compile(r"[,;/&+|]|\band\b|\s+")
+_CONFIDENCE = ("high", "medium", "low")
+_UNKNOWN_TEXT = {"", "n/a", "na", "none", "null", "unknown", "not specified"}
+_UNDETERMINED = "Unable to determine"
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _text(value: Any, missing: str) -> Any:
+    """Numbers and one-element lists become strings; empty values become `missing`"""
+    if value is None:
+        return missing
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"{value:g}"
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    if isinstance(value, str):
+        value = value.strip()
+        return missing if value.lower() in _UNKNOWN_TEXT else value
+    return value
+
+
+def _frequency(value: Any, missing: str) -> Any:
+    """
+    Respell a recognizable daily frequency ("BD", "1-0-1", "twice daily") in
+    the standard vocabulary; non-daily schedules ("once a week") are kept as
+    written, never turned into a daily one
+    """
+    value = _text(value, missing)
+    if isinstance(value, str) and value != missing and not has_interval_qualifier(value):
+        standard, _ = frequency_timings(value)
+        if standard is not None:
+            return standard
+    return value
+
+
+def _timings(value: Any) -> Any:
+    """"morning, night" / ["Morning", "bedtime"] -> ["morning", "night"]; unknown words are dropped"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = _TIMING_SPLIT.split(value)
+    if not isinstance(value, list):
+        return value
+    found = set()
+    for item in value:
+        word = str(item).strip().lower()
+        found.add(_TIMING_WORDS.get(word, word))
+    return [timing for timing in _TIMINGS if timing in found]
+
+
+def _valid_entries(entries: Any, model) -> Any:
+    """Validate list entries one by one, dropping the ones that can't be salvaged"""
+    if isinstance(entries, dict):
+        entries = [entries]
+    if not isinstance(entries, list):
+        return entries
+    valid = []
+    for entry in entries:
+        try:
+            valid.append(model.model_validate(entry))
+        except ValidationError:
+            continue
+    return valid
+
+
+class ParsedMedicine(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    medicine_name: str = Field(validation_alias=AliasChoices("medicine_name", "name", "medicine"), min_length=1)
+    dosage: str = "Unknown"
+    frequency: str = "Unknown"
+    timings: List[str] = []
+
+    @field_validator("medicine_name", mode="before")
+    @classmethod
+    def _name(cls, value):
+        return _text(value, "")
+
+    @field_validator("dosage", mode="before")
+    @classmethod
+    def _dosage(cls, value):
+        return _text(value, "Unknown")
+
+    @field_validator("frequency", mode="before")
+    @classmethod
+    def _frequency(cls, value):
+        return _frequency(value, "Unknown")
+
+    @field_validator("timings", mode="before")
+    @classmethod
+    def _timings(cls, value):
+        return _timings(value)
+
+
+class ParsedPrescription(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    medicines: List[ParsedMedicine]
+
+    @model_validator(mode="before")
+    @classmethod
+    def _bare_list(cls, data):
+        # A bare array of medicines instead of {"medicines": [...]}
+        return {"medicines": data} if isinstance(data, list) else data
+
+    @field_validator("medicines", mode="before")
+    @classmethod
+    def _entries(cls, value):
+        return _valid_entries(value, ParsedMedicine)
+
+
+class EnrichmentAnswer(BaseModel):
+    """Absent fields stay absent (the caller decides which ones it needed)"""
+    model_config = ConfigDict(extra="allow")
+
+    dosage: Optional[str] = None
+    frequency: Optional[str] = None
+    timings: Optional[List[str]] = None
+    confidence: Optional[str] = None
+    reasoning: Optional[str] = None
+
+    @field_validator("dosage", mode="before")
+    @classmethod
+    def _dosage(cls, value):
+        return _text(value, _UNDETERMINED)
+
+    @field_validator("frequency", mode="before")
+    @classmethod
+    def _frequency(cls, value):
+        return _frequency(value, _UNDETERMINED)
+
+    @field_validator("timings", mode="before")
+    @classmethod
+    def _timings(cls, value):
+        return _timings(value)
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _confidence(cls, value):
+        value = str(value or "").strip().lower()
+        return value if value in _CONFIDENCE else "low"
+
+    @field_validator("reasoning", mode="before")
+    @classmethod
+    def _reasoning(cls, value):
+        return "" if value is None else str(value)
+
+
+class BatchEnrichmentEntry(EnrichmentAnswer):
+    index: int
+
+
+class BatchEnrichmentAnswer(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    medicines: List[BatchEnrichmentEntry]
+
+    @field_validator("medicines", mode="before")
+    @classmethod
+    def _entries(cls, value):
+        return _valid_entries(value, BatchEnrichmentEntry)
+
+
+# Schemas by LLM task (the labels used with tiered_json_completion)
+SCHEMAS = {
+    "parse": TypeAdapter(ParsedPrescription),
+    "enrich": TypeAdapter(EnrichmentAnswer),
+    "enrich_batch": TypeAdapter(BatchEnrichmentAnswer),
+}
+_medicine_adapter = TypeAdapter(ParsedMedicine)
+
+
+def _close_truncated(text: str) -> Optional[str]:
+    """
+    Cut a truncated document after its last complete object and close the
+    brackets still open there, e.g. '{"medicines": [{...}, {"medic' ->
+    '{"medicines": [{...}]}'
+    """
+    stack = []
+    in_string = escape = False
+    cut = None
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+            if not stack:
+                return text[:i + 1]
+            if char == "}":
+                cut = (i + 1, list(stack))
+    if cut is None:
+        return None
+    end, still_open = cut
+    return text[:end] + "".join(reversed(still_open))
+
+
+def parse_json_lenient(content: str) -> Tuple[Any, bool]:
+    """
+    json.loads with a local repair pass for common LLM output damage
+
+    Returns:
+        Tuple of (decoded value, whether a repair was needed)
+
+    Raises:
+        ValueError when no JSON document can be recovered
+    """
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("empty answer")
+    try:
+        return json.loads(content), False
+    except ValueError:
+        pass
+
+    text = content.strip()
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("no JSON document in answer")
+    text = _TRAILING_COMMA.sub(r"\1", text[min(starts):])
+
+    try:
+        # Ignores chatter after the document
+        return json.JSONDecoder().raw_decode(text)[0], True
+    except ValueError:
+        pass
+    closed = _close_truncated(text)
+    if closed is not None:
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r"\1", closed)), True
+        except ValueError:
+            pass
+    raise ValueError("answer is not valid JSON")
+
+
+def load_llm_json(content: str, schema: str) -> dict:
+    """
+    Decode, repair and validate one JSON answer from the LLM
+
+    Args:
+        content: The raw completion text
+        schema: Task label in SCHEMAS ("parse", "enrich", "enrich_batch");
+            other labels are only decoded
+
+    Returns:
+        The answer as plain dicts/lists with values coerced to the schema
+
+    Raises:
+        ValueError when the answer can't be salvaged
+    """
+    try:
+        data, repaired = parse_json_lenient(content)
+        adapter = SCHEMAS.get(schema)
+        if adapter is None:
+            result = data
+        else:
+            result = adapter.dump_python(adapter.validate_python(data), exclude_none=True)
+            repaired = repaired or result != data
+    except (ValueError, ValidationError) as e:
+        LLM_JSON_RESULTS.inc(schema=schema, outcome="failed")
+        raise ValueError(f"unusable {schema} answer: {str(e).splitlines()[0]}") from None
+
+    LLM_JSON_RESULTS.inc(schema=schema, outcome="repaired" if repaired else "valid")
+    if repaired:
+        print(f"[LLM] Repaired {schema} answer locally")
+    return result
+
+
+def validate_medicine(entry: Any) -> Optional[dict]:
+    """Coerce one streamed medicine object to the schema; None if it can't be salvaged"""
+    try:
+        medicine = _medicine_adapter.dump_python(_medicine_adapter.validate_python(entry))
+    except ValidationError:
+        LLM_JSON_RESULTS.inc(schema="parse_stream", outcome="failed")
+        return None
+    LLM_JSON_RESULTS.inc(schema="parse_stream", outcome="repaired" if medicine != entry else "valid")
+    return medicine
@@ -0,0 +1,223 @@
+"""
+Pipeline Metrics
+Per-request stage timings plus process-wide latency histograms and counters,
+exported in the Prometheus text format on /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets (seconds) spanning cache hits to slow OCR/LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_registry: List["_Metric"] = []
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _label_key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._label_key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = self._format_labels(key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = self._format_labels(key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+_caches: list = []
+
+
+def register_cache(cache):
+    """Export a RedisLRUCache's hit/miss/eviction counters on /metrics"""
+    _caches.append(cache)
+    return cache
+
+
+def _render_caches() -> List[str]:
+    lines = []
+    for counter in ("hits", "misses", "evictions"):
+        name = f"medimind_cache_{counter}_total"
+        lines.append(f"# HELP {name} Cache {counter} since process start")
+        lines.append(f"# TYPE {name} counter")
+        for cache in _caches:
+            lines.append(f'{name}{{cache="{cache.namespace}"}} {getattr(cache, counter)}')
+    return lines
+
+
+def render_metrics() -> str:
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    if _caches:
+        lines.extend(_render_caches())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "medimind_upload_stage_seconds",
+    "Latency of each prescription upload pipeline stage",
+    ("stage",)
+)
+
+
+class StageTimer:
+    """Accumulates stage durations for one upload (or one file of a batch)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.calls: List[dict] = []
+
+    @contextmanager
+    def stage(self, name: str, **detail):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            if detail:
+                self.calls.append({"stage": name, **detail, "ms": round(elapsed * 1000, 1)})
+
+    def mark(self, name: str):
+        """Record a milestone as time since the start of the request (e.g. first result sent)"""
+        elapsed = self.elapsed()
+        self.marks[name] = elapsed
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def elapsed(self) -> float:
+        """Seconds since the start of the request"""
+        return time.perf_counter() - self.started
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds spent per stage so far"""
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+    def finish(self) -> dict:
+        """
+        Record the end-to-end duration and return the response timings block
+
+        Returns:
+            Dict of "<stage>_ms" durations, total_ms and (if any) per-call entries
+        """
+        total = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(total, stage="total")
+        timings = {f"{name}_ms": ms for name, ms in self.breakdown().items()}
+        timings.update({f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.marks.items()})
+        timings["total_ms"] = round(total * 1000, 1)
+        if self.calls:
+            timings["calls"] = self.calls
+        return timings
+
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def start_timer() -> StageTimer:
+    """Begin timing the current request/task; timed_stage calls below it report here"""
+    timer = StageTimer()
+    _current_timer.set(timer)
+    return timer
+
+
+def request_elapsed() -> float:
+    """Seconds since the active StageTimer started (0 outside a timed request)"""
+    timer = _current_timer.get()
+    return timer.elapsed() if timer is not None else 0.0
+
+
+@contextmanager
+def timed_stage(name: str, **detail):
+    """Time a pipeline stage into the active StageTimer (if any) and the histogram"""
+    timer = _current_timer.get()
+    if timer is not None:
+        with timer.stage(name, **detail):
+            yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
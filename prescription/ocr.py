@@ -0,0 +1,325 @@
+"""
+OCR Backends
+OCR.space (remote), Tesseract (local, offline) and a deterministic fake for
+tests and benchmarks, selected via OCR_BACKEND. Optionally hedges a slow
+remote request by racing the local engine after OCR_HEDGE_AFTER_MS.
+"""
+
+import io
+import os
+import sys
+import asyncio
+import shutil
+from typing import BinaryIO, Optional, Tuple
+import httpx
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from prescription.circuit import CircuitOpenError, ocr_breaker
+
+try:
+    from PIL import Image
+    import pytesseract
+    TESSERACT_AVAILABLE = shutil.which(os.getenv("TESSERACT_CMD", "tesseract")) is not None
+    if TESSERACT_AVAILABLE:
+        pytesseract.pytesseract.tesseract_cmd = shutil.which(os.getenv("TESSERACT_CMD", "tesseract"))
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+load_dotenv()
+
+# "auto" picks OCR.space when a key is configured, otherwise local Tesseract
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto").lower()
+OCR_SPACE_API_KEY = os.getenv("OCR_SPACE_API_KEY", "")
+OCR_SPACE_URL = os.getenv("OCR_SPACE_URL", "https://api.ocr.space/parse/image")
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "30"))
+TESSERACT_CONFIG = os.getenv("TESSERACT_CONFIG", "--psm 6")
+# Hedging: if the primary (remote) engine hasn't answered in time, also start Tesseract
+OCR_HEDGE_ENABLED = os.getenv("OCR_HEDGE_ENABLED", "false").lower() == "true"
+OCR_HEDGE_AFTER_MS = int(os.getenv("OCR_HEDGE_AFTER_MS", "4000"))
+# Fake backend behaviour
+OCR_FAKE_LATENCY_MS = int(os.getenv("OCR_FAKE_LATENCY_MS", "0"))
+
+FAKE_PRESCRIPTION_TEXT = """Dr. A. Sharma MBBS MD
+City Care Clinic, Reg No 45821
+Rx
+1. TAB PAN 40mg 1-0-0 x 5 days
+2. TAB PARACETAMOL 650mg TDS x 3 days
+3. CAP AMOXICILLIN 500mg BD x 5 days
+4. SYP BENADRYL 5ml HS
+Review after 1 week
+"""
+
+# Shared async HTTP client for OCR requests (created lazily, reuses connections)
+_http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=OCR_TIMEOUT_SECONDS)
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class OCRBackend:
+    """Interface for OCR engines: image bytes in, plain text out"""
+
+    name = "base"
+
+    def is_available(self) -> bool:
+        return True
+
+    async def extract_text(self, data: bytes, filename: str, content_type: str) -> Tuple[str, str]:
+        """
+        Returns:
+            Tuple of (extracted_text, engine_name)
+
+        Raises:
+            Exception if the engine fails or finds no text
+        """
+        raise NotImplementedError
+
+
+class OCRSpaceBackend(OCRBackend):
+    """OCR.space HTTP API"""
+
+    name = "ocr.space"
+
+    def __init__(self, api_key: str = OCR_SPACE_API_KEY, url: str = OCR_SPACE_URL):
+        self.api_key = api_key
+        self.url = url
+
+    def is_available(self) -> bool:
+        return bool(self.api_key)
+
+    async def extract_text(self, data: bytes, filename: str, content_type: str) -> Tuple[str, str]:
+        if not self.api_key:
+            raise Exception("OCR_SPACE_API_KEY not configured in environment")
+
+        print(f"[OCR.space] Starting OCR for: {filename}")
+        sys.stdout.flush()
+
+        files = {
+            'file': (os.path.basename(filename), data, content_type)
+        }
+
+        payload = {
+            'apikey': self.api_key,
+            'language': 'eng',
+            'isOverlayRequired': 'false',
+            'OCREngine': '2',  # Engine 2 is better for special characters
+            'scale': 'true',   # Improve OCR for low-res images
+            'isTable': 'false'
+        }
+
+        print(f"[OCR.space] Sending request to API...")
+        sys.stdout.flush()
+        with ocr_breaker.guard():
+            response = await get_http_client().post(self.url, files=files, data=payload)
+
+            print(f"[OCR.space] Response status: {response.status_code}")
+            sys.stdout.flush()
+
+            if response.status_code != 200:
+                raise Exception(f"OCR.space API returned status {response.status_code}")
+
+        result = response.json()
+
+        # Check for errors
+        if result.get('IsErroredOnProcessing', False):
+            error_msg = result.get('ErrorMessage', 'Unknown error')
+            error_details = result.get('ErrorDetails', '')
+            raise Exception(f"OCR.space processing error: {error_msg} - {error_details}")
+
+        # Extract text from parsed results
+        parsed_results = result.get('ParsedResults', [])
+        if not parsed_results:
+            raise Exception("No parsed results returned from OCR.space")
+
+        extracted_text = ""
+        for page_result in parsed_results:
+            exit_code = page_result.get('FileParseExitCode')
+
+            if exit_code == 1:  # Success
+                text = page_result.get('ParsedText', '')
+                extracted_text += text + "\n"
+            else:
+                error_msg = page_result.get('ErrorMessage', 'Parse failed')
+                print(f"[OCR.space] Warning: Page parse failed - {error_msg}")
+
+        if not extracted_text.strip():
+            raise Exception("No text extracted from image")
+
+        print(f"[OCR.space] Successfully extracted {len(extracted_text)} characters")
+        sys.stdout.flush()
+        return extracted_text, self.name
+
+
+class TesseractBackend(OCRBackend):
+    """Local Tesseract engine via pytesseract (no network)"""
+
+    name = "tesseract"
+
+    def __init__(self, config: str = TESSERACT_CONFIG):
+        self.config = config
+
+    def is_available(self) -> bool:
+        return TESSERACT_AVAILABLE
+
+    def _run(self, data: bytes) -> str:
+        img = Image.open(io.BytesIO(data))
+        return pytesseract.image_to_string(img, lang="eng", config=self.config)
+
+    async def extract_text(self, data: bytes, filename: str, content_type: str) -> Tuple[str, str]:
+        if not TESSERACT_AVAILABLE:
+            raise Exception("Tesseract is not installed (needs pytesseract and the tesseract binary)")
+
+        print(f"[TESSERACT] Starting OCR for: {filename}")
+        # Tesseract is CPU-bound and runs in a subprocess; keep it off the event loop
+        extracted_text = await asyncio.to_thread(self._run, data)
+        if not extracted_text.strip():
+            raise Exception("No text extracted from image")
+        print(f"[TESSERACT] Successfully extracted {len(extracted_text)} characters")
+        return extracted_text, self.name
+
+
+class FakeOCRBackend(OCRBackend):
+    """Deterministic stand-in for tests and benchmarks: fixed text, configurable latency"""
+
+    name = "fake"
+
+    def __init__(self, text: str = FAKE_PRESCRIPTION_TEXT, latency_ms: int = OCR_FAKE_LATENCY_MS):
+        self.text = text
+        self.latency_ms = latency_ms
+
+    async def extract_text(self, data: bytes, filename: str, content_type: str) -> Tuple[str, str]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self.text, self.name
+
+
+class HedgedOCRBackend(OCRBackend):
+    """
+    Race a primary engine against a fallback that only starts once the
+    primary has been silent for hedge_after_ms; first success wins
+    """
+
+    def __init__(self, primary: OCRBackend, fallback: OCRBackend, hedge_after_ms: int = OCR_HEDGE_AFTER_MS):
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_after = hedge_after_ms / 1000
+        self.name = f"hedged({primary.name},{fallback.name})"
+
+    def is_available(self) -> bool:
+        return self.primary.is_available() or self.fallback.is_available()
+
+    async def extract_text(self, data: bytes, filename: str, content_type: str) -> Tuple[str, str]:
+        primary = asyncio.create_task(self.primary.extract_text(data, filename, content_type))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        reason = "failed" if done else f"slow (>{int(self.hedge_after * 1000)}ms)"
+        print(f"[OCR] {self.primary.name} {reason}, hedging with {self.fallback.name}")
+        fallback = asyncio.create_task(self.fallback.extract_text(data, filename, content_type))
+        pending = {fallback} if done else {primary, fallback}
+        errors = [primary.exception()] if done else []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+        finally:
+            for task in pending:
+                task.cancel()
+        raise Exception("; ".join(str(e) for e in errors))
+
+
+def _build_backend(name: str) -> OCRBackend:
+    backends = {
+        "ocrspace": OCRSpaceBackend,
+        "ocr.space": OCRSpaceBackend,
+        "tesseract": TesseractBackend,
+        "fake": FakeOCRBackend,
+    }
+    if name == "auto":
+        return OCRSpaceBackend() if OCR_SPACE_API_KEY else TesseractBackend()
+    if name not in backends:
+        raise ValueError(f"Unknown OCR_BACKEND '{name}' (expected auto, ocrspace, tesseract or fake)")
+    return backends[name]()
+
+
+_backend: Optional[OCRBackend] = None
+
+def get_ocr_backend() -> OCRBackend:
+    """The configured OCR backend (built once, wrapped for hedging if enabled)"""
+    global _backend
+    if _backend is None:
+        backend = _build_backend(OCR_BACKEND)
+        if OCR_HEDGE_ENABLED and not isinstance(backend, TesseractBackend):
+            backend = HedgedOCRBackend(backend, TesseractBackend())
+        _backend = backend
+        print(f"[INIT] OCR backend: {_backend.name}" + ("" if _backend.is_available() else " (NOT AVAILABLE)"))
+    return _backend
+
+
+def check_ocr_backend() -> OCRBackend:
+    """
+    Build the configured backend at startup and make sure it can run
+
+    Raises:
+        RuntimeError when no engine is usable, e.g. OCR_BACKEND=auto without
+        OCR_SPACE_API_KEY on a host without the tesseract binary; otherwise
+        every upload would fail with an OCR error
+    """
+    backend = get_ocr_backend()
+    if not backend.is_available():
+        raise RuntimeError(
+            f"OCR backend '{backend.name}' is not available: set OCR_SPACE_API_KEY "
+            "or install the tesseract binary (OCR_BACKEND=fake for tests)"
+        )
+    return backend
+
+
+def set_ocr_backend(backend: OCRBackend):
+    """Override the configured backend (tests, benchmarks)"""
+    global _backend
+    _backend = backend
+
+
+async def extract_text(
+    image: BinaryIO,
+    filename: str = "prescription.jpg",
+    content_type: str = "image/jpeg",
+    backend: Optional[OCRBackend] = None
+) -> Tuple[str, str]:
+    """
+    Extract text from an image buffer with the configured OCR backend
+
+    Returns:
+        Tuple of (extracted_text, engine_name)
+    """
+    backend = backend or get_ocr_backend()
+    try:
+        image.seek(0)
+        data = image.read()
+        try:
+            return await backend.extract_text(data, filename, content_type)
+        except CircuitOpenError:
+            # OCR.space is failing; read locally rather than failing the upload
+            if not TESSERACT_AVAILABLE or isinstance(backend, TesseractBackend):
+                raise
+            print(f"[OCR] {backend.name} circuit open, falling back to tesseract")
+            return await TesseractBackend().extract_text(data, filename, content_type)
+    except Exception as e:
+        print(f"[OCR] {backend.name} error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"OCR failed: {str(e)}")
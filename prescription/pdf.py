@@ -0,0 +1,128 @@
+"""
+PDF Prescription Ingestion
+Splits a PDF into pages, takes the embedded text layer where a page has one
+and rasterizes the rest for OCR, which runs page-parallel. Page texts are
+recombined in order.
+"""
+
+import io
+import os
+import asyncio
+import threading
+from typing import Awaitable, Callable, List, Tuple
+from dotenv import load_dotenv
+
+try:
+    import pypdfium2 as pdfium
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+    print("[INIT] pypdfium2 not available - PDF prescriptions disabled")
+
+load_dotenv()
+
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "20"))
+# Rasterization resolution for pages without a text layer
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+# A page's text layer is trusted when it has at least this many characters
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "25"))
+# Pages OCR'd at the same time
+PDF_OCR_CONCURRENCY = int(os.getenv("PDF_OCR_CONCURRENCY", "3"))
+
+# PDFium is not thread-safe: serialize all document access across requests
+_pdfium_lock = threading.Lock()
+
+# OCR callable for a rendered page: (buffer, filename, content_type) -> (text, engine)
+PageOCR = Callable[[io.BytesIO, str, str], Awaitable[Tuple[str, str]]]
+
+
+def split_pdf_pages(data: bytes) -> List[dict]:
+    """
+    Extract each page's text layer, rendering pages without one to JPEG
+
+    Returns:
+        List of {"page": n, "text": str or None, "image": bytes or None}
+    """
+    with _pdfium_lock:
+        return _split_pdf_pages(data)
+
+
+def _split_pdf_pages(data: bytes) -> List[dict]:
+    pdf = pdfium.PdfDocument(data)
+    try:
+        page_count = len(pdf)
+        if page_count > PDF_MAX_PAGES:
+            raise ValueError(f"PDF has {page_count} pages; maximum is {PDF_MAX_PAGES}")
+
+        pages = []
+        for index in range(page_count):
+            page = pdf[index]
+            try:
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+
+                if len(text.strip()) >= PDF_MIN_TEXT_CHARS:
+                    pages.append({"page": index + 1, "text": text, "image": None})
+                    continue
+
+                bitmap = page.render(scale=PDF_RENDER_DPI / 72, grayscale=True)
+                out = io.BytesIO()
+                bitmap.to_pil().save(out, format="JPEG", quality=85)
+                pages.append({"page": index + 1, "text": None, "image": out.getvalue()})
+            finally:
+                page.close()
+        return pages
+    finally:
+        pdf.close()
+
+
+async def extract_text_from_pdf(data: bytes, filename: str, ocr_page: PageOCR) -> Tuple[str, str, dict]:
+    """
+    Text for a whole PDF: text layers locally, remaining pages OCR'd in parallel
+
+    Returns:
+        Tuple of (combined_text, engine_description, stats)
+    """
+    if not PDF_AVAILABLE:
+        raise Exception("PDF support is not installed (pypdfium2)")
+
+    # Splitting/rendering is CPU-bound; run it in a worker thread
+    pages = await asyncio.to_thread(split_pdf_pages, data)
+    to_ocr = [p for p in pages if p["text"] is None]
+    print(f"[PDF] {len(pages)} page(s): {len(pages) - len(to_ocr)} with text layer, {len(to_ocr)} to OCR")
+
+    base_name = os.path.splitext(os.path.basename(filename))[0]
+    semaphore = asyncio.Semaphore(max(1, PDF_OCR_CONCURRENCY))
+    engines = set()
+
+    async def run(page: dict):
+        async with semaphore:
+            text, engine = await ocr_page(
+                io.BytesIO(page["image"]), f"{base_name}_page{page['page']}.jpg", "image/jpeg"
+            )
+            engines.add(engine)
+            page["text"] = text
+
+    results = await asyncio.gather(*[run(p) for p in to_ocr], return_exceptions=True)
+    failed_pages = []
+    for page, result in zip(to_ocr, results):
+        if isinstance(result, BaseException):
+            print(f"[PDF] OCR failed for page {page['page']}: {result}")
+            failed_pages.append(page["page"])
+
+    combined = "\n\n".join(
+        f"[Page {p['page']}]\n{p['text'].strip()}" for p in pages if p["text"]
+    )
+    if not combined.strip():
+        raise Exception("No text extracted from PDF")
+
+    engine = "pdf-text" + "".join(f"+{e}" for e in sorted(engines))
+    stats = {
+        "pages": len(pages),
+        "text_layer_pages": len(pages) - len(to_ocr),
+        "ocr_pages": len(to_ocr),
+        "failed_pages": failed_pages,
+        "rendered_bytes": sum(len(p["image"]) for p in to_ocr)
+    }
+    return combined, engine, stats
@@ -0,0 +1,479 @@
+"""
+Prescription Processing Pipeline
+Quality check -> OCR -> LLM parsing -> enrichment -> schedule creation.
+Shared by the synchronous upload route and the background job workers.
+"""
+
+import io
+import os
+import json
+import sys
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, List, Optional, Tuple
+from fastapi import HTTPException
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from db.cache import RedisLRUCache
+from db.mongo import users_collection, prescriptions_collection, schedules_collection
+from prescription.enrichment import (
+    enrich_medicines, parse_prescription_with_groq, stream_parse_prescription_with_groq
+)
+from prescription.imaging import normalize_image_for_ocr, validate_image_quality
+from prescription.metrics import Counter, register_cache, timed_stage
+from prescription.ocr import extract_text
+from prescription.pdf import extract_text_from_pdf
+from prescription.rules import RULE_PARSER_ENABLED, RULE_PARSER_MIN_CONFIDENCE, parse_prescription_rules
+
+load_dotenv()
+
+# OCR result cache keyed by SHA-256 of the uploaded image bytes
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_TTL_SECONDS = int(os.getenv("OCR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "5000"))
+ocr_cache = register_cache(RedisLRUCache("ocr", OCR_CACHE_TTL_SECONDS, OCR_CACHE_MAX_ENTRIES))
+
+PARSES_TOTAL = Counter(
+    "medimind_prescription_parses_total",
+    "Prescriptions parsed, by parser that produced the result",
+    ("parser",)
+)
+
+# Progress callback: (stage, progress_percent) -> awaitable
+ProgressCallback = Callable[[str, int], Awaitable[None]]
+
+# Progress reported when each stage starts (job status and stream "stage" events)
+STAGE_PROGRESS = {"quality_check": 10, "ocr": 20, "parsing": 45, "enriching": 65, "saving": 90}
+
+def hash_image(image: BinaryIO) -> str:
+    """SHA-256 hex digest of the image buffer contents"""
+    digest = hashlib.sha256()
+    image.seek(0)
+    for chunk in iter(lambda: image.read(1024 * 1024), b""):
+        digest.update(chunk)
+    image.seek(0)
+    return digest.hexdigest()
+
+
+async def _ocr_normalized(image: BinaryIO, filename: str, content_type: str) -> Tuple[str, str, dict]:
+    """Downscale/recompress the image, then OCR the smaller payload"""
+    payload, normalized_type, stats = await asyncio.to_thread(normalize_image_for_ocr, image)
+    if normalized_type:
+        print(f"[NORMALIZE] {stats['original_bytes']} -> {stats['sent_bytes']} bytes ({stats['width']}x{stats['height']})")
+        filename = os.path.splitext(os.path.basename(filename))[0] + ".jpg"
+        content_type = normalized_type
+    text, engine = await extract_text(io.BytesIO(payload), filename, content_type)
+    return text, engine, stats
+
+
+async def _ocr_page(image: BinaryIO, filename: str, content_type: str) -> Tuple[str, str]:
+    text, engine, _ = await _ocr_normalized(image, filename, content_type)
+    return text, engine
+
+
+async def _extract_document_text(image: BinaryIO, filename: str, content_type: str) -> Tuple[str, str, dict]:
+    """OCR an image, or split a PDF and OCR only the pages without a text layer"""
+    if content_type == "application/pdf":
+        image.seek(0)
+        try:
+            return await extract_text_from_pdf(image.read(), filename, _ocr_page)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"[PDF] Error: {e}")
+            raise HTTPException(status_code=422, detail=f"Could not read PDF: {str(e)}")
+    return await _ocr_normalized(image, filename, content_type)
+
+
+async def extract_text_cached(
+    image: BinaryIO,
+    filename: str,
+    content_type: str
+) -> Tuple[str, bool, List[int]]:
+    """
+    Extract document text, reusing the stored result when identical bytes were seen before
+
+    A PDF whose pages could only partly be OCR'd is not cached, so uploading
+    it again retries the missing pages.
+
+    Returns:
+        Tuple of (extracted_text, served_from_cache, PDF pages whose OCR failed)
+    """
+    if not OCR_CACHE_ENABLED:
+        text, _, payload_stats = await _extract_document_text(image, filename, content_type)
+        return text, False, payload_stats.get("failed_pages", [])
+
+    image_hash = await asyncio.to_thread(hash_image, image)
+    cached = await ocr_cache.get(image_hash)
+    if cached and cached.get("text"):
+        print(f"[OCR] Cache hit for image {image_hash[:12]}")
+        return cached["text"], True, []
+
+    text, engine, payload_stats = await _extract_document_text(image, filename, content_type)
+    failed_pages = payload_stats.get("failed_pages", [])
+    if failed_pages:
+        print(f"[OCR] Not caching {image_hash[:12]}: page(s) {failed_pages} failed")
+        return text, False, failed_pages
+    await ocr_cache.set(image_hash, {
+        "text": text,
+        "engine": engine,
+        "content_type": content_type,
+        "characters": len(text),
+        "sent_bytes": payload_stats.get("sent_bytes"),
+        "created_at": datetime.utcnow().isoformat()
+    })
+    return text, False, []
+
+
+def failed_pages_warning(failed_pages: List[int]) -> str:
+    pages = ", ".join(str(page) for page in failed_pages)
+    return f"Could not read page(s) {pages} of the PDF; medicines on them may be missing. Upload it again to retry."
+
+
+async def parse_prescription(text: str) -> Tuple[list, dict]:
+    """
+    Parse OCR text locally when the rules are confident enough, otherwise with the LLM
+
+    Returns:
+        Tuple of (medicines, parse_info with parser and rule confidence)
+    """
+    rule_medicines, confidence = [], 0.0
+    if RULE_PARSER_ENABLED:
+        rule_medicines, confidence = parse_prescription_rules(text)
+        if rule_medicines and confidence >= RULE_PARSER_MIN_CONFIDENCE:
+            print(f"[PARSE] Rule parser confident ({confidence:.2f}), skipping LLM")
+            PARSES_TOTAL.inc(parser="rules")
+            return rule_medicines, {"parser": "rules", "confidence": confidence}
+        print(f"[PARSE] Rule parser confidence {confidence:.2f} below {RULE_PARSER_MIN_CONFIDENCE}, using LLM")
+
+    medicines = await parse_prescription_with_groq(text)
+    if not medicines and rule_medicines:
+        # LLM unavailable or failed: a partial local parse beats nothing
+        print(f"[PARSE] LLM returned no medicines, keeping {len(rule_medicines)} from rule parser")
+        PARSES_TOTAL.inc(parser="rules_fallback")
+        return rule_medicines, {"parser": "rules_fallback", "confidence": confidence}
+    PARSES_TOTAL.inc(parser="llm")
+    return medicines, {"parser": "llm", "confidence": confidence}
+
+
+async def stream_parse_prescription(text: str, parse_info: dict) -> AsyncIterator[dict]:
+    """
+    Like parse_prescription, but yields each medicine as soon as it is known
+
+    The rule parser's result arrives all at once; the LLM's arrives medicine by
+    medicine as the completion streams in. parse_info is filled in as a side effect.
+    """
+    rule_medicines, confidence = [], 0.0
+    if RULE_PARSER_ENABLED:
+        rule_medicines, confidence = parse_prescription_rules(text)
+        if rule_medicines and confidence >= RULE_PARSER_MIN_CONFIDENCE:
+            print(f"[PARSE] Rule parser confident ({confidence:.2f}), skipping LLM")
+            PARSES_TOTAL.inc(parser="rules")
+            parse_info.update({"parser": "rules", "confidence": confidence})
+            for medicine in rule_medicines:
+                yield medicine
+            return
+        print(f"[PARSE] Rule parser confidence {confidence:.2f} below {RULE_PARSER_MIN_CONFIDENCE}, streaming LLM")
+
+    streamed = 0
+    async for medicine in stream_parse_prescription_with_groq(text):
+        streamed += 1
+        yield medicine
+
+    if not streamed and rule_medicines:
+        print(f"[PARSE] LLM returned no medicines, keeping {len(rule_medicines)} from rule parser")
+        PARSES_TOTAL.inc(parser="rules_fallback")
+        parse_info.update({"parser": "rules_fallback", "confidence": confidence})
+        for medicine in rule_medicines:
+            yield medicine
+        return
+    PARSES_TOTAL.inc(parser="llm")
+    parse_info.update({"parser": "llm", "confidence": confidence})
+
+
+async def _report(on_progress: Optional[ProgressCallback], stage: str):
+    if on_progress is not None:
+        await on_progress(stage, STAGE_PROGRESS[stage])
+
+
+async def check_image_quality(image: BinaryIO, content_type: str) -> Tuple[List[str], dict]:
+    """
+    Photo quality checks before OCR (they don't apply to PDFs)
+
+    Returns:
+        Tuple of (quality_warnings, quality_metrics)
+    """
+    if content_type == "application/pdf":
+        return [], {}
+    print(f"[UPLOAD] Validating image quality...")
+    # PIL decoding is CPU-bound, keep it off the event loop
+    with timed_stage("quality_check"):
+        quality_valid, quality_message, quality_metrics = await asyncio.to_thread(
+            validate_image_quality, image
+        )
+    if quality_valid:
+        return [], quality_metrics
+    print(f"[UPLOAD] Quality warning: {quality_message}")
+    return [quality_message], quality_metrics
+
+
+async def read_prescription_text(
+    image: BinaryIO,
+    filename: str,
+    content_type: str,
+    quality_warnings: List[str]
+) -> Tuple[str, bool, List[int]]:
+    """
+    OCR step of the pipeline: extract_text_cached, timed, with a warning
+    appended to quality_warnings when PDF pages could not be read
+
+    Returns:
+        Tuple of (extracted_text, served_from_cache, PDF pages whose OCR failed)
+    """
+    print(f"[UPLOAD] Starting OCR extraction...")
+    sys.stdout.flush()
+    with timed_stage("ocr"):
+        text, ocr_cached, failed_pages = await extract_text_cached(image, filename, content_type)
+    print(f"[OCR] Extracted {len(text)} characters{' (cached)' if ocr_cached else ''}")
+    if failed_pages:
+        quality_warnings.append(failed_pages_warning(failed_pages))
+    return text, ocr_cached, failed_pages
+
+
+def build_analysis(
+    text: str,
+    ocr_cached: bool,
+    failed_pages: List[int],
+    medicines: list,
+    parse_info: dict,
+    enrichment_stats: dict,
+    quality_warnings: List[str],
+    quality_metrics: dict
+) -> dict:
+    """The analysis dict save_prescription and the batch route consume"""
+    return {
+        "text": text,
+        "ocr_cached": ocr_cached,
+        "ocr_failed_pages": failed_pages,
+        "medicines": medicines,
+        "parse_info": parse_info,
+        "enrichment_stats": enrichment_stats,
+        "quality_warnings": quality_warnings,
+        "quality_metrics": quality_metrics
+    }
+
+
+async def verify_user(user_id: str) -> dict:
+    """Fetch the uploading user or raise 404"""
+    print(f"[UPLOAD] Verifying user exists...")
+    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    print(f"[UPLOAD] User verified: {user.get('email', 'N/A')}")
+    return user
+
+
+async def analyze_prescription(
+    image: BinaryIO,
+    filename: str,
+    content_type: str = "image/jpeg",
+    on_progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Quality check, OCR, parse and enrich one prescription image or PDF (no DB writes)
+
+    Returns:
+        Dict with text, ocr_cached, ocr_failed_pages, medicines, parse_info,
+        enrichment_stats, quality_warnings and quality_metrics
+    """
+    await _report(on_progress, "quality_check")
+    quality_warnings, quality_metrics = await check_image_quality(image, content_type)
+
+    await _report(on_progress, "ocr")
+    text, ocr_cached, failed_pages = await read_prescription_text(image, filename, content_type, quality_warnings)
+
+    # Parse prescription using Groq LLM
+    await _report(on_progress, "parsing")
+    with timed_stage("parse"):
+        medicines, parse_info = await parse_prescription(text)
+    print(f"[PARSE] Found {len(medicines)} medicines")
+
+    # Enrich with LLM + web search
+    await _report(on_progress, "enriching")
+    with timed_stage("enrichment"):
+        enriched_medicines, enrichment_stats = await enrich_medicines(medicines)
+    print(f"[ENRICHMENT] {enrichment_stats['enriched_count']} enriched, {enrichment_stats.get('skipped_count', 0)} complete")
+
+    return build_analysis(
+        text, ocr_cached, failed_pages, enriched_medicines, parse_info, enrichment_stats,
+        quality_warnings, quality_metrics
+    )
+
+
+def build_prescription_doc(user_id: str, text: str, medicines: list) -> dict:
+    return {
+        "user_id": user_id,
+        "raw_text": text,
+        # Convert to JSON string for storage
+        "structured_data": json.dumps(medicines),
+        "created_at": datetime.utcnow()
+    }
+
+
+def build_schedule_docs(user_id: str, prescription_id: str, medicines: list) -> list:
+    """Schedule documents for every schedulable medicine (skips unnamed ones)"""
+    schedule_docs = []
+    valid_timings = ["morning", "afternoon", "evening", "night"]
+    
+    for medicine in medicines:
+        if isinstance(medicine, dict):
+            medicine_name = medicine.get("medicine_name", "N/A")
+            timings = medicine.get("timings", [])
+            
+            # Skip invalid medicines
+            if not medicine_name or medicine_name in ["N/A", "Unknown", "Unknown Medicine"]:
+                continue
+            
+            # Ensure timings are valid
+            if not timings or not isinstance(timings, list):
+                timings = ["morning"]
+            else:
+                timings = [t for t in timings if t in valid_timings]
+                if not timings:
+                    timings = ["morning"]
+            
+            schedule_doc = {
+                "user_id": user_id,
+                "prescription_id": str(prescription_id),
+                "medicine_name": medicine_name,
+                "dosage": medicine.get("dosage", "N/A"),
+                "frequency": medicine.get("frequency", "N/A"),
+                "timings": timings,
+                "enabled": True,
+                "created_at": datetime.utcnow(),
+                "last_reminder_sent": None
+            }
+            schedule_docs.append(schedule_doc)
+
+    return schedule_docs
+
+
+async def process_prescription(
+    user_id: str,
+    image: BinaryIO,
+    filename: str,
+    content_type: str = "image/jpeg",
+    on_progress: Optional[ProgressCallback] = None
+) -> Tuple[dict, int]:
+    """
+    Run the full prescription pipeline on a saved upload
+
+    Args:
+        user_id: MongoDB ObjectId of the uploading user
+        image: Seekable buffer holding the uploaded prescription image or PDF
+        filename: Original upload filename
+        content_type: Sniffed MIME type of the upload
+        on_progress: Optional async callback receiving (stage, progress_percent)
+
+    Returns:
+        Tuple of (response_payload, http_status_code)
+    """
+    await verify_user(user_id)
+
+    analysis = await analyze_prescription(image, filename, content_type, on_progress)
+    return await save_prescription(user_id, analysis, on_progress)
+
+
+async def save_prescription(
+    user_id: str,
+    analysis: dict,
+    on_progress: Optional[ProgressCallback] = None
+) -> Tuple[dict, int]:
+    """
+    Store an analyzed prescription and its schedules
+
+    Args:
+        user_id: MongoDB ObjectId of the uploading user
+        analysis: Result of analyze_prescription
+        on_progress: Optional async callback receiving (stage, progress_percent)
+
+    Returns:
+        Tuple of (response_payload, http_status_code)
+    """
+    text = analysis["text"]
+    ocr_cached = analysis["ocr_cached"]
+    medicines = analysis["medicines"]
+    enrichment_stats = analysis["enrichment_stats"]
+    quality_warnings = analysis["quality_warnings"]
+    quality_metrics = analysis["quality_metrics"]
+
+    # Save prescription
+    await _report(on_progress, "saving")
+    with timed_stage("db_write"):
+        prescription_doc = build_prescription_doc(user_id, text, medicines)
+        prescription_id = (await prescriptions_collection.insert_one(prescription_doc)).inserted_id
+
+        # Create schedules
+        schedule_docs = build_schedule_docs(user_id, str(prescription_id), medicines)
+        schedule_ids = []
+        if schedule_docs:
+            result = await schedules_collection.insert_many(schedule_docs)
+            schedule_ids = [str(schedule_id) for schedule_id in result.inserted_ids]
+
+    # Check if no medicines were extracted
+    if not medicines or len(schedule_ids) == 0:
+        error_response = {
+            "success": False,
+            "prescription_id": str(prescription_id),
+            "schedule_ids": [],
+            "medicines": [],
+            "message": "No medicines detected. This may be due to poor image quality, unclear text, or non-standard prescription format. Please try uploading a clearer image or contact support.",
+            "raw_text_preview": text[:300] if text else "No text extracted",
+            "ocr_cached": ocr_cached,
+            "ocr_failed_pages": analysis.get("ocr_failed_pages", []),
+            "suggestions": [
+                "Ensure the image is clear and well-lit",
+                "Make sure the prescription text is readable",
+                "Try taking the photo straight-on (not at an angle)",
+                "Check that medicine names and dosages are visible"
+            ]
+        }
+        
+        # Add quality warnings if any
+        if quality_warnings:
+            error_response["quality_warnings"] = quality_warnings
+            error_response["quality_metrics"] = quality_metrics
+        
+        return error_response, 400
+    
+    # Build success message with warnings if any
+    message = f"Prescription uploaded successfully. {len(medicines)} medicine(s) extracted and {len(schedule_ids)} schedule(s) created."
+    if len(medicines) != len(schedule_ids):
+        message += f" Note: Some medicines were skipped (e.g., 'as needed' medications)."
+    
+    # Add enrichment information to message
+    if enrichment_stats.get("enriched_count", 0) > 0:
+        message += f" {enrichment_stats['enriched_count']} medicine(s) enhanced with AI-powered information."
+
+    response_data = {
+        "success": True,
+        "prescription_id": str(prescription_id),
+        "schedule_ids": schedule_ids,
+        "medicines": medicines,
+        "message": message,
+        "schedules_created": len(schedule_ids),
+        "medicines_detected": len(medicines),
+        "enrichment_stats": enrichment_stats,
+        "parse_info": analysis["parse_info"],
+        "ocr_cached": ocr_cached,
+        "ocr_failed_pages": analysis.get("ocr_failed_pages", [])
+    }
+    
+    # Add quality warnings if any
+    if quality_warnings:
+        response_data["quality_warnings"] = quality_warnings
+        response_data["quality_metrics"] = quality_metrics
+
+    return response_data, 200
@@ -0,0 +1,167 @@
+"""
+Enrichment Search Planner
+Decides, for each medicine that needs enrichment, whether a web search is
+worth its cost: skip it, or search at Tavily's "basic" or "advanced" depth.
+Inputs are the missing fields, whether the drug catalog or the search cache
+already has context, whether Tavily is reachable and how much of the upload's
+latency budget is left. Decisions and their outcomes are counted (and
+optionally logged as JSON lines) so the thresholds can be tuned.
+"""
+
+import os
+import json
+import time
+import asyncio
+from typing import Dict, List
+from dotenv import load_dotenv
+
+from prescription.metrics import Counter, Histogram
+
+load_dotenv()
+
+# End-to-end time an upload should take; searches are planned to fit in what's left
+ENRICHMENT_LATENCY_BUDGET_SECONDS = float(os.getenv("ENRICHMENT_LATENCY_BUDGET_SECONDS", "30"))
+# Part of the remaining budget kept for the enrichment LLM call itself
+ENRICHMENT_LLM_RESERVE_SECONDS = float(os.getenv("ENRICHMENT_LLM_RESERVE_SECONDS", "6"))
+# Missing dosage/frequency fields needed before a search goes "advanced"
+SEARCH_ADVANCED_MIN_FIELDS = int(os.getenv("SEARCH_ADVANCED_MIN_FIELDS", "2"))
+# Starting latency estimates per depth; refined from observed searches
+SEARCH_BASIC_ESTIMATE_SECONDS = float(os.getenv("SEARCH_BASIC_ESTIMATE_SECONDS", "1.5"))
+SEARCH_ADVANCED_ESTIMATE_SECONDS = float(os.getenv("SEARCH_ADVANCED_ESTIMATE_SECONDS", "4"))
+# Optional JSON-lines file with one record per planned medicine (decision + outcome)
+ENRICHMENT_PLAN_LOG = os.getenv("ENRICHMENT_PLAN_LOG", "")
+
+SKIP = "skip"
+CACHED = "cached"
+BASIC = "basic"
+ADVANCED = "advanced"
+
+# Results requested per depth: basic answers are short, keep the prompt small too
+SEARCH_MAX_RESULTS = {BASIC: 2, ADVANCED: 3}
+# Fields a web search can actually help with (timings follow from the frequency)
+_SEARCHABLE_FIELDS = ("dosage", "frequency")
+_ESTIMATE_WEIGHT = 0.2
+
+PLAN_DECISIONS = Counter(
+    "medimind_enrichment_plan_decisions_total",
+    "Search decisions for medicines needing enrichment",
+    ("decision", "reason")
+)
+PLAN_OUTCOMES = Counter(
+    "medimind_enrichment_plan_outcomes_total",
+    "Enrichment outcome per search decision",
+    ("decision", "outcome")
+)
+SEARCH_SECONDS = Histogram(
+    "medimind_enrichment_search_seconds",
+    "Web search latency per depth",
+    ("depth", "result")
+)
+
+_estimates = {BASIC: SEARCH_BASIC_ESTIMATE_SECONDS, ADVANCED: SEARCH_ADVANCED_ESTIMATE_SECONDS}
+
+
+def search_estimate(depth: str) -> float:
+    """Expected seconds for one search at this depth (moving average of observed searches)"""
+    return _estimates.get(depth, 0.0)
+
+
+def record_search(depth: str, elapsed: float, found: bool):
+    """Report a finished (or timed out) search so estimates track real latency"""
+    SEARCH_SECONDS.observe(elapsed, depth=depth, result="found" if found else "empty")
+    if depth in _estimates:
+        _estimates[depth] += _ESTIMATE_WEIGHT * (elapsed - _estimates[depth])
+
+
+def _preferred(missing_fields: List[str], catalog: bool, cached: bool, search_available: bool) -> Dict:
+    if catalog:
+        return {"decision": SKIP, "reason": "catalog"}
+    if cached:
+        return {"decision": CACHED, "reason": "search_cache"}
+    searchable = [field for field in missing_fields if field in _SEARCHABLE_FIELDS]
+    if not searchable:
+        return {"decision": SKIP, "reason": "timings_only"}
+    if not search_available:
+        return {"decision": SKIP, "reason": "search_unavailable"}
+    if len(searchable) >= SEARCH_ADVANCED_MIN_FIELDS:
+        return {"decision": ADVANCED, "reason": "fields"}
+    return {"decision": BASIC, "reason": "fields"}
+
+
+def _projected_seconds(plans: List[Dict], concurrency: int) -> float:
+    """Wall time of the planned searches, run `concurrency` at a time (longest first)"""
+    costs = sorted((search_estimate(plan["decision"]) for plan in plans), reverse=True)
+    return sum(costs[::max(1, concurrency)])
+
+
+def plan_searches(
+    candidates: List[Dict],
+    elapsed: float,
+    concurrency: int,
+    search_available: bool = True
+) -> List[Dict]:
+    """
+    Choose a search depth for each medicine
+
+    Args:
+        candidates: One dict per medicine with "missing_fields", "catalog"
+            (the catalog has an entry) and "cached" (a search result is cached)
+        elapsed: Seconds the upload has already taken
+        concurrency: Searches run at the same time
+        search_available: Whether web search can be used at all
+
+    Returns:
+        One plan per candidate: {"decision", "reason", "estimate_ms"}; the
+        decision is skip, cached, basic or advanced
+    """
+    plans = [
+        _preferred(c["missing_fields"], c.get("catalog", False), c.get("cached", False), search_available)
+        for c in candidates
+    ]
+    need = [sum(1 for field in c["missing_fields"] if field in _SEARCHABLE_FIELDS) for c in candidates]
+
+    # Over budget: step searches down (advanced -> basic -> skip), fewest missing fields first
+    available = ENRICHMENT_LATENCY_BUDGET_SECONDS - elapsed - ENRICHMENT_LLM_RESERVE_SECONDS
+    while True:
+        searches = [i for i, plan in enumerate(plans) if plan["decision"] in (BASIC, ADVANCED)]
+        if not searches or _projected_seconds([plans[i] for i in searches], concurrency) <= available:
+            break
+        advanced = [i for i in searches if plans[i]["decision"] == ADVANCED]
+        plan = plans[min(advanced or searches, key=lambda i: need[i])]
+        plan["decision"] = BASIC if plan["decision"] == ADVANCED else SKIP
+        plan["reason"] = "budget"
+
+    for plan in plans:
+        plan["estimate_ms"] = round(search_estimate(plan["decision"]) * 1000)
+        PLAN_DECISIONS.inc(decision=plan["decision"], reason=plan["reason"])
+    return plans
+
+
+def search_timeout(elapsed: float, limit: float) -> float:
+    """Per-search timeout: the configured limit, cut to what the budget has left"""
+    remaining = ENRICHMENT_LATENCY_BUDGET_SECONDS - elapsed - ENRICHMENT_LLM_RESERVE_SECONDS
+    return max(0.5, min(limit, remaining))
+
+
+def _append_log(records: List[Dict]):
+    with open(ENRICHMENT_PLAN_LOG, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+async def record_outcomes(records: List[Dict]):
+    """
+    Count each planned medicine's outcome and append it to ENRICHMENT_PLAN_LOG
+
+    Args:
+        records: Plan entries extended with "enriched" (and the missing
+            fields, confidence and search time) once enrichment finished
+    """
+    for record in records:
+        PLAN_OUTCOMES.inc(decision=record["decision"], outcome="enriched" if record.get("enriched") else "failed")
+    if ENRICHMENT_PLAN_LOG and records:
+        stamped = [{"at": round(time.time(), 3), **record} for record in records]
+        try:
+            await asyncio.to_thread(_append_log, stamped)
+        except OSError as e:
+            print(f"[PLANNER] Could not write {ENRICHMENT_PLAN_LOG}: {str(e)}")
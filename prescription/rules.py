@@ -0,0 +1,534 @@
+"""
+Rule-Based Prescription Parser
+Parses clean, typed prescriptions locally using the same abbreviation rules
+the LLM prompt encodes (TDS/BD/OD/Q8H -> frequency -> timings), and scores
+how much of the text it understood so the caller can decide whether the
+LLM is still needed.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RULE_PARSER_ENABLED = os.getenv("RULE_PARSER_ENABLED", "true").lower() == "true"
+# Below this confidence the text is sent to the LLM parser instead
+RULE_PARSER_MIN_CONFIDENCE = float(os.getenv("RULE_PARSER_MIN_CONFIDENCE", "0.85"))
+
+# Standard frequency -> reminder timings (mirrors the LLM parsing prompt)
+FREQUENCY_TIMINGS = {
+    "once a day": ["morning"],
+    "twice a day": ["morning", "evening"],
+    "thrice a day": ["morning", "afternoon", "evening"],
+    "four times a day": ["morning", "afternoon", "evening", "night"],
+}
+_ALL_TIMINGS = ("morning", "afternoon", "evening", "night")
+
+# Prescription abbreviations -> standard frequency
+FREQUENCY_CODES = {
+    "od": "once a day", "qd": "once a day", "once": "once a day", "daily": "once a day",
+    "bd": "twice a day", "bid": "twice a day", "twice": "twice a day",
+    "tds": "thrice a day", "tid": "thrice a day", "thrice": "thrice a day",
+    "qid": "four times a day", "qds": "four times a day",
+    "q6h": "four times a day", "q8h": "thrice a day", "q12h": "twice a day", "q24h": "once a day",
+}
+
+# Single-time codes carry their own timing
+TIMED_CODES = {"hs": ["night"], "qhs": ["night"]}
+
+# Plain words that only count as a frequency inside an already recognized medicine line
+_FREQUENCY_WORDS = {"once", "daily", "twice", "thrice"}
+
+# "As needed" medicines are not scheduled
+AS_NEEDED = re.compile(r"\b(sos|prn|p\.r\.n\.?|if needed|when required|as needed)\b", re.IGNORECASE)
+
+DOSAGE_FORMS = r"tab|tablet|cap|capsule|syp|syrup|susp|inj|injection|oint|cream|gel|drops?|inh|sachet"
+
+# "TAB ", "Caps. ", and the handwritten shorthand "T." / "C."
+_FORM_PREFIX = re.compile(rf"^(?:(?:{DOSAGE_FORMS})s?\.?\s+|[tc]\.\s*)", re.IGNORECASE)
+_NUMBERING = re.compile(r"^\s*(?:\d{1,2}\s*[.)]|[-*•])\s*")
+_DOSAGE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(mg|mcg|g|gm|ml|iu|units?|%)(?![a-z])", re.IGNORECASE)
+# Count-based doses: "1 tab", "1/2 tab", "1½ tabs", "half tab", "2 puffs", "10 drops"
+_QUANTITY_UNIT = r"(tab|tablet|cap|capsule|puff|drop)s?\b"
+_QUANTITY = re.compile(
+    rf"(?<![\w/.\-])(\d+\s+\d+\s*/\s*\d+|\d+\s*/\s*\d+|\d*[½¼¾]|\d+(?:\.\d+)?|half)\s*{_QUANTITY_UNIT}",
+    re.IGNORECASE
+)
+# Any number-like token in front of a count unit; it must be read whole by _QUANTITY
+# ("l/2 tab" read as "2 tab" would be a 4x dose)
+_QUANTITY_TOKEN = re.compile(rf"(?<!\S)\S*[\d½¼¾]\S*?\s*{_QUANTITY_UNIT}", re.IGNORECASE)
+_QUANTITY_UNITS = {"tab": "tablet", "cap": "capsule"}
+_FRACTIONS = {"½": "1/2", "¼": "1/4", "¾": "3/4", "half": "1/2"}
+_BARE_NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+# 1-0-1 / 1-1-1-1 dose patterns: positions are morning-afternoon-night (or m-a-e-n);
+# each slot is a count of units ("2-0-0", "1/2-0-1/2", "½-0-½") and the pattern may not
+# start or end inside a fraction ("2-0-1" is not in "1/2-0-1/2")
+_DOSE_SLOT = r"(\d\s*/\s*\d|[0-2]?[½¼¾]|[0-2](?:\.5)?)"
+_DOSE_PATTERN = re.compile(
+    rf"(?<![\w/.]){_DOSE_SLOT}\s*-\s*{_DOSE_SLOT}\s*-\s*{_DOSE_SLOT}(?:\s*-\s*{_DOSE_SLOT})?(?![\w/]|\.\d)"
+)
+# Anything shaped like a dose pattern; if _DOSE_PATTERN can't read it whole ("1-l/2-1",
+# "1-1-1-1-1") the line goes to the LLM
+_DOSE_PATTERN_LIKE = re.compile(r"(?<![\w/.])[\dlIoO½¼¾/.]+(?:\s*-\s*[\dlIoO½¼¾/.]+){2,}(?![\w/])")
+_DURATION = re.compile(
+    r"(?:\b(?:x|for)\s*\d+\s*(?:d|days?|wks?|weeks?|m|months?)\b|\b\d+\s*(?:d|days?|wks?|weeks?)\b)",
+    re.IGNORECASE
+)
+# Lab results and vitals: concentrations, reference ranges, BP readings, pulse/SpO2
+# (only checked on lines without a dosage + frequency: "Amlodipine 5mg OD for BP" is a medicine)
+_LAB_VALUE = re.compile(
+    r"\b(?:g|gm|mg|mcg|ng|pg|mmol|mEq|iu|u)\s*/\s*(?:dl|l|ml)\b|/\s*cumm\b|\bmm\s*hg\b|"
+    r"\(\s*\d+(?:\.\d+)?\s*-\s*\d+(?:\.\d+)?\s*\)|\bbp\s*[:\-]?\s*\d{2,3}\s*/\s*\d{2,3}\b|"
+    r"\b(?:spo2|pulse|hba1c|lakh)\b",
+    re.IGNORECASE
+)
+# "Albendazole 400": a drug-like word followed by a bare strength
+_NAME_AND_STRENGTH = re.compile(r"^[A-Za-z][A-Za-z\-]{3,}\s+\d{2,4}\b")
+_WORD = re.compile(r"[a-z0-9.]+", re.IGNORECASE)
+
+_PATTERN_COUNTS = {1: "once a day", 2: "twice a day", 3: "thrice a day", 4: "four times a day"}
+
+# Schedules that aren't daily: weekly/monthly, alternate days, "every 3 days", "once in 15 days"
+_INTERVAL = re.compile(
+    r"\b(?:week|weeks|weekly|wk|wkly|month|months|monthly|fortnight|fortnightly|biweekly|alternate|alt|"
+    r"other\s*day|every\s*\d+\s*(?:d|days?)|in\s*\d+\s*days?|qod|eod|q\d+d)\b",
+    re.IGNORECASE
+)
+# Course lengths ("x 8 weeks", "for 1 month") are not intervals
+_COURSE = re.compile(r"\b(?:x|for)\s*\d+\s*(?:d|days?|wks?|weeks?|m|months?)\b", re.IGNORECASE)
+
+
+def has_interval_qualifier(text: str) -> bool:
+    """Whether a frequency/line describes a non-daily schedule ("once a week", "alternate days")"""
+    return bool(_INTERVAL.search(_COURSE.sub(" ", str(text or ""))))
+
+
+def _quantity_amount(text: str) -> Tuple[str, float]:
+    """ "1/2" / "½" / "half" -> ("1/2", 0.5), "1 1/2" / "1½" -> ("1 1/2", 1.5)"""
+    text = " ".join(text.lower().split())
+    for symbol, fraction in _FRACTIONS.items():
+        text = text.replace(symbol, f" {fraction}")
+    text = re.sub(r"\s*/\s*", "/", text).strip()
+    value = 0.0
+    for part in text.split():
+        numerator, _, denominator = part.partition("/")
+        value += float(numerator) / float(denominator) if denominator else float(numerator)
+    return text, value
+
+
+def _pattern_doses(match: re.Match) -> List[Tuple[str, float]]:
+    """Per-slot (amount, value) of a dose pattern: "1/2-0-1/2" -> [("1/2", 0.5), ("0", 0.0), ("1/2", 0.5)]"""
+    return [_quantity_amount(slot) for slot in match.groups() if slot is not None]
+
+
+def _frequency_from_pattern(match: re.Match) -> Tuple[str, List[str]]:
+    doses = _pattern_doses(match)
+    names = ["morning", "afternoon", "night"] if len(doses) == 3 else ["morning", "afternoon", "evening", "night"]
+    timings = [name for name, (_, value) in zip(names, doses) if value > 0]
+    return _PATTERN_COUNTS.get(len(timings), "Unknown"), timings
+
+
+def _has_unread_dose_pattern(text: str) -> bool:
+    """Whether the text has a dose-pattern-like token _DOSE_PATTERN can't read whole"""
+    return any(
+        re.search(r"\d", token.group(0)) and not _DOSE_PATTERN.fullmatch(token.group(0))
+        for token in _DOSE_PATTERN_LIKE.finditer(text)
+    )
+
+
+def _find_frequency(text: str) -> Tuple[Optional[str], List[str], Tuple[int, int]]:
+    """Frequency, timings and the span they were read from (or None)"""
+    pattern = _DOSE_PATTERN.search(text)
+    if pattern:
+        frequency, timings = _frequency_from_pattern(pattern)
+        if timings:
+            return frequency, timings, pattern.span()
+
+    for word in _WORD.finditer(text):
+        code = word.group(0).lower().replace(".", "")
+        if code in FREQUENCY_CODES:
+            frequency = FREQUENCY_CODES[code]
+            return frequency, FREQUENCY_TIMINGS[frequency], word.span()
+        if code in TIMED_CODES:
+            return "once a day", TIMED_CODES[code], word.span()
+    return None, [], (0, 0)
+
+
+def _has_frequency_code(text: str) -> bool:
+    if _DOSE_PATTERN.search(text):
+        return True
+    for word in _WORD.finditer(text):
+        code = word.group(0).lower().replace(".", "")
+        if (code in FREQUENCY_CODES and code not in _FREQUENCY_WORDS) or code in TIMED_CODES or code == "stat":
+            return True
+    return False
+
+
+def _classify_line(line: str) -> str:
+    """
+    "medicine" for lines with a dosage form prefix or a strength with unit,
+    "suspect" for lines with only a dose pattern/frequency abbreviation (a
+    medicine line the rules can't read), otherwise "other"
+    """
+    body = _NUMBERING.sub("", line)
+    if _FORM_PREFIX.match(body):
+        return "medicine"
+    dosage = _DOSAGE.search(body)
+    if dosage and _find_frequency(body)[0]:
+        return "medicine"
+    if _LAB_VALUE.search(body):
+        return "other"
+    if dosage:
+        return "medicine"
+    if _has_frequency_code(body) or _NAME_AND_STRENGTH.match(body):
+        return "suspect"
+    return "other"
+
+
+def parse_medicine_line(line: str) -> Optional[Tuple[Dict, float]]:
+    """
+    Parse one prescription line like "1. TAB PAN 40mg 1-0-0 x 5 days"
+
+    Returns:
+        Tuple of (medicine_dict, line_score 0-1), or None if no medicine name
+        could be read. Fields that could not be read are "Unknown".
+    """
+    body = _NUMBERING.sub("", line).strip()
+    # Weekly/monthly/alternate-day regimens don't fit the daily vocabulary: leave them to the LLM
+    if has_interval_qualifier(body):
+        return None
+    form_match = _FORM_PREFIX.match(body)
+    form = form_match.group(0).strip().rstrip(".").lower() if form_match else ""
+    body = body[form_match.end():] if form_match else body
+    body = _DURATION.sub(" ", body)
+
+    frequency, timings, freq_span = _find_frequency(body)
+    dosage_match = _DOSAGE.search(body) or _QUANTITY.search(body)
+    # A count dose the rules can only read part of ("l/2 tab", "1-1/2 tab", "1-l/2-1")
+    partial_quantity = any(not _QUANTITY.fullmatch(token.group(0)) for token in _QUANTITY_TOKEN.finditer(body))
+    partial_quantity = partial_quantity or _has_unread_dose_pattern(body)
+    # Units per dose from a dose pattern: "2-0-0" is two units once a day
+    pattern = _DOSE_PATTERN.search(body)
+    counts = {amount: value for amount, value in _pattern_doses(pattern) if value > 0} if pattern else {}
+    uneven_counts = len(set(counts.values())) > 1
+
+    # The name is everything before the first strength/frequency token
+    cut_points = [len(body)]
+    if dosage_match:
+        cut_points.append(dosage_match.start())
+    if frequency:
+        cut_points.append(freq_span[0])
+    name_tokens = body[:min(cut_points)].split()
+
+    # "TAB PAN 40 BD": a trailing bare number on a tablet/capsule is its strength in mg
+    dosage = None
+    inferred_unit = False
+    if dosage_match and dosage_match.re is _QUANTITY:
+        amount, value = _quantity_amount(dosage_match.group(1))
+        unit = dosage_match.group(2).lower()
+        unit = _QUANTITY_UNITS.get(unit, unit)
+        dosage = f"{amount} {unit}" + ("s" if value > 1 else "")
+    elif dosage_match:
+        dosage = f"{dosage_match.group(1)}{dosage_match.group(2).lower()}"
+    elif len(name_tokens) > 1 and _BARE_NUMBER.match(name_tokens[-1]) and form.startswith(("tab", "cap")):
+        dosage = f"{name_tokens.pop()}mg"
+        inferred_unit = True
+    # Keep a per-dose count other than 1 next to the strength ("2 x 40mg", "1/2 x 120mg")
+    if len(counts) == 1 and list(counts.values())[0] != 1 and not (dosage_match and dosage_match.re is _QUANTITY):
+        count = list(counts)[0]
+        if dosage:
+            dosage = f"{count} x {dosage}"
+        elif form.startswith(("tab", "cap")):
+            unit = "tablet" if form.startswith("tab") else "capsule"
+            dosage = f"{count} {unit}" + ("s" if counts[count] > 1 else "")
+
+    name = " ".join(t for t in name_tokens if re.search(r"[a-z]", t, re.IGNORECASE)).strip(" .,:-")
+    if len(name) < 3:
+        return None
+
+    score = 0.4
+    score += 0.3 if dosage else 0.0
+    score -= 0.05 if inferred_unit else 0.0
+    score -= 0.4 if partial_quantity else 0.0
+    # "1-1/2-1": a different count per dose doesn't fit one dosage field
+    score -= 0.4 if uneven_counts else 0.0
+    score += 0.3 if frequency and frequency != "Unknown" else 0.0
+    # Names with stray symbols are usually OCR noise
+    if not re.fullmatch(r"[A-Za-z][A-Za-z0-9 \-+/]*", name):
+        score -= 0.2
+
+    medicine = {
+        "medicine_name": name.title() if name.isupper() else name,
+        "dosage": dosage or "Unknown",
+        "frequency": frequency or "Unknown",
+        "timings": timings,
+    }
+    return medicine, max(score, 0.0)
+
+
+def parse_prescription_rules(raw_text: str) -> Tuple[List[Dict], float]:
+    """
+    Parse prescription text with local rules
+
+    Confidence is the lowest line score of the parsed medicines (one unread
+    dose or frequency sends the whole text to the LLM), scaled down by the
+    share of medicine-looking lines that could not be parsed. A text with no
+    medicines scores 0.
+
+    Returns:
+        Tuple of (medicines, confidence 0-1)
+    """
+    medicines = []
+    scores = []
+    unparsed = 0
+    for line in raw_text.splitlines():
+        line = line.strip()
+        kind = _classify_line(line) if line else "other"
+        if kind == "other":
+            continue
+        if AS_NEEDED.search(line):
+            continue  # Recognized and intentionally skipped
+        parsed = parse_medicine_line(line) if kind == "medicine" else None
+        if parsed is None:
+            unparsed += 1
+            continue
+        medicine, score = parsed
+        medicines.append(medicine)
+        scores.append(score)
+
+    if not medicines:
+        return [], 0.0
+    coverage = len(medicines) / (len(medicines) + unparsed)
+    confidence = round(min(scores) * coverage, 3)
+    return medicines, confidence
+
+
+_FREQUENCY_PHRASES = [
+    (re.compile(r"\b(four|4)\s*(times|x)\b"), "four times a day"),
+    (re.compile(r"\b(thrice|three\s*times|3\s*(times|x))\b"), "thrice a day"),
+    (re.compile(r"\b(twice|two\s*times|2\s*(times|x))\b"), "twice a day"),
+    (re.compile(r"\b(once|one\s*time|1\s*(time|x)|daily|every\s*day)\b"), "once a day"),
+]
+_EVERY_HOURS = re.compile(r"\bevery\s*(\d+)\s*(?:hours?|hrs?|h)\b")
+_HOURS_TO_FREQUENCY = {6: "four times a day", 8: "thrice a day", 12: "twice a day", 24: "once a day"}
+_NIGHT_WORDS = re.compile(r"\b(night|bedtime|hs)\b")
+# "... a day", "per day", "/day", "every morning": the period a count applies to
+_PERIOD = re.compile(r"(?:\b(?:a|an|per|each|every|in\s+a)\s+|/\s*)([a-z]+)")
+_DAILY_PERIODS = {"day", "days", "daily", "morning", "afternoon", "evening", "night", "bedtime", "noon"}
+_UNKNOWN_VALUES = {"", "n/a", "unknown", "as prescribed", "unable to determine"}
+
+
+def frequency_timings(frequency: str) -> Tuple[Optional[str], List[str]]:
+    """
+    Standard frequency and its reminder timings for a free-text frequency
+
+    Returns:
+        Tuple of (standard_frequency, timings), or (None, []) when the text
+        isn't a recognizable daily schedule (including "as needed" and
+        weekly/monthly/every-N-days schedules)
+    """
+    text = str(frequency or "").strip().lower()
+    if text in _UNKNOWN_VALUES or AS_NEEDED.search(text) or has_interval_qualifier(text):
+        return None, []
+    if text in FREQUENCY_TIMINGS:
+        return text, FREQUENCY_TIMINGS[text]
+
+    pattern = _DOSE_PATTERN.fullmatch(text)
+    if pattern:
+        standard, timings = _frequency_from_pattern(pattern)
+        return (standard, timings) if timings else (None, [])
+
+    code = text.replace(".", "").replace(" ", "")
+    if code in FREQUENCY_CODES:
+        standard = FREQUENCY_CODES[code]
+        return standard, FREQUENCY_TIMINGS[standard]
+    if code in TIMED_CODES:
+        return "once a day", TIMED_CODES[code]
+
+    standard = None
+    hours = _EVERY_HOURS.search(text)
+    if hours:
+        standard = _HOURS_TO_FREQUENCY.get(int(hours.group(1)))
+    elif all(period in _DAILY_PERIODS for period in _PERIOD.findall(_COURSE.sub(" ", text))):
+        # Counts only mean "a day" with a per-day qualifier or none ("twice an hour" isn't a schedule)
+        for pattern, value in _FREQUENCY_PHRASES:
+            if pattern.search(text):
+                standard = value
+                break
+    if standard is None:
+        return None, []
+    if standard == "once a day" and _NIGHT_WORDS.search(text):
+        return standard, ["night"]
+    return standard, FREQUENCY_TIMINGS[standard]
+
+
+def complete_from_rules(medicine: Dict) -> Tuple[Dict, List[str]]:
+    """
+    Fill fields that follow deterministically from the others: timings from a
+    known frequency, and frequency from a list of timings
+
+    Returns:
+        Tuple of (medicine, fields filled locally); the input dict is not modified
+    """
+    timings = medicine.get("timings")
+    valid_timings = [t for t in timings if t in _ALL_TIMINGS] if isinstance(timings, list) else []
+    frequency = medicine.get("frequency")
+    frequency_known = str(frequency or "").strip().lower() not in _UNKNOWN_VALUES
+
+    if not valid_timings and frequency_known:
+        _, derived = frequency_timings(frequency)
+        if derived:
+            return {**medicine, "timings": derived}, ["timings"]
+
+    if valid_timings and not frequency_known:
+        count = len(set(valid_timings))
+        if count in _PATTERN_COUNTS:
+            return {**medicine, "frequency": _PATTERN_COUNTS[count]}, ["frequency"]
+
+    return medicine, []
+
+
+def medicine_schema_errors(medicine) -> List[str]:
+    """
+    Check a parsed medicine against the expected fields and the frequency/timing vocabulary
+
+    Returns:
+        Names of the fields that are missing, mistyped or outside the vocabulary
+        (empty when the medicine is valid). Unknown dosage/frequency is allowed.
+    """
+    if not isinstance(medicine, dict):
+        return ["medicine"]
+
+    errors = []
+    name = medicine.get("medicine_name")
+    if not isinstance(name, str) or name.strip().lower() in _UNKNOWN_VALUES:
+        errors.append("medicine_name")
+    if not isinstance(medicine.get("dosage"), str):
+        errors.append("dosage")
+
+    frequency = medicine.get("frequency")
+    timings = medicine.get("timings")
+    if not isinstance(timings, list) or any(t not in _ALL_TIMINGS for t in timings):
+        errors.append("timings")
+        timings = None
+
+    if not isinstance(frequency, str):
+        errors.append("frequency")
+    elif frequency.strip().lower() not in _UNKNOWN_VALUES:
+        standard, expected = frequency_timings(frequency)
+        if standard is None:
+            errors.append("frequency")
+        elif timings and len(set(timings)) != len(expected):
+            # e.g. "twice a day" with three timings
+            errors.append("timings")
+    return errors
+
+
+# Token budget for OCR text sent to the LLM parser (llama-3 averages ~4 characters per token)
+OCR_PROMPT_MAX_TOKENS = int(os.getenv("OCR_PROMPT_MAX_TOKENS", "2000"))
+
+_PHONE = re.compile(r"(?:\+?\d[\d\s\-()]{8,}\d)")
+_CONTACT = re.compile(r"@|\bwww\.|https?://|\b(?:ph|phone|mob|mobile|tel|fax|email|e-mail)\b\s*[:.]?", re.IGNORECASE)
+_ADDRESS = re.compile(
+    r"\b(?:road|rd|street|st|nagar|colony|floor|building|bldg|near|opp|cross|main|sector|lane|"
+    r"city|district|dist|pin|pincode)\b\.?|\b\d{6}\b",
+    re.IGNORECASE
+)
+_BOILERPLATE = re.compile(
+    r"\b(?:reg(?:istration)?\.?\s*no|timings?\s*:|mon\s*-\s*sat|sunday|closed|not valid|medico.?legal|"
+    r"signature|stamp|consult(?:ation)?\s*(?:fee|hours)|appointment|visit us|follow us|disclaimer|"
+    r"computer generated|page \d+ of \d+)\b",
+    re.IGNORECASE
+)
+_SECTION_MARKERS = re.compile(r"^(?:rx|r/x|adv|advice|medications?|prescription|treatment|tt)\b[:.]?", re.IGNORECASE)
+_INSTRUCTIONS = re.compile(r"\b(?:before|after|with)\s+(?:food|meals?|breakfast|lunch|dinner)\b|\bempty stomach\b", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count (no tokenizer dependency)"""
+    pieces = len(re.findall(r"\w+|[^\w\s]", text))
+    return max(pieces, (len(text) + 3) // 4)
+
+
+def score_line(line: str) -> int:
+    """
+    Relevance of one OCR line to medicine extraction: positive for medicine
+    lines and their markers, negative for contact details, addresses and
+    letterhead/footer boilerplate
+    """
+    kind = _classify_line(line)
+    if kind == "medicine":
+        return 3
+    if kind == "suspect":
+        return 2
+    if _SECTION_MARKERS.match(line) or _INSTRUCTIONS.search(line) or AS_NEEDED.search(line):
+        return 1
+    score = 0
+    if _PHONE.search(line) or _CONTACT.search(line):
+        score -= 2
+    if _ADDRESS.search(line) or _LAB_VALUE.search(line):
+        score -= 1
+    if _BOILERPLATE.search(line):
+        score -= 2
+    return score
+
+
+def compact_ocr_text(raw_text: str, max_tokens: int = OCR_PROMPT_MAX_TOKENS) -> str:
+    """
+    Shrink OCR text for the LLM prompt while keeping every medicine line
+
+    Blank/symbol-only lines always go. Only when the text is over max_tokens
+    are exact repeats of noise lines dropped, then lines by relevance, noise
+    first (contact details, addresses, boilerplate), until it fits; a line
+    that merely looks like noise is never dropped from a text that already
+    fits. Lines next to a medicine line get a bonus since they often carry
+    its instructions, and a line right after a medicine line is never dropped
+    as a repeat (two medicines can share the same "1-0-1 x 5 days" line).
+    Original line order is preserved.
+    """
+    lines = [line.strip() for line in raw_text.splitlines()]
+    candidates = []
+    for index, line in enumerate(lines):
+        key = re.sub(r"\W+", "", line.lower())
+        if len(key) < 2:
+            continue
+        candidates.append([index, line, score_line(line), key])
+
+    medicine_indexes = {index for index, _, score, _ in candidates if score >= 2}
+    for candidate in candidates:
+        if candidate[2] < 2 and (candidate[0] - 1 in medicine_indexes or candidate[0] + 1 in medicine_indexes):
+            candidate[2] += 1
+
+    kept = candidates
+    tokens = sum(estimate_tokens(c[1]) + 1 for c in kept)
+    if tokens > max_tokens:
+        # Repeated letterhead/footer noise goes first
+        seen = set()
+        for candidate in kept:
+            if tokens <= max_tokens:
+                break
+            repeat = candidate[3] in seen
+            seen.add(candidate[3])
+            if repeat and candidate[2] < 1 and candidate[0] - 1 not in medicine_indexes:
+                tokens -= estimate_tokens(candidate[1]) + 1
+                candidate[2] = None
+        kept = [c for c in kept if c[2] is not None]
+    if tokens > max_tokens:
+        # Drop lowest score first; among equals, drop from the end (letterhead context comes first)
+        for candidate in sorted(kept, key=lambda c: (c[2], -c[0])):
+            if tokens <= max_tokens or candidate[2] >= 2:
+                break
+            tokens -= estimate_tokens(candidate[1]) + 1
+            candidate[2] = None
+        kept = [c for c in kept if c[2] is not None]
+
+    compacted = "\n".join(c[1] for c in kept)
+    if not compacted.strip():
+        # Nothing recognizable: let the LLM see the (budget-capped) original
+        compacted = raw_text.strip()
+    if estimate_tokens(compacted) > max_tokens:
+        # Only medicine lines left and still too long: cut at a line boundary
+        compacted = compacted[:max_tokens * 4].rsplit("\n", 1)[0]
+    return compacted
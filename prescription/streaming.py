@@ -0,0 +1,115 @@
+"""
+Streaming Prescription Upload
+Runs the upload pipeline as a Server-Sent Events stream: each medicine is sent
+as soon as the parse step produces it, then enrichment updates as they land,
+then the saved result.
+
+Events (each `data:` is JSON):
+    stage        {"stage", "progress"}
+    ocr          {"characters", "cached", "failed_pages"}
+    medicine     {"index", "medicine"}
+    parsed       {"medicines_detected", "parse_info"}
+    enrichment   {"index", "medicine", "enriched"}
+    done         {"status_code", ...upload response payload}
+    error        {"status_code", "detail"}
+"""
+
+import json
+import asyncio
+import traceback
+from typing import AsyncIterator, BinaryIO
+
+from fastapi import HTTPException
+
+from prescription.enrichment import enrich_medicines
+from prescription.metrics import start_timer, timed_stage
+from prescription.pipeline import (
+    STAGE_PROGRESS, build_analysis, check_image_quality, read_prescription_text, save_prescription,
+    stream_parse_prescription
+)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def stage_event(stage: str) -> str:
+    return sse_event("stage", {"stage": stage, "progress": STAGE_PROGRESS[stage]})
+
+
+async def stream_prescription(
+    user_id: str,
+    image: BinaryIO,
+    filename: str,
+    content_type: str = "image/jpeg",
+    include_timings: bool = False
+) -> AsyncIterator[str]:
+    """
+    Process an upload (user already verified), yielding SSE-formatted events
+
+    Errors are reported as a final "error" event since the HTTP status has
+    already been sent by the time they can occur.
+    """
+    timer = start_timer()
+    try:
+        yield stage_event("quality_check")
+        quality_warnings, quality_metrics = await check_image_quality(image, content_type)
+
+        yield stage_event("ocr")
+        text, ocr_cached, failed_pages = await read_prescription_text(image, filename, content_type, quality_warnings)
+        yield sse_event("ocr", {"characters": len(text), "cached": ocr_cached, "failed_pages": failed_pages})
+
+        yield stage_event("parsing")
+        medicines = []
+        parse_info = {}
+        with timed_stage("parse"):
+            async for medicine in stream_parse_prescription(text, parse_info):
+                if not medicines:
+                    timer.mark("first_medicine")
+                medicines.append(medicine)
+                yield sse_event("medicine", {"index": len(medicines) - 1, "medicine": medicine})
+        yield sse_event("parsed", {"medicines_detected": len(medicines), "parse_info": parse_info})
+
+        # Enrichment reports through a callback; relay its updates as they arrive
+        yield stage_event("enriching")
+        updates: asyncio.Queue = asyncio.Queue()
+
+        async def on_update(index: int, medicine: dict, enriched: bool):
+            await updates.put(sse_event("enrichment", {"index": index, "medicine": medicine, "enriched": enriched}))
+
+        async def run_enrichment():
+            with timed_stage("enrichment"):
+                return await enrich_medicines(medicines, on_update)
+
+        task = asyncio.create_task(run_enrichment())
+        try:
+            while not task.done() or not updates.empty():
+                getter = asyncio.ensure_future(updates.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            enriched_medicines, enrichment_stats = task.result()
+        finally:
+            # Client disconnected mid-stream: don't leave enrichment running
+            task.cancel()
+
+        yield stage_event("saving")
+        analysis = build_analysis(
+            text, ocr_cached, failed_pages, enriched_medicines, parse_info, enrichment_stats,
+            quality_warnings, quality_metrics
+        )
+        response_data, status_code = await save_prescription(user_id, analysis)
+        timings = timer.finish()
+        if include_timings:
+            response_data["timings"] = timings
+        yield sse_event("done", {"status_code": status_code, **response_data})
+
+    except HTTPException as e:
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        print(f"[STREAM] Error in stream_prescription: {str(e)}")
+        traceback.print_exc()
+        yield sse_event("error", {"status_code": 500, "detail": str(e)})
@@ -0,0 +1,116 @@
+"""
+Upload Handling
+Streams uploaded prescriptions in chunks into a private spooled temp buffer,
+rejecting oversized or non-image uploads as early as possible.
+"""
+
+import os
+import tempfile
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum accepted upload size (MB)
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "10"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Uploads smaller than this stay in memory; larger ones roll over to a temp file
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(2 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+# Maximum number of files accepted in one batch upload
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "20"))
+
+# Request body limits for upload routes
+UPLOAD_PATH_LIMITS = {
+    "/api/upload-prescription": MAX_UPLOAD_BYTES,
+    "/api/upload-prescription/stream": MAX_UPLOAD_BYTES,
+    "/api/upload-prescriptions": MAX_UPLOAD_BYTES * BATCH_MAX_FILES,
+}
+
+# Multipart framing adds a little on top of the file itself
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def sniff_content_type(header: bytes) -> Optional[str]:
+    """Identify supported file types from their leading magic bytes"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"BM"):
+        return "image/bmp"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if header.startswith(b"%PDF-"):
+        return "application/pdf"
+    return None
+
+
+def _too_large_detail() -> str:
+    return f"File too large. Maximum upload size is {MAX_UPLOAD_MB:g}MB."
+
+
+async def upload_size_guard(request: Request, call_next):
+    """
+    HTTP middleware: reject oversized uploads from their Content-Length
+    before the multipart body is read and parsed
+    """
+    limit = UPLOAD_PATH_LIMITS.get(request.url.path)
+    if request.method == "POST" and limit is not None:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit():
+            if int(content_length) > limit + _MULTIPART_OVERHEAD_BYTES:
+                print(f"[UPLOAD] Rejected {content_length} byte request (limit {limit})")
+                return JSONResponse({"detail": _too_large_detail()}, status_code=413)
+    return await call_next(request)
+
+
+async def read_upload(file: UploadFile) -> Tuple[tempfile.SpooledTemporaryFile, str, int]:
+    """
+    Stream an uploaded file into a spooled temp buffer
+
+    Enforces MAX_UPLOAD_BYTES while reading and sniffs the magic bytes of the
+    first chunk, so bad uploads are rejected without buffering them fully.
+    The caller owns the returned buffer and must close it.
+
+    Returns:
+        Tuple of (buffer positioned at 0, sniffed content type, size in bytes)
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=_too_large_detail())
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, prefix="medimind_upload_")
+    try:
+        content_type = None
+        size = 0
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if content_type is None:
+                content_type = sniff_content_type(chunk[:16])
+                if content_type is None:
+                    raise HTTPException(
+                        status_code=415,
+                        detail="Unsupported file type. Please upload a PDF or a JPG, PNG, WEBP, GIF, BMP or TIFF image."
+                    )
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=_too_large_detail())
+            buffer.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+        buffer.seek(0)
+        return buffer, content_type, size
+    except BaseException:
+        buffer.close()
+        raise
@@ -0,0 +1,170 @@
+"""
+RedisLRUCache against an in-process fake Redis: get/set round trips,
+per-entry TTLs in the LRU index, and least-recently-used eviction.
+
+Usage:
+  python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db.cache as cache_module
+from db.cache import RedisLRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    """The subset of redis.asyncio the cache uses, with key expiry on a fake clock"""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.values = {}
+        self.zsets = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        entry = self.values.get(key)
+        if entry is None or entry[0] <= self.clock():
+            self.values.pop(key, None)
+            return None
+        return entry[1]
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = (self.clock() + ex if ex else float("inf"), value)
+        return True
+
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self.values.pop(key, None) is not None)
+
+    async def zadd(self, name, mapping):
+        self.zsets.setdefault(name, {}).update(mapping)
+        return len(mapping)
+
+    async def zrem(self, name, *members):
+        zset = self.zsets.get(name, {})
+        return sum(1 for member in members if zset.pop(member, None) is not None)
+
+    async def zcard(self, name):
+        return len(self.zsets.get(name, {}))
+
+    async def zrange(self, name, start, end):
+        ordered = sorted(self.zsets.get(name, {}).items(), key=lambda item: item[1])
+        return [member for member, _ in ordered[start:end + 1]]
+
+    async def zrangebyscore(self, name, low, high):
+        low, high = float(low), float(high)
+        ordered = sorted(self.zsets.get(name, {}).items(), key=lambda item: item[1])
+        return [member for member, score in ordered if low <= score <= high]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    clock = FakeClock()
+    redis = FakeRedis(clock)
+
+    async def get_redis():
+        return redis
+
+    monkeypatch.setattr(cache_module, "get_redis", get_redis)
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return redis, clock
+
+
+def test_get_set_round_trip(fake):
+    cache = RedisLRUCache("test", ttl_seconds=100, max_entries=10)
+
+    async def run():
+        assert await cache.get("a") is None
+        await cache.set("a", {"value": 1})
+        return await cache.get("a")
+
+    assert asyncio.run(run()) == {"value": 1}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.stats()["backend"] == "redis"
+
+
+def test_short_ttl_entry_is_pruned_from_index(fake):
+    redis, clock = fake
+    cache = RedisLRUCache("test", ttl_seconds=1000, max_entries=10)
+
+    async def run():
+        await cache.set("negative", {"value": None}, ttl_seconds=10)
+        await cache.set("positive", {"value": 1})
+        clock.now += 20
+        assert await cache.get("negative") is None
+        await cache.set("other", {"value": 2})
+
+    asyncio.run(run())
+    assert set(redis.zsets["test:lru"]) == {"positive", "other"}
+    assert set(redis.zsets["test:expiry"]) == {"positive", "other"}
+
+
+def test_evicts_least_recently_used(fake):
+    redis, clock = fake
+    cache = RedisLRUCache("test", ttl_seconds=1000, max_entries=2)
+
+    async def run():
+        await cache.set("a", {"value": "a"})
+        clock.now += 1
+        await cache.set("b", {"value": "b"})
+        clock.now += 1
+        # Reading "a" makes "b" the least recently used entry
+        await cache.get("a")
+        clock.now += 1
+        await cache.set("c", {"value": "c"})
+        return await cache.get("a"), await cache.get("b"), await cache.get("c")
+
+    assert asyncio.run(run()) == ({"value": "a"}, None, {"value": "c"})
+    assert cache.evictions == 1
+    assert set(redis.zsets["test:lru"]) == {"a", "c"}
+    assert set(redis.zsets["test:expiry"]) == {"a", "c"}
+
+
+def test_expired_entries_free_room_before_eviction(fake):
+    redis, clock = fake
+    cache = RedisLRUCache("test", ttl_seconds=1000, max_entries=2)
+
+    async def run():
+        await cache.set("short", {"value": 1}, ttl_seconds=5)
+        await cache.set("long", {"value": 2})
+        clock.now += 10
+        await cache.set("new", {"value": 3})
+        return await cache.get("long")
+
+    assert asyncio.run(run()) == {"value": 2}
+    assert cache.evictions == 0
@@ -0,0 +1,47 @@
+"""
+Catalog defaults: the usual dosage only fills a missing dosage and never
+replaces a strength written on the prescription.
+
+Usage:
+  python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.catalog import apply_catalog_defaults, lookup_medicine
+
+MISSING = ["dosage", "frequency", "timings"]
+
+
+def fill(name: str, dosage: str = "Unknown", missing=MISSING):
+    medicine = {"medicine_name": name, "dosage": dosage, "frequency": "Unknown", "timings": []}
+    match = lookup_medicine(name)
+    assert match is not None
+    return apply_catalog_defaults(medicine, match, missing)
+
+
+@pytest.mark.parametrize("name, dosage", [
+    ("TAB DOLO 650", "650mg"),
+    ("TAB DOLO", "650mg"),
+])
+def test_fills_missing_dosage(name, dosage):
+    medicine, fields = fill(name)
+    assert medicine["dosage"] == dosage
+    assert fields == MISSING
+
+
+def test_unlisted_written_strength_is_not_replaced():
+    medicine, fields = fill("TAB DOLO 15mg")
+    assert medicine["dosage"] == "Unknown"
+    assert fields == ["frequency", "timings"]
+
+
+def test_existing_dosage_is_kept():
+    medicine, fields = fill("TAB DOLO", dosage="2 x 500mg", missing=MISSING)
+    assert medicine["dosage"] == "2 x 500mg"
+    assert "dosage" not in fields
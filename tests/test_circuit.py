@@ -0,0 +1,134 @@
+"""
+CircuitBreaker state machine on a fake clock: opening on the failure rate,
+the half-open probe being the only call that closes or reopens the circuit,
+and probe slots given back by release().
+
+Usage:
+  python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prescription.circuit as circuit_module
+from prescription.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_module.time, "time", clock)
+    monkeypatch.setattr(circuit_module, "_breakers", [])
+    monkeypatch.setattr(circuit_module, "CIRCUIT_BREAKERS_ENABLED", True)
+    monkeypatch.setattr(circuit_module, "CIRCUIT_MIN_CALLS", 4)
+    monkeypatch.setattr(circuit_module, "CIRCUIT_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(circuit_module, "CIRCUIT_OPEN_SECONDS", 30)
+    return clock
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(circuit_module.CIRCUIT_MIN_CALLS):
+        breaker.record(True, 0.1, breaker.allow())
+    assert breaker.state == OPEN
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test", slow_call_seconds=5)
+    breaker.record(True, 0.1, breaker.allow())
+    breaker.record(True, 0.1, breaker.allow())
+    breaker.record(False, 0.1, breaker.allow())
+    # Three calls are below CIRCUIT_MIN_CALLS even at a 67% failure rate
+    assert breaker.state == CLOSED
+    breaker.record(False, 0.1, breaker.allow())
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.rejected == 1
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = CircuitBreaker("test", slow_call_seconds=5)
+    for _ in range(4):
+        breaker.record(False, 6.0, breaker.allow())
+    assert breaker.state == OPEN
+
+
+def test_only_probe_closes_circuit(clock):
+    breaker = CircuitBreaker("test", slow_call_seconds=5)
+    straggler = breaker.allow()
+    open_breaker(breaker)
+    clock.now += 30
+
+    probe = breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert probe is not None
+    # A second caller is rejected while the probe runs
+    assert breaker.allow() is None
+    # A call started before the circuit opened doesn't decide the half-open state
+    breaker.record(False, 0.1, straggler)
+    breaker.record(False, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(False, 0.1, probe)
+    assert breaker.state == CLOSED
+    assert breaker.status()["calls"] == 0
+
+
+def test_only_probe_reopens_circuit(clock):
+    breaker = CircuitBreaker("test", slow_call_seconds=5)
+    straggler = breaker.allow()
+    open_breaker(breaker)
+    clock.now += 30
+
+    probe = breaker.allow()
+    breaker.record(True, 0.1, straggler)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.1, probe)
+    assert breaker.state == OPEN
+    assert breaker.opened_at == clock.now
+    assert breaker.allow() is None
+
+
+def test_release_without_record_frees_probe_slot(clock):
+    breaker = CircuitBreaker("test", slow_call_seconds=5)
+    open_breaker(breaker)
+    clock.now += 30
+
+    probe = breaker.allow()
+    assert breaker.allow() is None
+    # Releasing someone else's ticket must not free the slot
+    breaker.release(probe + 100)
+    assert breaker.allow() is None
+    breaker.release(probe)
+    assert breaker.state == HALF_OPEN
+    next_probe = breaker.allow()
+    assert next_probe is not None
+    breaker.record(False, 0.1, next_probe)
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_guard_releases_probe(clock):
+    breaker = CircuitBreaker("test", slow_call_seconds=5)
+    open_breaker(breaker)
+    clock.now += 30
+
+    with pytest.raises(asyncio.CancelledError):
+        with breaker.guard():
+            raise asyncio.CancelledError
+    assert breaker.state == HALF_OPEN
+    with breaker.guard():
+        pass
+    assert breaker.state == CLOSED
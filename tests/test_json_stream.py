@@ -0,0 +1,67 @@
+"""
+JSONArrayStreamDecoder: objects come out as soon as their closing brace
+arrives, however the stream is chunked, and a truncated tail yields nothing.
+
+Usage:
+  python -m pytest tests
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.json_stream import JSONArrayStreamDecoder
+
+MEDICINES = [
+    {"medicine_name": "Dolo", "dosage": "650mg", "frequency": "thrice a day", "timings": ["morning", "afternoon", "evening"]},
+    {"medicine_name": "Pan \"D\" {40}", "dosage": "40mg", "frequency": "once a day", "timings": ["morning"]},
+    {"medicine_name": "Zyrtec \\ [10]", "dosage": "10mg", "frequency": "once a day", "timings": ["night"]},
+]
+DOCUMENT = "```json\n" + json.dumps({"medicines": MEDICINES}) + "\n```"
+
+
+def feed_all(decoder: JSONArrayStreamDecoder, chunks) -> list:
+    return [item for chunk in chunks for item in decoder.feed(chunk)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 64, len(DOCUMENT)])
+def test_objects_split_across_chunks(size):
+    decoder = JSONArrayStreamDecoder("medicines")
+    chunks = [DOCUMENT[i:i + size] for i in range(0, len(DOCUMENT), size)]
+    assert feed_all(decoder, chunks) == MEDICINES
+    assert decoder.done
+
+
+def test_object_is_returned_by_the_chunk_that_closes_it():
+    decoder = JSONArrayStreamDecoder("medicines")
+    first = json.dumps(MEDICINES[0])
+    assert decoder.feed('{"medicines": [' + first[:-1]) == []
+    assert decoder.feed(first[-1] + ", ") == [MEDICINES[0]]
+
+
+def test_quotes_and_braces_inside_strings():
+    decoder = JSONArrayStreamDecoder("medicines")
+    # Split right after an escaped quote and inside the brace/bracket text
+    text = json.dumps({"medicines": MEDICINES[1:]})
+    cut = text.index('\\"') + 2
+    assert feed_all(decoder, [text[:cut], text[cut:cut + 5], text[cut + 5:]]) == MEDICINES[1:]
+
+
+def test_truncated_final_element():
+    decoder = JSONArrayStreamDecoder("medicines")
+    text = json.dumps({"medicines": MEDICINES})
+    truncated = text[:text.rindex('"night"')]
+    assert feed_all(decoder, [truncated]) == MEDICINES[:2]
+    assert not decoder.done
+
+
+def test_ignores_text_after_the_array():
+    decoder = JSONArrayStreamDecoder("medicines")
+    text = json.dumps({"medicines": MEDICINES[:1], "notes": [{"medicine_name": "not a medicine"}]})
+    assert feed_all(decoder, [text]) == MEDICINES[:1]
+    assert decoder.done
+    assert decoder.feed('{"medicine_name": "late"}') == []
@@ -0,0 +1,118 @@
+"""
+LLM admission control: the priority gate lets interactive requests ahead of
+queued background ones, and the per-process token bucket (used while Redis
+is down) refills at its configured per-minute rate.
+
+Usage:
+  python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prescription.llm as llm_module
+from prescription.llm import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PriorityGate, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+
+    async def get_redis():
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(llm_module, "get_redis", get_redis)
+    monkeypatch.setattr(llm_module.time, "time", clock)
+    return clock
+
+
+def test_gate_admits_high_priority_waiters_first():
+    gate = PriorityGate()
+    order = []
+
+    async def request(name: str, priority: int):
+        async with gate.hold(priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def run():
+        async with gate.hold(PRIORITY_BACKGROUND):
+            # Queue up while the gate is held: background first, interactive later
+            tasks = [asyncio.create_task(request("background-1", PRIORITY_BACKGROUND))]
+            tasks.append(asyncio.create_task(request("background-2", PRIORITY_BACKGROUND)))
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(request("interactive-1", PRIORITY_INTERACTIVE)))
+            tasks.append(asyncio.create_task(request("interactive-2", PRIORITY_INTERACTIVE)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive-1", "interactive-2", "background-1", "background-2"]
+
+
+def test_gate_passes_on_when_a_waiter_is_cancelled():
+    gate = PriorityGate()
+    order = []
+
+    async def request(name: str, priority: int):
+        async with gate.hold(priority):
+            order.append(name)
+
+    async def run():
+        async with gate.hold(PRIORITY_BACKGROUND):
+            cancelled = asyncio.create_task(request("cancelled", PRIORITY_INTERACTIVE))
+            waiting = asyncio.create_task(request("waiting", PRIORITY_BACKGROUND))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+        await waiting
+
+    asyncio.run(run())
+    assert order == ["waiting"]
+
+
+def test_memory_bucket_refills_at_configured_rate(clock):
+    bucket = TokenBucket("test", rpm=60, tpm=0)
+
+    async def run():
+        waits = [await bucket.try_acquire(0) for _ in range(60)]
+        assert waits == [0.0] * 60
+        # Empty: 60 requests per minute is one per second
+        assert await bucket.try_acquire(0) == pytest.approx(1.0)
+        clock.now += 0.5
+        assert await bucket.try_acquire(0) == pytest.approx(0.5)
+        clock.now += 0.5
+        assert await bucket.try_acquire(0) == 0.0
+        clock.now += 10
+        return [await bucket.try_acquire(0) for _ in range(11)]
+
+    waits = asyncio.run(run())
+    assert waits[:10] == [0.0] * 10
+    assert waits[10] == pytest.approx(1.0)
+    assert bucket._use_memory()
+
+
+def test_memory_bucket_limits_tokens_per_minute(clock):
+    bucket = TokenBucket("test", rpm=0, tpm=6000)
+
+    async def run():
+        assert await bucket.try_acquire(5000) == 0.0
+        # 1000 tokens left, 100 tokens refill per second
+        assert await bucket.try_acquire(2000) == pytest.approx(10.0)
+        clock.now += 10
+        return await bucket.try_acquire(2000)
+
+    assert asyncio.run(run()) == 0.0
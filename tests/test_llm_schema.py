@@ -0,0 +1,100 @@
+"""
+Local repair of LLM JSON answers: truncated documents are cut after their
+last complete object and closed, and answers that still don't fit the schema
+are counted as failed, not repaired.
+
+Usage:
+  python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.llm_schema import LLM_JSON_RESULTS, _close_truncated, load_llm_json, parse_json_lenient
+
+DOLO = '{"medicine_name": "Dolo", "timings": ["morning", "night"]}'
+DOLO_ONLY = '{"medicines": [' + DOLO + ']}'
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Inside a string
+    ('{"medicines": [' + DOLO + ', {"medicine_name": "Pa', DOLO_ONLY),
+    ('{"medicines": [' + DOLO + ', {"medicine_name": "Pan \\"D', DOLO_ONLY),
+    # After a key, a colon or a comma
+    ('{"medicines": [' + DOLO + ', {"medicine_name"', DOLO_ONLY),
+    ('{"medicines": [' + DOLO + ', {"medicine_name": ', DOLO_ONLY),
+    ('{"medicines": [' + DOLO + ',', DOLO_ONLY),
+    ('{"medicines": [' + DOLO + ', {"medicine_name": "Pan",', DOLO_ONLY),
+    # Nested arrays
+    ('{"medicines": [' + DOLO + ', {"medicine_name": "Pan", "timings": ["mor', DOLO_ONLY),
+    ('{"a": [[{"x": 1}, {"y": [2', '{"a": [[{"x": 1}]]}'),
+    # Complete document with chatter after it
+    ('[{"a": 1}] hope this helps', '[{"a": 1}]'),
+    # Nothing complete to keep, or brackets that don't match
+    ('{"medicines": [{"medicine_name": "Dolo", "timings": ["morn', None),
+    ('{"a": "x \\" } ] still a string', None),
+    ('{"a": ]', None),
+])
+def test_close_truncated(text, expected):
+    assert _close_truncated(text) == expected
+
+
+@pytest.mark.parametrize("content, expected, repaired", [
+    ('{"a": 1}', {"a": 1}, False),
+    ('```json\n{"a": 1}\n```', {"a": 1}, True),
+    ('Here you go: {"a": [1, 2,],} Thanks!', {"a": [1, 2]}, True),
+    ('{"medicines": [' + DOLO + ', {"medicine_name": "Pa', {"medicines": [
+        {"medicine_name": "Dolo", "timings": ["morning", "night"]}
+    ]}, True),
+    ('```json\n{"medicines": [' + DOLO + ',', {"medicines": [
+        {"medicine_name": "Dolo", "timings": ["morning", "night"]}
+    ]}, True),
+])
+def test_parse_json_lenient(content, expected, repaired):
+    assert parse_json_lenient(content) == (expected, repaired)
+
+
+@pytest.mark.parametrize("content", ["", "   ", "no JSON here", '{"medicines": [{"medicine_name": "Do'])
+def test_parse_json_lenient_gives_up(content):
+    with pytest.raises(ValueError):
+        parse_json_lenient(content)
+
+
+def outcome_counts(schema: str) -> dict:
+    return {outcome: LLM_JSON_RESULTS.value(schema=schema, outcome=outcome) for outcome in ("valid", "repaired", "failed")}
+
+
+@pytest.mark.parametrize("content, outcome", [
+    ('{"medicines": [{"medicine_name": "Dolo", "dosage": "650mg", "frequency": "thrice a day", '
+     '"timings": ["morning", "afternoon", "evening"]}]}', "valid"),
+    ('{"medicines": [{"medicine_name": "Dolo", "frequency": "TDS"}]}', "repaired"),
+    ('{"medicines": [' + DOLO + ', {"medicine_name": "Pa', "repaired"),
+])
+def test_load_llm_json_outcomes(content, outcome):
+    before = outcome_counts("parse")
+    load_llm_json(content, "parse")
+    after = outcome_counts("parse")
+    assert {key: after[key] - before[key] for key in after} == {
+        key: 1 if key == outcome else 0 for key in after
+    }
+
+
+@pytest.mark.parametrize("content", [
+    # Decodes (after a repair) but doesn't fit the schema
+    '```json\n{"medicines": 5,}\n```',
+    '{"medicine_list": [' + DOLO + '],}',
+    '{"dosage": "5mg"',
+    "not json",
+])
+def test_schema_failure_counts_as_failed(content):
+    before = outcome_counts("parse")
+    with pytest.raises(ValueError):
+        load_llm_json(content, "parse")
+    after = outcome_counts("parse")
+    assert after["failed"] - before["failed"] == 1
+    assert after["repaired"] == before["repaired"]
+    assert after["valid"] == before["valid"]
@@ -0,0 +1,135 @@
+"""
+Frequency phrases in the rule helpers: daily schedules map to the standard
+vocabulary, anything weekly/monthly/every-N-days must not become a daily one.
+Dose patterns keep their per-dose counts, and one unread line keeps the whole
+text away from the rule route. OCR compaction never drops a medicine's own
+instruction line as a repeat.
+
+Usage:
+  python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription.rules import (
+    RULE_PARSER_MIN_CONFIDENCE,
+    compact_ocr_text,
+    complete_from_rules,
+    frequency_timings,
+    medicine_schema_errors,
+    parse_medicine_line,
+    parse_prescription_rules,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("once a day", "once a day"),
+    ("once daily", "once a day"),
+    ("daily", "once a day"),
+    ("every day", "once a day"),
+    ("twice a day", "twice a day"),
+    ("twice daily", "twice a day"),
+    ("2 times/day", "twice a day"),
+    ("BD", "twice a day"),
+    ("1-0-1", "twice a day"),
+    ("3 times a day", "thrice a day"),
+    ("every 8 hours", "thrice a day"),
+    ("4 times per day", "four times a day"),
+    ("twice a day for 2 weeks", "twice a day"),
+    ("once a day x 1 month", "once a day"),
+])
+def test_daily_phrases(text, expected):
+    assert frequency_timings(text)[0] == expected
+
+
+def test_once_at_night():
+    assert frequency_timings("once at night") == ("once a day", ["night"])
+
+
+@pytest.mark.parametrize("text", [
+    "once a week",
+    "once weekly",
+    "twice a week",
+    "twice weekly",
+    "3 times a week",
+    "once a month",
+    "once every 2 days",
+    "once in 15 days",
+    "every other day",
+    "alternate days",
+    "every 48 hours",
+    "twice an hour",
+    "as needed",
+])
+def test_non_daily_phrases(text):
+    assert frequency_timings(text) == (None, [])
+
+
+def test_weekly_medicine_gets_no_daily_timings():
+    medicine = {"medicine_name": "Methotrexate", "dosage": "7.5mg", "frequency": "once a week", "timings": []}
+    assert complete_from_rules(medicine) == (medicine, [])
+
+
+def test_weekly_medicine_fails_schema_check():
+    medicine = {"medicine_name": "Methotrexate", "dosage": "7.5mg", "frequency": "once a week", "timings": ["morning"]}
+    assert medicine_schema_errors(medicine) == ["frequency"]
+
+
+@pytest.mark.parametrize("line, dosage, frequency, timings", [
+    ("TAB PAN 40mg 1/2-0-1/2", "1/2 x 40mg", "twice a day", ["morning", "night"]),
+    ("TAB PAN 40mg ½-0-½", "1/2 x 40mg", "twice a day", ["morning", "night"]),
+    ("TAB ALLEGRA 120mg 1/2-1/2-0", "1/2 x 120mg", "twice a day", ["morning", "afternoon"]),
+    ("TAB LASIX 40mg 2-0-0", "2 x 40mg", "once a day", ["morning"]),
+    ("CAP OMEZ 2-0-0", "2 capsules", "once a day", ["morning"]),
+    ("TAB PAN 40mg 1-0-1", "40mg", "twice a day", ["morning", "night"]),
+])
+def test_dose_pattern_counts(line, dosage, frequency, timings):
+    medicine, score = parse_medicine_line(line)
+    assert (medicine["dosage"], medicine["frequency"], medicine["timings"]) == (dosage, frequency, timings)
+    assert score >= RULE_PARSER_MIN_CONFIDENCE
+
+
+def test_dose_pattern_does_not_start_inside_fraction():
+    # "2-0-1" inside "1/2-0-1/2" would be two tablets in the morning
+    medicine, _ = parse_medicine_line("TAB PAN 40mg 1/2-0-1/2")
+    assert medicine["timings"] == ["morning", "night"]
+    assert frequency_timings("1/2-0-1/2") == ("twice a day", ["morning", "night"])
+
+
+@pytest.mark.parametrize("line", [
+    "TAB EPTOIN 100mg 1-1/2-1",
+    "TAB DOLO 650mg 1-l/2-1",
+    "TAB DOLO 650mg",
+])
+def test_one_unread_line_sends_text_to_llm(line):
+    text = f"Rx\nTAB PAN 40mg 1-0-0\n{line}\nTAB DOLO 650mg TDS\nTAB ZYRTEC 10mg HS"
+    medicines, confidence = parse_prescription_rules(text)
+    assert len(medicines) == 4
+    assert confidence < RULE_PARSER_MIN_CONFIDENCE
+
+
+SHARED_DOSE_LINE = (
+    "Dr. Rao Clinic\nPh: 9876543210\n"
+    "TAB DOLO 650mg\n1-0-1 x 5 days\n"
+    "TAB PAN 40mg\n1-0-1 x 5 days\n"
+    "Ph: 9876543210"
+)
+
+
+def test_compaction_keeps_repeats_under_budget():
+    assert compact_ocr_text(SHARED_DOSE_LINE) == SHARED_DOSE_LINE
+
+
+def test_compaction_keeps_shared_dose_line_over_budget():
+    compacted = compact_ocr_text(SHARED_DOSE_LINE, max_tokens=22)
+    assert compacted.split("\n") == ["TAB DOLO 650mg", "1-0-1 x 5 days", "TAB PAN 40mg", "1-0-1 x 5 days"]
+
+
+def test_compaction_drops_repeated_noise_first():
+    text = "Ph: 9876543210\nTAB DOLO 650mg TDS\nPh: 9876543210"
+    assert compact_ocr_text(text, max_tokens=13).split("\n") == ["Ph: 9876543210", "TAB DOLO 650mg TDS"]